@@ -16,10 +16,102 @@
 # <http://www.gnu.org/licenses/>.
 
 import urllib
-import urllib2
+import zlib
+import json
+import httplib
 from django.http import HttpResponse
+from django.http import HttpResponseNotModified
+from django.http import StreamingHttpResponse
 import hatoholserver
 import hatohol_def
+import httpclient
+import sessioncache
+import tunnelcache
+import singleflight
+
+FORM_CONTENT_TYPE = 'application/x-www-form-urlencoded'
+
+# Hop-by-hop headers and ones given by the front web server are not
+# relayed to the browser. Content-Type is relayed by the constructor.
+UNFORWARDED_HEADERS = frozenset([
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailers', 'transfer-encoding', 'upgrade',
+    'content-type', 'server', 'date'])
+
+# Responses smaller than this are not compressed.
+GZIP_MIN_SIZE = 1024
+NO_BODY_STATUSES = (204, 304)
+
+# GET requests for these paths are polled by every dashboard. Concurrent
+# identical requests of a user share one request to the server. Their
+# responses are read to the end instead of being streamed, so large
+# responses such as events are not coalesced.
+COALESCED_PATHS = frozenset(['overview', 'trigger'])
+
+# A user ID cached for the session is discarded when it is forwarded.
+LOGOUT_PATH = 'logout'
+
+
+def accepts_gzip(accept_encoding):
+    """
+    Args:
+        accept_encoding: A value of the Accept-Encoding header.
+
+    Returns:
+        True if gzip is acceptable.
+    """
+    acceptable = {}
+    for element in accept_encoding.split(','):
+        params = element.strip().split(';')
+        coding = params[0].strip().lower()
+        quality = 1.0
+        for param in params[1:]:
+            name, sep, value = param.strip().partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        acceptable[coding] = quality > 0
+    if 'gzip' in acceptable:
+        return acceptable['gzip']
+    return acceptable.get('*', False)
+
+
+class GzipStream(object):
+    """
+    Compress chunks of a streaming response with gzip. Each chunk is
+    flushed so that the browser can decode the data received so far.
+    """
+
+    def __init__(self, content):
+        self._content = content
+
+    def __iter__(self):
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION,
+                                      zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in self._content:
+            data = compressor.compress(chunk) + \
+                compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+
+    def close(self):
+        self._content.close()
+
+
+def should_compress(request, content):
+    if content.status in NO_BODY_STATUSES:
+        return False
+    if content.getheader('Content-Encoding'):
+        return False
+    if not accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+        return False
+    length = content.getheader('Content-Length')
+    if length is not None and int(length) < GZIP_MIN_SIZE:
+        return False
+    return True
 
 
 def utf8_dict(src_dict):
@@ -33,35 +125,176 @@ def utf8_dict(src_dict):
     return dest_dict
 
 
-def jsonforward(request, path):
-    server = hatoholserver.get_address()
-    port = hatoholserver.get_port()
-    url = 'http://%s:%d/%s' % (server, port, path)
-    hdrs = {}
-    if hatoholserver.SESSION_NAME_META in request.META:
-        hdrs = {hatohol_def.FACE_REST_SESSION_ID_HEADER_NAME:
-                request.META[hatoholserver.SESSION_NAME_META]}
-    if request.method == 'POST':
-        encoded_query = urllib.urlencode(utf8_dict(request.POST))
-        req = urllib2.Request(url, encoded_query, headers=hdrs)
-    elif request.method == 'PUT':
-        req = urllib2.Request(url, request.read(), headers=hdrs)
-        req.get_method = lambda: 'PUT'
-    elif request.method == 'DELETE':
-        req = urllib2.Request(url, headers=hdrs)
-        req.get_method = lambda: 'DELETE'
-    else:
-        encoded_query = urllib.urlencode(utf8_dict(request.GET))
-        url += '?' + encoded_query
-        req = urllib2.Request(url, headers=hdrs)
-    try:
-        content = urllib2.urlopen(req)
-
-        response = HttpResponse(content, content_type='application/json')
-    except urllib2.URLError, e:
-        response = HttpResponse(e.read(), content_type='application/json', status=e.code)
-
+def set_no_cache_headers(response):
     response['Pragma'] = 'no-cache'
     response['Cache-Control'] = 'no-cache'
     response['Expires'] = 'Thu, 01 Jan 1970 00:00:00 GMT'
+
+
+def is_cacheable_response(content):
+    if content.status != httplib.OK:
+        return False
+    try:
+        reply = json.loads(content.body)
+    except ValueError:
+        return False
+    return reply.get('errorCode') == hatohol_def.HTERR_OK
+
+
+def get_requester(session_id):
+    """
+    Identify who sends the request to coalesce it with the requests of
+    the same user. The server returns the same data to them because it
+    filters the data by the user. The user ID is used only when it is
+    found in the session cache not to ask the server for it on every
+    request.
+
+    Returns:
+        A tuple of 'user' and the user ID. If it is unknown, a tuple of
+        'session' and the session ID.
+    """
+    if session_id is not None:
+        found, user_id = sessioncache.get_cache().get(session_id)
+        if found and user_id is not None:
+            return ('user', user_id)
+    return ('session', session_id)
+
+
+def forward_cacheable(request, path, url, hdrs, session_id, query):
+    """
+    Forward a GET request for a path whose responses are cached. The
+    browser stores the response with the ETag and asks whether it has been
+    modified next time. The answer comes from the cache while the entry is
+    alive.
+    """
+    cache = tunnelcache.get_cache()
+    entry = cache.get(path, query, session_id)
+    if entry is None:
+        generation = cache.get_generation()
+        key = ('cacheable', path, get_requester(session_id),
+               tuple(sorted(query)))
+        content = singleflight.get_group().do(
+            key, lambda: httpclient.get_pool().request('GET', url,
+                                                      headers=hdrs))
+        content_type = content.getheader('Content-Type', 'application/json')
+        if not is_cacheable_response(content):
+            response = HttpResponse(content.body, status=content.status,
+                                    content_type=content_type)
+            set_no_cache_headers(response)
+            return response
+        entry = cache.put(path, query, session_id, content.body,
+                          content_type, generation)
+
+    if entry.matches(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponseNotModified()
+    elif len(entry.body) >= GZIP_MIN_SIZE and \
+            accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+        response = HttpResponse(entry.get_gzipped_body(),
+                                content_type=entry.content_type)
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(entry.body, content_type=entry.content_type)
+    response['ETag'] = entry.etag
+    response['Vary'] = 'Accept-Encoding'
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def fetch_compressed(url, hdrs):
+    """
+    Get a whole response. It is compressed with gzip unless the server has
+    compressed it.
+    """
+    hdrs = dict(hdrs)
+    hdrs['Accept-Encoding'] = 'gzip'
+    content = httpclient.get_pool().request('GET', url, headers=hdrs)
+    if content.status in NO_BODY_STATUSES or \
+       content.getheader('Content-Encoding') or \
+       len(content.body) < GZIP_MIN_SIZE:
+        return content
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION,
+                                  zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    body = compressor.compress(content.body) + compressor.flush()
+    headers = [(name, value) for name, value in content.headers
+               if name.lower() != 'content-length']
+    headers.append(('Content-Encoding', 'gzip'))
+    return httpclient.Response(content.status, content.reason, headers,
+                               body)
+
+
+def forward_coalesced(request, path, url, hdrs, session_id, query):
+    """
+    Forward a GET request sharing the response with concurrent identical
+    requests of the same user in the process.
+    """
+    gzip = accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    key = ('coalesced', path, get_requester(session_id),
+           tuple(sorted(query)), gzip)
+    if gzip:
+        func = lambda: fetch_compressed(url, hdrs)
+    else:
+        func = lambda: httpclient.get_pool().request('GET', url,
+                                                     headers=hdrs)
+    content = singleflight.get_group().do(key, func)
+    response = HttpResponse(
+        content.body, status=content.status,
+        content_type=content.getheader('Content-Type', 'application/json'))
+    for name, value in content.headers:
+        if name.lower() not in UNFORWARDED_HEADERS:
+            response[name] = value
+    response['Vary'] = 'Accept-Encoding'
+    set_no_cache_headers(response)
+    return response
+
+
+def jsonforward(request, path):
+    url = '/' + path
+    hdrs = {}
+    session_id = request.META.get(hatoholserver.SESSION_NAME_META)
+    if session_id is not None:
+        hdrs = {hatohol_def.FACE_REST_SESSION_ID_HEADER_NAME: session_id}
+    method = request.method
+    body = None
+    if method == 'POST':
+        body = urllib.urlencode(utf8_dict(request.POST))
+        hdrs['Content-Type'] = FORM_CONTENT_TYPE
+    elif method == 'PUT':
+        body = request.read()
+        hdrs['Content-Type'] = FORM_CONTENT_TYPE
+    elif method != 'DELETE':
+        method = 'GET'
+        query = utf8_dict(request.GET)
+        url += '?' + urllib.urlencode(query)
+        if tunnelcache.get_cache().is_cacheable(path):
+            return forward_cacheable(request, path, url, hdrs, session_id,
+                                     query.items())
+        if path in COALESCED_PATHS:
+            return forward_coalesced(request, path, url, hdrs, session_id,
+                                     query.items())
+    if accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+        # The server's compression is passed through when it is available.
+        hdrs['Accept-Encoding'] = 'gzip'
+    content = httpclient.get_pool().stream(method, url, body, hdrs)
+    if path == LOGOUT_PATH and session_id is not None:
+        sessioncache.get_cache().invalidate(session_id)
+        tunnelcache.get_cache().invalidate_session(session_id)
+    elif method != 'GET':
+        # Any change can affect the cached responses, e.g. privileges of
+        # users. Writes are rare enough to discard all of them.
+        tunnelcache.get_cache().clear()
+    compress = should_compress(request, content)
+    streaming_content = content
+    if compress:
+        streaming_content = GzipStream(content)
+    response = StreamingHttpResponse(
+        streaming_content, status=content.status,
+        content_type=content.getheader('Content-Type', 'application/json'))
+    for name, value in content.headers:
+        if name.lower() not in UNFORWARDED_HEADERS:
+            response[name] = value
+    if compress:
+        del response['Content-Length']
+        response['Content-Encoding'] = 'gzip'
+    response['Vary'] = 'Accept-Encoding'
+    set_no_cache_headers(response)
     return response
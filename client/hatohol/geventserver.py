@@ -0,0 +1,176 @@
+# Copyright (C) 2015 Project Hatohol
+#
+# This file is part of Hatohol.
+#
+# Hatohol is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License, version 3
+# as published by the Free Software Foundation.
+#
+# Hatohol is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with Hatohol. If not, see
+# <http://www.gnu.org/licenses/>.
+
+"""
+Serve Hatohol Client with gevent.
+
+Each request runs in a greenlet. Sockets are patched to be cooperative,
+so that a request waiting for the Hatohol server in the tunnel or in the
+session check of userconfig doesn't block the others. Many requests
+can be in flight in one process. The views are the same as the
+ones served by a WSGI server.
+
+MySQLdb is not patched. A query of the views using the database, such as
+/userconfig and graphs, blocks the whole process until it returns. Each
+greenlet also opens its own database connection. So the number of
+requests other than the tunnel handled at once (--max-db-requests) has
+to be smaller than max_connections of MySQL. Requests through the tunnel
+don't use the database and are limited only by --max-requests.
+
+Usage (in the client directory):
+
+    $ python -m hatohol.geventserver --address 0.0.0.0 --port 8000
+"""
+
+if __name__ == '__main__':
+    # Standard modules have to be patched before anything uses them.
+    try:
+        from gevent import monkey
+        monkey.patch_all()
+    except ImportError:
+        import sys
+        sys.exit('gevent is required to run this server.')
+
+import os
+import logging
+from optparse import OptionParser
+
+DEFAULT_ADDRESS = '127.0.0.1'
+DEFAULT_PORT = 8000
+DEFAULT_MAX_REQUESTS = 1000
+DEFAULT_MAX_DB_REQUESTS = 50
+
+# Requests for these paths don't use the database.
+TUNNEL_PATH_PREFIX = '/tunnel/'
+
+logger = logging.getLogger(__name__)
+
+
+class _ReleasingIterable(object):
+    """
+    Pass a response through and call release() after it is closed.
+    """
+
+    def __init__(self, result, release):
+        self._result = result
+        self._release = release
+
+    def __iter__(self):
+        return iter(self._result)
+
+    def close(self):
+        try:
+            if hasattr(self._result, 'close'):
+                self._result.close()
+        finally:
+            release = self._release
+            self._release = None
+            if release is not None:
+                release()
+
+
+class DatabaseRequestLimiter(object):
+    """
+    A WSGI middleware that limits the number of requests handled at once
+    except the ones through the tunnel. Other requests wait for a
+    semaphore in their greenlets. The semaphore is released after the
+    response is closed, that is, after Django closes the database
+    connection of the request.
+    """
+
+    def __init__(self, application, max_requests):
+        """
+        Args:
+            application: A WSGI application.
+            max_requests: The maximum number of requests except the ones
+                through the tunnel handled at once.
+        """
+        from gevent.lock import BoundedSemaphore
+
+        self._application = application
+        self._semaphore = BoundedSemaphore(max_requests)
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO', '').startswith(TUNNEL_PATH_PREFIX):
+            return self._application(environ, start_response)
+        self._semaphore.acquire()
+        try:
+            result = self._application(environ, start_response)
+        except:
+            self._semaphore.release()
+            raise
+        return _ReleasingIterable(result, self._semaphore.release)
+
+
+def create_server(address, port, max_requests=DEFAULT_MAX_REQUESTS,
+                  max_db_requests=DEFAULT_MAX_DB_REQUESTS, application=None):
+    """
+    Args:
+        address: An address to listen on.
+        port: A port number to listen on.
+        max_requests: The maximum number of requests handled at once.
+            More requests wait for accept().
+        max_db_requests: The maximum number of requests except the ones
+            through the tunnel handled at once. It has to be smaller than
+            max_connections of MySQL.
+        application: A WSGI application. If it is None, the Django
+            application of Hatohol Client is used.
+
+    Returns:
+        A gevent.pywsgi.WSGIServer object. It is not started yet.
+    """
+    from gevent.pool import Pool
+    from gevent.pywsgi import WSGIServer
+
+    if application is None:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hatohol.settings')
+        from django.core.wsgi import get_wsgi_application
+        application = get_wsgi_application()
+    application = DatabaseRequestLimiter(application, max_db_requests)
+    return WSGIServer((address, port), application,
+                      spawn=Pool(max_requests), log=None)
+
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--address', default=DEFAULT_ADDRESS,
+                      help='An address to listen on. Default: %default')
+    parser.add_option('--port', type='int', default=DEFAULT_PORT,
+                      help='A port number to listen on. Default: %default')
+    parser.add_option('--max-requests', type='int',
+                      default=DEFAULT_MAX_REQUESTS,
+                      help='The maximum number of requests handled at once. '
+                           'Default: %default')
+    parser.add_option('--max-db-requests', type='int',
+                      default=DEFAULT_MAX_DB_REQUESTS,
+                      help='The maximum number of requests except the ones '
+                           'through the tunnel handled at once. '
+                           'Default: %default')
+    options, args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = create_server(options.address, options.port,
+                           options.max_requests, options.max_db_requests)
+    logger.info('Listening on %s:%d' % (options.address, options.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+# Copyright (C) 2015 Project Hatohol
+#
+# This file is part of Hatohol.
+#
+# Hatohol is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License, version 3
+# as published by the Free Software Foundation.
+#
+# Hatohol is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with Hatohol. If not, see
+# <http://www.gnu.org/licenses/>.
+
+import os
+import socket
+import httplib
+import threading
+import logging
+import hatoholserver
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 60
+DEFAULT_CHUNK_SIZE = 64 * 1024
+IDEMPOTENT_METHODS = ('GET', 'HEAD')
+
+POOL_SIZE_ENV_NAME = 'HATOHOL_SERVER_POOL_SIZE'
+TIMEOUT_ENV_NAME = 'HATOHOL_SERVER_TIMEOUT'
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class HTTPError(Exception):
+    def __init__(self, status, reason):
+        Exception.__init__(self, '%d %s' % (status, reason))
+        self.status = status
+        self.reason = reason
+
+
+class Response(object):
+    def __init__(self, status, reason, headers, body):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+    def getheader(self, name, default=None):
+        name = name.lower()
+        for key, value in self.headers:
+            if key.lower() == name:
+                return value
+        return default
+
+
+class StreamingResponse(object):
+    """
+    A response whose body is read from the connection while it is
+    iterated. The connection goes back to the pool when the body has been
+    read to the end. If the response is closed before that, the
+    connection is closed.
+    """
+
+    def __init__(self, pool, conn, response, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.getheaders()
+        self._pool = pool
+        self._conn = conn
+        self._response = response
+        self._chunk_size = chunk_size
+
+    def getheader(self, name, default=None):
+        return self._response.getheader(name, default)
+
+    def __iter__(self):
+        try:
+            while True:
+                chunk = self._response.read(self._chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            self.close()
+
+    def read(self):
+        return ''.join(self)
+
+    def close(self):
+        if self._conn is None:
+            return
+        if self._response.isclosed() and not self._response.will_close:
+            self._pool._put_connection(self._conn)
+        else:
+            self._conn.close()
+        self._conn = None
+
+
+class ConnectionPool(object):
+    """
+    A thread-safe pool of HTTP/1.1 keep-alive connections to a server.
+    A connection is taken from the pool for each request and returned
+    after the response is read.
+    """
+
+    def __init__(self, host, port, max_size=DEFAULT_POOL_SIZE,
+                 timeout=DEFAULT_TIMEOUT):
+        """
+        Args:
+            host: A host name of the server.
+            port: A port number of the server.
+            max_size: The maximum number of idle connections kept in the
+                pool. More connections are opened when needed, but they
+                are closed after use.
+            timeout: A timeout of connecting and receiving in seconds.
+        """
+        self._host = host
+        self._port = port
+        self._max_size = max_size
+        self._timeout = timeout
+        self._idle_connections = []
+        self._lock = threading.Lock()
+
+    def get_num_idle_connections(self):
+        with self._lock:
+            return len(self._idle_connections)
+
+    def request(self, method, url, body=None, headers=None):
+        """
+        Send a request and read the response.
+
+        Args:
+            method: An HTTP method such as 'GET'.
+            url: A path with a query string.
+            body: A request body or None.
+            headers: A dictionary of request headers or None.
+
+        Returns:
+            A Response object. Statuses other than 2xx are also returned
+            as they are.
+        """
+        response = self.stream(method, url, body, headers)
+        body = response.read()
+        return Response(response.status, response.reason, response.headers,
+                        body)
+
+    def stream(self, method, url, body=None, headers=None,
+               chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Send a request and receive the status and the headers of the
+        response. The arguments are the same as request().
+
+        Args:
+            chunk_size: The maximum size of a chunk of the body.
+
+        Returns:
+            A StreamingResponse object. The caller has to iterate it to the
+            end or close it.
+        """
+        if headers is None:
+            headers = {}
+        conn, reused = self._get_connection()
+        sent = False
+        try:
+            conn.request(method, url, body, headers)
+            sent = True
+            response = conn.getresponse()
+        except (socket.error, httplib.HTTPException) as e:
+            conn.close()
+            if not reused or not self._can_retry(method, sent, e):
+                raise
+            # The server may have closed the idle connection.
+            logger.debug('Retry with a new connection: %s %s' %
+                         (method, url))
+            conn = self._create_connection()
+            try:
+                response = self._send(conn, method, url, body, headers)
+            except:
+                conn.close()
+                raise
+        except:
+            conn.close()
+            raise
+        return StreamingResponse(self, conn, response, chunk_size)
+
+    def clear(self):
+        with self._lock:
+            connections = self._idle_connections
+            self._idle_connections = []
+        for conn in connections:
+            conn.close()
+
+    def _create_connection(self):
+        return httplib.HTTPConnection(self._host, self._port,
+                                      timeout=self._timeout)
+
+    def _get_connection(self):
+        with self._lock:
+            if self._idle_connections:
+                return self._idle_connections.pop(), True
+        return self._create_connection(), False
+
+    def _put_connection(self, conn):
+        with self._lock:
+            if len(self._idle_connections) < self._max_size:
+                self._idle_connections.append(conn)
+                return
+        conn.close()
+
+    def _can_retry(self, method, sent, error):
+        # A timeout doesn't mean that the connection was stale. The server
+        # may be still processing the request.
+        if isinstance(error, socket.timeout):
+            return False
+        # The server can't have received a request that wasn't sent
+        # completely. Otherwise it may have applied the request, so only
+        # an idempotent one is sent again.
+        return not sent or method in IDEMPOTENT_METHODS
+
+    def _send(self, conn, method, url, body, headers):
+        conn.request(method, url, body, headers)
+        return conn.getresponse()
+
+
+def _get_env_int(name, default):
+    value = os.getenv(name)
+    if not value:
+        return default
+    return int(value)
+
+
+def get_pool():
+    """
+    Returns:
+        A ConnectionPool object to the Hatohol server shared in the process.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(
+                hatoholserver.get_address(), hatoholserver.get_port(),
+                _get_env_int(POOL_SIZE_ENV_NAME, DEFAULT_POOL_SIZE),
+                _get_env_int(TIMEOUT_ENV_NAME, DEFAULT_TIMEOUT))
+        return _pool
+
+
+def reset_pool():
+    """
+    Close the shared pool. The next get_pool() creates a new one with the
+    current settings.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.clear()
+        _pool = None
@@ -0,0 +1,81 @@
+# Copyright (C) 2015 Project Hatohol
+#
+# This file is part of Hatohol.
+#
+# Hatohol is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License, version 3
+# as published by the Free Software Foundation.
+#
+# Hatohol is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with Hatohol. If not, see
+# <http://www.gnu.org/licenses/>.
+
+import time
+import base64
+import cPickle
+from optparse import make_option
+from django.core.management.base import BaseCommand
+from hatohol.models import UserConfig
+from hatohol import smartfield
+
+DEFAULT_NUM_VALUES = 10000
+
+
+def _encode_legacy(value):
+    return base64.b64encode(cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL))
+
+
+def _create_values(num_values):
+    values = []
+    for i in range(num_values):
+        values.append({
+            'name': 'graph%d' % i,
+            'hosts': [{'serverId': i % 10, 'hostId': str(i)}],
+            'period': 3600,
+            'visible': True,
+        })
+    return values
+
+
+class Command(BaseCommand):
+    help = 'Compare the costs of the legacy and the current formats of ' \
+           'SmartField. The database is not used.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--num-values', type='int', default=DEFAULT_NUM_VALUES,
+                    help='The number of values. Default: %d' %
+                         DEFAULT_NUM_VALUES),
+    )
+
+    def handle(self, *args, **options):
+        values = _create_values(options['num_values'])
+        legacy_data = [_encode_legacy(value) for value in values]
+        data = [smartfield.encode(value) for value in values]
+
+        self._report('write: legacy', lambda: map(_encode_legacy, values))
+        self._report('write: current', lambda: map(smartfield.encode, values))
+        self._report('read: legacy', lambda: map(smartfield.decode,
+                                                 legacy_data))
+        self._report('read: current', lambda: map(smartfield.decode, data))
+        # A model object is created in the same way as when it is loaded
+        # from the database.
+        self._report('load without access',
+                     lambda: [UserConfig(i, 'item', 1, d)
+                              for i, d in enumerate(data)])
+        self._report('load and access',
+                     lambda: [UserConfig(i, 'item', 1, d).value
+                              for i, d in enumerate(data)])
+        self.stdout.write('%-24s %8d / %8d bytes\n' % (
+            'size: legacy / current', sum(map(len, legacy_data)),
+            sum(map(len, data))))
+
+    def _report(self, label, func):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        self.stdout.write('%-24s %8.3f sec\n' % (label, elapsed))
@@ -0,0 +1,61 @@
+# Copyright (C) 2015 Project Hatohol
+#
+# This file is part of Hatohol.
+#
+# Hatohol is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License, version 3
+# as published by the Free Software Foundation.
+#
+# Hatohol is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with Hatohol. If not, see
+# <http://www.gnu.org/licenses/>.
+
+from optparse import make_option
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from hatohol.models import UserConfig
+from hatohol import smartfield
+
+DEFAULT_BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Convert user configurations stored in the legacy format ' \
+           '(Base64 + pickle) to the current format.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', type='int', default=DEFAULT_BATCH_SIZE,
+                    help='The number of records converted in a '
+                         'transaction. Default: %d' % DEFAULT_BATCH_SIZE),
+    )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        num_converted = 0
+        while True:
+            # values_list() returns the data in the database as it is.
+            rows = list(UserConfig.objects.filter(
+                id__gt=last_id
+            ).order_by('id').values_list('id', 'value')[:batch_size])
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            num_converted += self._convert(rows)
+        self.stdout.write('Converted %d records.\n' % num_converted)
+
+    @transaction.commit_on_success
+    def _convert(self, rows):
+        num_converted = 0
+        for id, data in rows:
+            if not smartfield.is_legacy_format(data):
+                continue
+            value = smartfield.decode(data)
+            UserConfig.objects.filter(id=id).update(value=value)
+            num_converted += 1
+        return num_converted
@@ -19,6 +19,7 @@ from django.db import models
 from django.db import transaction
 from django.core.exceptions import ValidationError
 import smartfield
+import userconfigcache
 import json
 
 
@@ -70,18 +71,41 @@ class UserConfig(models.Model):
             If the matched item exists, it is returned. Otherwise, None is
             returned.
         """
-        obj = cls.get_object(item_name, user_id)
-        if obj is None:
-            return None
-        return obj.value
+        return cls.get_items([item_name], user_id)[item_name]
 
     @classmethod
-    @transaction.commit_on_success
     def get_items(cls, item_name_list, user_id):
-        items = {}
-        for item_name in item_name_list:
-            value = cls.get(item_name, user_id)
-            items[item_name] = value
+        """Get user configurations. Values in the cache of the process are
+           used if they are up to date. The others are read with one query.
+
+        Args:
+            item_name_list: A list of configuration items
+            user_id: A user ID for the configuration
+
+        Returns:
+            A dictionary whose key is an item name. The value is None for
+            the item that doesn't exist. The values may be shared with other
+            callers, so they must not be modified.
+        """
+        cache = userconfigcache.get_cache()
+        version = cache.get_version(user_id)
+        items, missing = cache.get_items(item_name_list, user_id, version)
+        if missing:
+            loaded_items = cls._load_items(missing, user_id)
+            cache.put_items(loaded_items, user_id, version)
+            items.update(loaded_items)
+        return items
+
+    @classmethod
+    @transaction.commit_on_success
+    def _load_items(cls, item_name_list, user_id):
+        items = dict([(item_name, None) for item_name in item_name_list])
+        objs = UserConfig.objects.filter(
+            user_id=user_id,
+            item_name__in=items.keys()
+        ).order_by('id')
+        for obj in objs:
+            items[obj.item_name] = obj.value
         return items
 
     def _store_without_transaction(self):
@@ -91,21 +115,44 @@ class UserConfig(models.Model):
         self.save()
 
     @transaction.commit_on_success
+    def _store_with_transaction(self):
+        self._store_without_transaction()
+
     def store(self):
         """Insert if the record with item_name and user_id doesn't exist.
            Otherwise update with value of the this object.
         """
-        self._store_without_transaction()
+        self._store_with_transaction()
+        userconfigcache.get_cache().invalidate(self.user_id)
 
     @classmethod
-    @transaction.commit_on_success
     def store_items(cls, items, user_id):
-        for name in items:
-            value = items[name]
-            user_conf = UserConfig(item_name=name,
-                                   user_id=user_id,
-                                   value=value)
-            user_conf._store_without_transaction()
+        """Insert or update user configurations with one DELETE and one
+           INSERT statement.
+
+        Args:
+            items: A dictionary whose key is an item name and whose value
+                is the configuration value.
+            user_id: A user ID for the configuration
+        """
+        if not items:
+            return
+        cls._store_items_with_transaction(items, user_id)
+        # Other processes must not use the old values after the commit.
+        userconfigcache.get_cache().invalidate(user_id)
+
+    @classmethod
+    @transaction.commit_on_success
+    def _store_items_with_transaction(cls, items, user_id):
+        # The table has no unique key for item_name and user_id. So the
+        # existing records are replaced instead of being updated.
+        UserConfig.objects.filter(
+            user_id=user_id,
+            item_name__in=items.keys()
+        ).delete()
+        UserConfig.objects.bulk_create(
+            [UserConfig(item_name=name, user_id=user_id, value=value)
+             for name, value in items.iteritems()])
 
 
 class LogSearchSystem(models.Model):
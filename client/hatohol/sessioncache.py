@@ -0,0 +1,237 @@
+# Copyright (C) 2015 Project Hatohol
+#
+# This file is part of Hatohol.
+#
+# Hatohol is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License, version 3
+# as published by the Free Software Foundation.
+#
+# Hatohol is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with Hatohol. If not, see
+# <http://www.gnu.org/licenses/>.
+
+import os
+import stat
+import time
+import errno
+import hashlib
+import tempfile
+import threading
+import logging
+
+DEFAULT_TTL = 10
+DEFAULT_NEGATIVE_TTL = 3
+SWEEP_INTERVAL = 60
+ENTRY_SUFFIX = '.session'
+
+DIR_ENV_NAME = 'HATOHOL_SESSION_CACHE_DIR'
+TTL_ENV_NAME = 'HATOHOL_SESSION_CACHE_TTL'
+NEGATIVE_TTL_ENV_NAME = 'HATOHOL_SESSION_CACHE_NEGATIVE_TTL'
+
+logger = logging.getLogger(__name__)
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class SessionCache(object):
+    """
+    A cache of user IDs for session IDs shared by worker processes on the
+    same host. Each entry is a small file in a directory, so that an entry
+    stored or removed by a process is seen by the others.
+
+    A session that the server rejected is also cached for a shorter time
+    as a negative entry.
+    """
+
+    def __init__(self, directory, ttl=DEFAULT_TTL,
+                 negative_ttl=DEFAULT_NEGATIVE_TTL):
+        """
+        Args:
+            directory: A directory to store entries. It is created if it
+                doesn't exist.
+            ttl: Seconds for which a user ID is kept. 0 disables the cache.
+            negative_ttl: Seconds for which a negative entry is kept.
+                0 disables negative entries.
+        """
+        self._directory = directory
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._last_sweep_time = time.time()
+        self._enabled = ttl > 0 and prepare_private_directory(directory)
+
+    def is_enabled(self):
+        return self._enabled
+
+    def get(self, session_id):
+        """
+        Args:
+            session_id: A session ID.
+
+        Returns:
+            A tuple of a flag that shows the entry is found and the user ID.
+            The user ID is None for a negative entry.
+        """
+        if not self._enabled:
+            return False, None
+        path = self._get_path(session_id)
+        try:
+            with open(path) as entry_file:
+                expires, user_id = entry_file.read().split('\n')[:2]
+            expires = float(expires)
+        except (IOError, ValueError):
+            return False, None
+        if time.time() >= expires:
+            self._remove(path)
+            return False, None
+        if not user_id:
+            return True, None
+        return True, int(user_id)
+
+    def put(self, session_id, user_id):
+        """
+        Args:
+            session_id: A session ID.
+            user_id: A user ID for the session. None stores a negative
+                entry.
+        """
+        if not self._enabled:
+            return
+        if user_id is None:
+            ttl = self._negative_ttl
+            user_id = ''
+        else:
+            ttl = self._ttl
+        if ttl <= 0:
+            return
+        now = time.time()
+        self._write(self._get_path(session_id),
+                    '%f\n%s\n' % (now + ttl, user_id))
+        if now - self._last_sweep_time >= SWEEP_INTERVAL:
+            self._last_sweep_time = now
+            self.sweep()
+
+    def invalidate(self, session_id):
+        if not self._enabled:
+            return
+        self._remove(self._get_path(session_id))
+
+    def sweep(self):
+        """
+        Remove expired entries.
+        """
+        now = time.time()
+        for path in self._list_entries():
+            try:
+                with open(path) as entry_file:
+                    expires = float(entry_file.readline())
+            except (IOError, ValueError):
+                continue
+            if now >= expires:
+                self._remove(path)
+
+    def clear(self):
+        if not self._enabled:
+            return
+        for path in self._list_entries():
+            self._remove(path)
+
+    def _get_path(self, session_id):
+        # A session ID is not used as a file name as it is. It comes from
+        # the browser.
+        name = hashlib.sha1(session_id).hexdigest() + ENTRY_SUFFIX
+        return os.path.join(self._directory, name)
+
+    def _list_entries(self):
+        try:
+            names = os.listdir(self._directory)
+        except OSError:
+            return []
+        return [os.path.join(self._directory, name) for name in names
+                if name.endswith(ENTRY_SUFFIX)]
+
+    def _write(self, path, content):
+        # Readers see either the old entry or the new one.
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self._directory)
+            try:
+                os.write(fd, content)
+            finally:
+                os.close(fd)
+            os.rename(tmp_path, path)
+        except OSError as e:
+            logger.warning('Failed to store a session cache: %s' % e)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def prepare_private_directory(directory):
+    """
+    Create a directory that only the user of the process can write to.
+
+    Args:
+        directory: A path of the directory.
+
+    Returns:
+        True if the directory is ready. False if it couldn't be created or
+        it is writable by other users.
+    """
+    try:
+        os.makedirs(directory, 0700)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            logger.warning('Failed to create %s: %s' % (directory, e))
+            return False
+    # Files in it are trusted as they are.
+    st = os.stat(directory)
+    if st.st_uid != os.getuid() or \
+       st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        logger.warning('%s is writable by other users.' % directory)
+        return False
+    return True
+
+
+def _get_env_float(name, default):
+    value = os.getenv(name)
+    if not value:
+        return default
+    return float(value)
+
+
+def _get_default_directory():
+    return os.path.join(tempfile.gettempdir(),
+                        'hatohol-session-cache-%d' % os.getuid())
+
+
+def get_cache():
+    """
+    Returns:
+        A SessionCache object shared in the process.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SessionCache(
+                os.getenv(DIR_ENV_NAME) or _get_default_directory(),
+                _get_env_float(TTL_ENV_NAME, DEFAULT_TTL),
+                _get_env_float(NEGATIVE_TTL_ENV_NAME, DEFAULT_NEGATIVE_TTL))
+        return _cache
+
+
+def reset_cache():
+    """
+    Discard the shared cache object. The next get_cache() creates a new one
+    with the current settings. Stored entries are kept.
+    """
+    global _cache
+    with _cache_lock:
+        _cache = None
@@ -0,0 +1,105 @@
+# Copyright (C) 2015 Project Hatohol
+#
+# This file is part of Hatohol.
+#
+# Hatohol is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License, version 3
+# as published by the Free Software Foundation.
+#
+# Hatohol is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with Hatohol. If not, see
+# <http://www.gnu.org/licenses/>.
+
+import sys
+import threading
+
+_group = None
+_group_lock = threading.Lock()
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exc_info = None
+        self.num_followers = 0
+
+
+class Group(object):
+    """
+    Coalesce concurrent calls with the same key in the process. The first
+    caller runs the function and the others wait for it and share the
+    result or the exception.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._num_shared = 0
+
+    def do(self, key, func):
+        """
+        Args:
+            key: A hashable object that identifies the call.
+            func: A function without arguments.
+
+        Returns:
+            The value returned by func. It is shared by all the callers
+            with the same key, so it must not be modified.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+            else:
+                call.num_followers += 1
+                self._num_shared += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.exc_info is not None:
+                raise call.exc_info[0], call.exc_info[1], call.exc_info[2]
+            return call.result
+
+        try:
+            call.result = func()
+        except:
+            call.exc_info = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def get_num_in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def get_num_shared(self):
+        """
+        Returns:
+            The number of calls that got a result of another caller.
+        """
+        with self._lock:
+            return self._num_shared
+
+
+def get_group():
+    """
+    Returns:
+        A Group object shared in the process.
+    """
+    global _group
+    with _group_lock:
+        if _group is None:
+            _group = Group()
+        return _group
@@ -1,4 +1,4 @@
-# Copyright (C) 2013 Project Hatohol
+# Copyright (C) 2013-2015 Project Hatohol
 #
 # This file is part of Hatohol.
 #
@@ -16,23 +16,166 @@
 # <http://www.gnu.org/licenses/>.
 
 from django.db import models
-from django.conf import settings
 import cPickle
 import base64
+import json
+import re
 
 # The document for making custom field is
 # https://docs.djangoproject.com/en/dev/howto/custom-model-fields/
 
+# A value is stored with a prefix of the format. Base64 never contains
+# ':', so data without the prefix is the legacy Base64 + pickle format.
+FORMAT_JSON = 'J'
+FORMAT_PICKLE = 'P'
+FORMAT_SEPARATOR = ':'
+
+_json_encoder = json.JSONEncoder(separators=(',', ':'), allow_nan=False)
+_SCALAR_TYPES = frozenset([unicode, int, long, float, bool, type(None)])
+_NON_ASCII = re.compile(r'[\x80-\xff]')
+
+
+def _is_json_compatible(value, check_ascii):
+    """
+    Args:
+        value: A value that can be converted to JSON.
+        check_ascii: If False, byte strings are assumed to be ASCII.
+
+    Returns:
+        True if the value is the same after it is converted to JSON and
+        back. For example, a tuple becomes a list and a key of a dictionary
+        becomes a string. A byte string that isn't ASCII can't be decoded
+        as it was.
+    """
+    # The value has no circular references because it has been converted.
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        value_type = type(value)
+        if value_type in _SCALAR_TYPES:
+            continue
+        if value_type is str:
+            if check_ascii and _NON_ASCII.search(value):
+                return False
+        elif value_type is list:
+            stack.extend(value)
+        elif value_type is dict:
+            for key in value:
+                key_type = type(key)
+                if key_type is str:
+                    if check_ascii and _NON_ASCII.search(key):
+                        return False
+                elif key_type is not unicode:
+                    return False
+            stack.extend(value.itervalues())
+        else:
+            return False
+    return True
+
+
+def _encode_json(value):
+    """
+    Returns:
+        A JSON string of the value, or None if the value can't be expressed
+        in JSON as it is.
+    """
+    try:
+        data = _json_encoder.encode(value)
+    except (TypeError, ValueError):
+        return None
+    # A character that isn't ASCII is always escaped as \uXXXX. So byte
+    # strings have to be checked only when the data has an escape.
+    if not _is_json_compatible(value, '\\u' in data):
+        return None
+    return data
+
+
+def encode(value):
+    """
+    Args:
+        value: Any picklable value.
+
+    Returns:
+        An ASCII string. A value that can be expressed in JSON is stored as
+        compact JSON. Others are stored as Base64 + pickle.
+    """
+    data = _encode_json(value)
+    if data is not None:
+        return FORMAT_JSON + FORMAT_SEPARATOR + data
+    # We use ASCII (Base64) pickle.  There are two reasons to use ASCII.
+    # (1) Easy to see the content when we check it with mysql command.
+    # (2) CursorDebugWrapper, which logs SQL statements when
+    #     settings.DEBUG = True, cannot handle the binary string.
+    return FORMAT_PICKLE + FORMAT_SEPARATOR + \
+        base64.b64encode(cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL))
+
+
+def decode(data):
+    """
+    Args:
+        data: A string encoded by encode() or in the legacy format.
+
+    Returns:
+        The decoded value.
+    """
+    if isinstance(data, unicode):
+        data = data.encode('ascii')
+    else:
+        data = str(data)
+    fmt, separator, payload = data.partition(FORMAT_SEPARATOR)
+    if not separator:
+        return cPickle.loads(base64.b64decode(data))
+    if fmt == FORMAT_JSON:
+        return json.loads(payload)
+    if fmt == FORMAT_PICKLE:
+        return cPickle.loads(base64.b64decode(payload))
+    raise ValueError('Unknown format: %s' % fmt)
+
+
+def is_legacy_format(data):
+    return FORMAT_SEPARATOR not in str(data)
+
+
+class _EncodedValue(object):
+    def __init__(self, data):
+        self.data = data
+
+
+class _LazyDecodingDescriptor(object):
+    """
+    Keep the data read from the database as it is and decode it when the
+    attribute is accessed for the first time.
+    """
+
+    def __init__(self, field):
+        self._field = field
+
+    def __get__(self, obj, obj_type=None):
+        if obj is None:
+            return self
+        value = obj.__dict__[self._field.name]
+        if isinstance(value, _EncodedValue):
+            value = decode(value.data)
+            obj.__dict__[self._field.name] = value
+        return value
+
+    def __set__(self, obj, value):
+        if isinstance(value, SmartField.UserConfigValue):
+            value = value.get()
+        else:
+            # We assume this path is used when the data is read from the
+            # database.
+            value = _EncodedValue(value)
+        obj.__dict__[self._field.name] = value
+
 
 class SmartField(models.Field):
 
     description = 'A field that can store any type'
 
-    __metaclass__ = models.SubfieldBase
-
     # We have data as a object of UserConfigValue. The purpose is to
-    # distinguish a string (that is encoded by Base64 + pickled) as a
-    # configuration value with a string from database.
+    # distinguish a string (that is encoded) as a configuration value with
+    # a string from database.
     class UserConfigValue:
         def __init__(self, value):
             self._value = value
@@ -40,25 +183,23 @@ class SmartField(models.Field):
         def get(self):
             return self._value
 
+    def contribute_to_class(self, cls, name):
+        models.Field.contribute_to_class(self, cls, name)
+        setattr(cls, self.name, _LazyDecodingDescriptor(self))
+
     def db_type(self, connection):
-        # We only support MySQL at present.
+        # The encoded data is ASCII.
         if connection.settings_dict['ENGINE'] == 'django.db.backends.mysql':
             return 'LONGBLOB'
         else:
-            raise NotImplementedError
+            return 'TEXT'
 
     def to_python(self, value):
         if isinstance(value, self.UserConfigValue):
             return value.get()
-
-        # We assume this path is used when the data is read from the database.
-        assert isinstance(value, str)
-        pickle_data = base64.b64decode(value)
-        return cPickle.loads(pickle_data)
+        if isinstance(value, _EncodedValue):
+            return decode(value.data)
+        return value
 
     def get_db_prep_save(self, value, connection):
-        # We use ASCII (Base64) pickle.  There are two reasons to use ASCII.
-        # (1) Easy to see the content when we check it with mysql command.
-        # (2) CursorDebugWrapper, which logs SQL statements when
-        #     settings.DEBUG = True, cannot handle the binary string.
-        return base64.b64encode(cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL))
+        return encode(value)
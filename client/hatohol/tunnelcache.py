@@ -0,0 +1,259 @@
+# Copyright (C) 2015 Project Hatohol
+#
+# This file is part of Hatohol.
+#
+# Hatohol is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License, version 3
+# as published by the Free Software Foundation.
+#
+# Hatohol is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with Hatohol. If not, see
+# <http://www.gnu.org/licenses/>.
+
+import os
+import time
+import zlib
+import mmap
+import hashlib
+import tempfile
+import threading
+import itertools
+import logging
+import sessioncache
+import userconfigcache
+
+# Paths of the tunnel whose responses are cached, and the TTL in seconds
+# and the maximum number of entries for each of them. Other paths such as
+# events and triggers are always forwarded to the server.
+DEFAULT_POLICIES = {
+    'server': (60, 1000),
+    'server-type': (300, 1000),
+    'hostgroup': (60, 1000),
+    'user-role': (300, 1000),
+}
+
+GENERATION_FILE_NAME = 'generation'
+
+DIR_ENV_NAME = 'HATOHOL_TUNNEL_CACHE_DIR'
+
+logger = logging.getLogger(__name__)
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class Entry(object):
+    def __init__(self, body, content_type, expires, generation):
+        self.body = body
+        self.content_type = content_type
+        self.expires = expires
+        self.generation = generation
+        self.etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        self.last_used = 0
+        self._gzipped_body = None
+
+    def get_gzipped_body(self):
+        if self._gzipped_body is None:
+            compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION,
+                                          zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._gzipped_body = \
+                compressor.compress(self.body) + compressor.flush()
+        return self._gzipped_body
+
+    def matches(self, if_none_match):
+        """
+        Args:
+            if_none_match: A value of the If-None-Match header.
+
+        Returns:
+            True if one of the ETags in the value is the same as this
+            entry's one.
+        """
+        for etag in if_none_match.split(','):
+            etag = etag.strip()
+            if etag.startswith('W/'):
+                etag = etag[2:]
+            if etag == '*' or etag == self.etag:
+                return True
+        return False
+
+
+class TunnelCache(object):
+    """
+    An in-process cache of responses of the tunnel. Entries are kept for
+    each session because the server returns different contents according
+    to the privileges of the user.
+
+    clear() increments a generation counter shared by the worker processes
+    on the host. An entry stored in an older generation is not used, so a
+    write through any worker discards the entries of all of them.
+    """
+
+    def __init__(self, policies=DEFAULT_POLICIES, generations=None):
+        """
+        Args:
+            policies: A dictionary whose key is a path and whose value is a
+                tuple of the TTL in seconds and the maximum number of
+                entries for the path.
+            generations: A VersionTable object whose first counter is the
+                generation. If it is None, clear() affects only this
+                object.
+        """
+        self._policies = policies
+        self._generations = generations
+        self._entries = dict([(path, {}) for path in policies])
+        self._lock = threading.Lock()
+        self._clock = itertools.count(1)
+
+    def is_cacheable(self, path):
+        return path in self._policies
+
+    def get_generation(self):
+        """
+        Returns:
+            The current generation. It has to be got before the response
+            is requested to the server and given to put().
+        """
+        if self._generations is None:
+            return 0
+        return self._generations.get(0)
+
+    def get(self, path, query, session_id):
+        """
+        Args:
+            path: A path of the tunnel without the leading '/'.
+            query: A list of pairs of a query parameter and its value.
+            session_id: A session ID or None.
+
+        Returns:
+            An Entry object or None if it is not cached or has expired.
+        """
+        key = self._make_key(query, session_id)
+        with self._lock:
+            entries = self._entries[path]
+            entry = entries.get(key)
+            if entry is None:
+                return None
+            if time.time() >= entry.expires or \
+               entry.generation != self.get_generation():
+                del entries[key]
+                return None
+            entry.last_used = self._clock.next()
+            return entry
+
+    def put(self, path, query, session_id, body, content_type,
+            generation=None):
+        """
+        The arguments are the same as get().
+
+        Args:
+            body: A response body from the server.
+            content_type: A value of the Content-Type header.
+            generation: A value of get_generation() before the response
+                was requested. None means the current generation.
+
+        Returns:
+            The stored Entry object.
+        """
+        ttl, max_entries = self._policies[path]
+        if generation is None:
+            generation = self.get_generation()
+        entry = Entry(body, content_type, time.time() + ttl, generation)
+        key = self._make_key(query, session_id)
+        with self._lock:
+            entries = self._entries[path]
+            entry.last_used = self._clock.next()
+            entries[key] = entry
+            if len(entries) > max_entries:
+                self._evict(entries, max_entries)
+        return entry
+
+    def invalidate_session(self, session_id):
+        with self._lock:
+            for entries in self._entries.itervalues():
+                for key in [key for key in entries if key[0] == session_id]:
+                    del entries[key]
+
+    def clear(self):
+        if self._generations is not None:
+            self._generations.increment(0)
+        with self._lock:
+            for entries in self._entries.itervalues():
+                entries.clear()
+
+    def close(self):
+        if self._generations is not None:
+            self._generations.close()
+
+    def get_num_entries(self):
+        with self._lock:
+            return sum([len(entries) for entries in
+                        self._entries.itervalues()])
+
+    def _evict(self, entries, max_entries):
+        """
+        Remove expired entries and then the least recently used ones
+        until the number of entries is max_entries.
+        """
+        now = time.time()
+        generation = self.get_generation()
+        for key in [key for key, entry in entries.iteritems()
+                    if now >= entry.expires or
+                    entry.generation != generation]:
+            del entries[key]
+        num_excess = len(entries) - max_entries
+        if num_excess <= 0:
+            return
+        lru_keys = sorted(entries, key=lambda key: entries[key].last_used)
+        for key in lru_keys[:num_excess]:
+            del entries[key]
+
+    def _make_key(self, query, session_id):
+        return (session_id, tuple(sorted(query)))
+
+
+def _get_default_directory():
+    return os.path.join(tempfile.gettempdir(),
+                        'hatohol-tunnel-cache-%d' % os.getuid())
+
+
+def _create_generation_table():
+    directory = os.getenv(DIR_ENV_NAME) or _get_default_directory()
+    if not sessioncache.prepare_private_directory(directory):
+        logger.warning('Tunnel cache is not shared by the processes.')
+        return None
+    try:
+        return userconfigcache.VersionTable(
+            os.path.join(directory, GENERATION_FILE_NAME), num_slots=1)
+    except (OSError, IOError, mmap.error) as e:
+        logger.warning('Tunnel cache is not shared by the processes: %s' % e)
+        return None
+
+
+def get_cache():
+    """
+    Returns:
+        A TunnelCache object shared in the process.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = TunnelCache(generations=_create_generation_table())
+        return _cache
+
+
+def reset_cache():
+    """
+    Discard the shared cache object. The next get_cache() creates a new one
+    with the current settings.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+        _cache = None
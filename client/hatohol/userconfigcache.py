@@ -0,0 +1,264 @@
+# Copyright (C) 2015 Project Hatohol
+#
+# This file is part of Hatohol.
+#
+# Hatohol is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License, version 3
+# as published by the Free Software Foundation.
+#
+# Hatohol is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with Hatohol. If not, see
+# <http://www.gnu.org/licenses/>.
+
+import os
+import time
+import mmap
+import fcntl
+import struct
+import tempfile
+import itertools
+import threading
+import logging
+import sessioncache
+
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_TTL = 10
+DEFAULT_NUM_SLOTS = 4096
+VERSIONS_FILE_NAME = 'versions'
+
+DIR_ENV_NAME = 'HATOHOL_USER_CONFIG_CACHE_DIR'
+MAX_ENTRIES_ENV_NAME = 'HATOHOL_USER_CONFIG_CACHE_SIZE'
+TTL_ENV_NAME = 'HATOHOL_USER_CONFIG_CACHE_TTL'
+
+VERSION = struct.Struct('=Q')
+
+logger = logging.getLogger(__name__)
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class VersionTable(object):
+    """
+    Version counters of users in a file mapped to memory by all the worker
+    processes on the host. A counter is incremented when the user's
+    configuration is changed. Users share a counter when their IDs are the
+    same modulo the number of slots.
+
+    Processes on other hosts don't see the counters. Neither does anyone
+    who changes the table without UserConfig.store() or store_items().
+    """
+
+    def __init__(self, path, num_slots=DEFAULT_NUM_SLOTS):
+        """
+        Args:
+            path: A path of the file. It is created if it doesn't exist.
+            num_slots: The number of counters.
+        """
+        self._num_slots = num_slots
+        size = VERSION.size * num_slots
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0600)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(self._fd).st_size < size:
+                    os.ftruncate(self._fd, size)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            self._map = mmap.mmap(self._fd, size)
+        except:
+            os.close(self._fd)
+            raise
+
+    def get(self, user_id):
+        return VERSION.unpack_from(self._map, self._get_offset(user_id))[0]
+
+    def increment(self, user_id):
+        offset = self._get_offset(user_id)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            version = VERSION.unpack_from(self._map, offset)[0] + 1
+            VERSION.pack_into(self._map, offset, version)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return version
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+    def _get_offset(self, user_id):
+        return (user_id % self._num_slots) * VERSION.size
+
+
+class UserConfigCache(object):
+    """
+    A read-through LRU cache of decoded configuration values in the
+    process. Each entry remembers the version of the user when it was read
+    from the database. An entry whose version differs from the current one
+    in the VersionTable is not used.
+
+    Changes that the VersionTable doesn't tell, such as the ones made by
+    clients on other hosts sharing the database, are seen after the TTL
+    of the entries at the latest.
+    """
+
+    def __init__(self, versions, max_entries=DEFAULT_MAX_ENTRIES,
+                 ttl=DEFAULT_TTL):
+        """
+        Args:
+            versions: A VersionTable object or None to disable the cache.
+            max_entries: The maximum number of values kept.
+            ttl: Seconds for which a value is used. 0 disables the cache.
+        """
+        self._versions = versions
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._clock = itertools.count(1)
+
+    def is_enabled(self):
+        return self._versions is not None and self._max_entries > 0 and \
+            self._ttl > 0
+
+    def get_version(self, user_id):
+        """
+        Returns:
+            The current version of the user. It has to be got before the
+            values are read from the database and given to put_items().
+        """
+        if not self.is_enabled():
+            return None
+        return self._versions.get(user_id)
+
+    def get_items(self, item_name_list, user_id, version):
+        """
+        Args:
+            item_name_list: A list of configuration items.
+            user_id: A user ID for the configuration.
+            version: A version returned by get_version().
+
+        Returns:
+            A tuple of a dictionary of the cached values and a list of the
+            item names that are not cached. The values are shared with
+            other callers, so they must not be modified.
+        """
+        if not self.is_enabled():
+            return {}, list(item_name_list)
+        items = {}
+        missing = []
+        now = time.time()
+        with self._lock:
+            for item_name in item_name_list:
+                key = (user_id, item_name)
+                entry = self._entries.get(key)
+                if entry is None or entry[0] != version or now >= entry[3]:
+                    missing.append(item_name)
+                    continue
+                self._entries[key] = \
+                    (version, entry[1], self._clock.next(), entry[3])
+                items[item_name] = entry[1]
+        return items, missing
+
+    def put_items(self, items, user_id, version):
+        """
+        Args:
+            items: A dictionary of item names and values read from the
+                database. None means that the item doesn't exist.
+            user_id: A user ID for the configuration.
+            version: A version returned by get_version() before the items
+                were read.
+        """
+        if not self.is_enabled():
+            return
+        expires = time.time() + self._ttl
+        with self._lock:
+            for item_name, value in items.iteritems():
+                self._entries[(user_id, item_name)] = \
+                    (version, value, self._clock.next(), expires)
+            if len(self._entries) > self._max_entries:
+                self._evict()
+
+    def invalidate(self, user_id):
+        """
+        Make the cached values of the user stale in all the processes. It
+        has to be called after the transaction is committed.
+        """
+        if not self.is_enabled():
+            return
+        self._versions.increment(user_id)
+
+    def get_num_entries(self):
+        with self._lock:
+            return len(self._entries)
+
+    def close(self):
+        self._versions.close()
+
+    def _evict(self):
+        # Remove a tenth at once not to sort the entries on every put.
+        num_entries = len(self._entries) - self._max_entries * 9 / 10
+        lru_keys = sorted(self._entries,
+                          key=lambda key: self._entries[key][2])
+        for key in lru_keys[:num_entries]:
+            del self._entries[key]
+
+
+def _get_default_directory():
+    return os.path.join(tempfile.gettempdir(),
+                        'hatohol-user-config-cache-%d' % os.getuid())
+
+
+def _create_version_table():
+    directory = os.getenv(DIR_ENV_NAME) or _get_default_directory()
+    if not sessioncache.prepare_private_directory(directory):
+        logger.warning('User config cache is disabled.')
+        return None
+    try:
+        return VersionTable(os.path.join(directory, VERSIONS_FILE_NAME))
+    except (OSError, IOError, mmap.error) as e:
+        logger.warning('User config cache is disabled: %s' % e)
+        return None
+
+
+def get_cache():
+    """
+    Returns:
+        A UserConfigCache object shared in the process.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            max_entries = os.getenv(MAX_ENTRIES_ENV_NAME)
+            if max_entries:
+                max_entries = int(max_entries)
+            else:
+                max_entries = DEFAULT_MAX_ENTRIES
+            ttl = os.getenv(TTL_ENV_NAME)
+            if ttl:
+                ttl = float(ttl)
+            else:
+                ttl = DEFAULT_TTL
+            versions = None
+            if max_entries > 0 and ttl > 0:
+                versions = _create_version_table()
+            _cache = UserConfigCache(versions, max_entries, ttl)
+        return _cache
+
+
+def reset_cache():
+    """
+    Discard the shared cache object. The next get_cache() creates a new one
+    with the current settings.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is not None and _cache.is_enabled():
+            _cache.close()
+        _cache = None
@@ -16,9 +16,9 @@
 # <http://www.gnu.org/licenses/>.
 
 import json
+import itertools
 
 from django import http
-from django.core import serializers
 from django.core.urlresolvers import reverse
 from django.db import models
 from django.forms import ModelForm
@@ -30,30 +30,100 @@ from viewer.userconfig import get_user_id_from_hatohol_server
 from viewer.userconfig import NoHatoholUser, NoHatoholSession
 
 
-def format_models(models):
-    records = serializers.serialize('python', models)
-    flatten_records = []
+# Lists with this number of records or more are streamed.
+STREAMING_MIN_RECORDS = 100
+RECORDS_PER_CHUNK = 100
+
+
+def model_to_record(model):
+    record = {'id': model.pk}
+    for field in model._meta.local_fields:
+        record[field.attname] = field.value_from_object(model)
+    return record
+
+
+def format_record(record):
+    """Format a record as JSON. The JSON object in settings_json is merged
+       into the record. Its text is copied as it is without being decoded.
+
+    Args:
+        record: A dictionary of field names and values of a model.
+
+    Returns:
+        A JSON string.
+    """
+    record = dict(record)
+    settings_json = record.pop('settings_json', None)
+    record_json = json.dumps(record)
+    if settings_json is None:
+        return record_json
+    settings_json = settings_json.strip()
+    if not (settings_json.startswith('{') and settings_json.endswith('}')):
+        settings = json.loads(settings_json)
+        settings.update(record)
+        return json.dumps(settings)
+    members = settings_json[1:-1].strip()
+    if not members:
+        return record_json
+    # The members of the record are put after the settings. So they take
+    # precedence over the same names in the settings when it is parsed.
+    return '{' + members + ', ' + record_json[1:]
+
+
+def iter_json(records):
+    """Format records as a JSON array piece by piece.
+
+    Args:
+        records: An iterable of dictionaries of field names and values.
+
+    Returns:
+        An iterator of strings of the JSON array.
+    """
+    yield '['
+    chunk = []
+    separator = ''
     for record in records:
-        flatten_record = dict({'id': record['pk']}, **record['fields'])
-        if 'settings_json' in flatten_record:
-            settings = json.loads(record['fields']['settings_json'])
-            del flatten_record['settings_json']
-            settings.update(flatten_record)
-            flatten_record = settings
-        flatten_records.append(flatten_record)
-    return flatten_records
+        chunk.append(separator + format_record(record))
+        separator = ', '
+        if len(chunk) >= RECORDS_PER_CHUNK:
+            yield ''.join(chunk)
+            chunk = []
+    chunk.append(']')
+    yield ''.join(chunk)
+
+
+def iter_records(objects):
+    if isinstance(objects, models.query.QuerySet):
+        # Model objects are not created.
+        return objects.values().iterator()
+    return (model_to_record(obj) for obj in objects)
 
 
 def to_json(object):
     if hasattr(object, '__iter__'):
-        return json.dumps(format_models(object))
+        return ''.join(iter_json(iter_records(object)))
     elif isinstance(object, models.Model):
-        formatted_model = format_models([object])[0]
-        return json.dumps(formatted_model)
+        return format_record(model_to_record(object))
     else:
         return json.dumps(object)
 
 
+def json_response(object, content_type):
+    """Create a response with object as JSON. A long list of records is
+       streamed.
+    """
+    if not isinstance(object, models.query.QuerySet):
+        return http.HttpResponse(to_json(object), content_type=content_type)
+    records = iter_records(object)
+    head = list(itertools.islice(records, STREAMING_MIN_RECORDS))
+    if len(head) < STREAMING_MIN_RECORDS:
+        return http.HttpResponse(''.join(iter_json(head)),
+                                 content_type=content_type)
+    return http.StreamingHttpResponse(
+        iter_json(itertools.chain(head, records)),
+        content_type=content_type)
+
+
 class LogSearchSystemForm(ModelForm):
     class Meta:
         model = LogSearchSystem
@@ -119,7 +189,7 @@ def log_search_systems(request, id):
         else:
             systems = LogSearchSystem.objects.all().order_by('id')
             response = systems
-        return http.HttpResponse(to_json(response), content_type=content_type)
+        return json_response(response, content_type)
 
 
 def graphs(request, id):
@@ -190,4 +260,4 @@ def graphs(request, id):
         else:
             graphs = Graph.objects.filter(user_id=user_id).order_by('id')
             response = graphs
-        return http.HttpResponse(to_json(response), content_type=content_type)
+        return json_response(response, content_type)
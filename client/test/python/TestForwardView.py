@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+"""
+  Copyright (C) 2015 Project Hatohol
+
+  This file is part of Hatohol.
+
+  Hatohol is free software: you can redistribute it and/or modify
+  it under the terms of the GNU Lesser General Public License, version 3
+  as published by the Free Software Foundation.
+
+  Hatohol is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+  GNU Lesser General Public License for more details.
+
+  You should have received a copy of the GNU Lesser General Public
+  License along with Hatohol. If not, see
+  <http://www.gnu.org/licenses/>.
+"""
+import unittest
+import gzip
+import time
+import threading
+import zlib
+import httplib
+from StringIO import StringIO
+from django.http import HttpRequest
+from django.http import QueryDict
+from hatohol import forwardview
+from hatohol import httpclient
+from hatohol import hatoholserver
+from hatohol import hatohol_def
+from hatohol import tunnelcache
+from hatohol import sessioncache
+from hatohol import singleflight
+from hatohol_server_emulator import HatoholServerEmulator
+from hatohol_server_emulator import HatoholServerEmulationHandler
+
+USER_IDS = {'session-a': 5, 'session-a2': 5, 'session-b': 6}
+
+LARGE_BODY = '{"events": [%s]}' % ','.join(['{"eventId": %d}' % i
+                                           for i in range(1000)])
+
+
+class TunnelEmulationHandler(HatoholServerEmulationHandler):
+    num_server_requests = 0
+    num_overview_requests = 0
+    server_error_code = hatohol_def.HTERR_OK
+
+    def do_GET(self):
+        if self.path.startswith('/overview?'):
+            TunnelEmulationHandler.num_overview_requests += 1
+            # Keep the request in flight until the others arrive.
+            time.sleep(0.3)
+            body = LARGE_BODY
+        elif self.path.startswith('/server?'):
+            TunnelEmulationHandler.num_server_requests += 1
+            body = '{"errorCode": %d, "servers": [%s]}' % (
+                TunnelEmulationHandler.server_error_code,
+                ','.join(['{"id": %d}' % i for i in range(100)]))
+        elif self.path.startswith('/small'):
+            body = '{}'
+        else:
+            body = LARGE_BODY
+        self.send_response(httplib.OK)
+        self.send_header('Content-Type', 'application/json')
+        accept_encoding = self.headers.getheader('Accept-Encoding', '')
+        if self.path.startswith('/gzip') and 'gzip' in accept_encoding:
+            body = gzip_data(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.send_response(httplib.OK)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write('{}')
+
+
+def gzip_data(data):
+    buf = StringIO()
+    f = gzip.GzipFile(fileobj=buf, mode='wb')
+    f.write(data)
+    f.close()
+    return buf.getvalue()
+
+
+def gunzip_data(data):
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+
+class TestForwardViewAcceptsGzip(unittest.TestCase):
+
+    def test_gzip(self):
+        self.assertTrue(forwardview.accepts_gzip('gzip, deflate'))
+
+    def test_no_gzip(self):
+        self.assertFalse(forwardview.accepts_gzip('deflate'))
+        self.assertFalse(forwardview.accepts_gzip(''))
+
+    def test_quality_zero(self):
+        self.assertFalse(forwardview.accepts_gzip('gzip;q=0, deflate'))
+
+    def test_wildcard(self):
+        self.assertTrue(forwardview.accepts_gzip('*'))
+        self.assertFalse(forwardview.accepts_gzip('gzip;q=0, *'))
+
+
+class TestForwardViewGzipStream(unittest.TestCase):
+
+    def test_compress(self):
+        class Content(list):
+            closed = False
+
+            def close(self):
+                self.closed = True
+
+        content = Content(['abc', 'def', 'ghi'])
+        stream = forwardview.GzipStream(content)
+        self.assertEquals('abcdefghi', gunzip_data(''.join(stream)))
+        stream.close()
+        self.assertTrue(content.closed)
+
+
+class TestForwardView(unittest.TestCase):
+
+    def setUp(self):
+        TunnelEmulationHandler.num_server_requests = 0
+        TunnelEmulationHandler.num_overview_requests = 0
+        TunnelEmulationHandler.server_error_code = hatohol_def.HTERR_OK
+        sessioncache.get_cache().clear()
+        self._emulator = HatoholServerEmulator(handler=TunnelEmulationHandler)
+        self._emulator.start_and_wait_setup_done()
+
+    def tearDown(self):
+        httpclient.reset_pool()
+        tunnelcache.reset_cache()
+        self._emulator.shutdown()
+        self._emulator.join()
+
+    def _request(self, method, path, accept_encoding=None,
+                 session_id='session-a', if_none_match=None):
+        request = HttpRequest()
+        request.method = method
+        request.GET = QueryDict('')
+        request.POST = QueryDict('')
+        request.META[hatoholserver.SESSION_NAME_META] = session_id
+        if accept_encoding is not None:
+            request.META['HTTP_ACCEPT_ENCODING'] = accept_encoding
+        if if_none_match is not None:
+            request.META['HTTP_IF_NONE_MATCH'] = if_none_match
+        response = forwardview.jsonforward(request, path)
+        if response.streaming:
+            body = ''.join(response.streaming_content)
+        else:
+            body = response.content
+        response.close()
+        return response, body
+
+    def _get(self, path, accept_encoding=None, **kwargs):
+        response, body = self._request('GET', path, accept_encoding,
+                                       **kwargs)
+        self.assertEquals(httplib.OK, response.status_code)
+        return response, body
+
+    def test_no_compression(self):
+        response, body = self._get('event')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEquals(str(len(LARGE_BODY)), response['Content-Length'])
+        self.assertEquals(LARGE_BODY, body)
+
+    def test_compress(self):
+        response, body = self._get('event', 'gzip, deflate')
+        self.assertEquals('gzip', response['Content-Encoding'])
+        self.assertFalse(response.has_header('Content-Length'))
+        self.assertEquals('Accept-Encoding', response['Vary'])
+        self.assertEquals(LARGE_BODY, gunzip_data(body))
+
+    def test_small_response_is_not_compressed(self):
+        response, body = self._get('small', 'gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEquals('{}', body)
+
+    def test_pass_through_server_compression(self):
+        response, body = self._get('gzip', 'gzip')
+        self.assertEquals('gzip', response['Content-Encoding'])
+        self.assertEquals(str(len(body)), response['Content-Length'])
+        self.assertEquals(LARGE_BODY, gunzip_data(body))
+
+    def test_cached_response(self):
+        response1, body1 = self._get('server')
+        response2, body2 = self._get('server')
+        self.assertEquals(1, TunnelEmulationHandler.num_server_requests)
+        self.assertEquals(body1, body2)
+        self.assertEquals(response1['ETag'], response2['ETag'])
+        self.assertEquals('private, no-cache', response2['Cache-Control'])
+
+    def test_cached_response_is_compressed(self):
+        plain_response, plain_body = self._get('server')
+        response, body = self._get('server', 'gzip')
+        self.assertEquals('gzip', response['Content-Encoding'])
+        self.assertEquals(plain_body, gunzip_data(body))
+
+    def test_not_modified(self):
+        response, body = self._get('server')
+        response, body = self._request('GET', 'server',
+                                       if_none_match=response['ETag'])
+        self.assertEquals(httplib.NOT_MODIFIED, response.status_code)
+        self.assertEquals('', body)
+        self.assertEquals(1, TunnelEmulationHandler.num_server_requests)
+
+    def test_cache_per_session(self):
+        self._get('server', session_id='session-a')
+        self._get('server', session_id='session-b')
+        self.assertEquals(2, TunnelEmulationHandler.num_server_requests)
+
+    def test_error_is_not_cached(self):
+        TunnelEmulationHandler.server_error_code = hatohol_def.HTERR_OK + 1
+        response, body = self._get('server')
+        self._get('server')
+        self.assertEquals(2, TunnelEmulationHandler.num_server_requests)
+        self.assertEquals('no-cache', response['Cache-Control'])
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_live_data_is_not_cached(self):
+        response, body = self._get('event')
+        self.assertFalse(response.has_header('ETag'))
+        self.assertEquals('no-cache', response['Cache-Control'])
+        self.assertEquals(0, tunnelcache.get_cache().get_num_entries())
+
+    def test_write_clears_cache(self):
+        self._get('server')
+        self._request('POST', 'server')
+        self._get('server')
+        self.assertEquals(2, TunnelEmulationHandler.num_server_requests)
+
+    def test_logout_clears_cache_of_session(self):
+        self._get('server', session_id='session-a')
+        self._get('server', session_id='session-b')
+        self._request('GET', 'logout', session_id='session-a')
+        self.assertEquals(1, tunnelcache.get_cache().get_num_entries())
+
+    def _get_concurrently(self, session_ids, accept_encoding=None):
+        results = [None] * len(session_ids)
+
+        def get(i):
+            results[i] = self._get('overview', accept_encoding,
+                                   session_id=session_ids[i])
+
+        threads = [threading.Thread(target=get, args=(i,))
+                   for i in range(len(session_ids))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_coalesce_concurrent_requests(self):
+        num_shared = singleflight.get_group().get_num_shared()
+        results = self._get_concurrently(['session-a'] * 5, 'gzip')
+        self.assertEquals(1, TunnelEmulationHandler.num_overview_requests)
+        self.assertEquals(
+            4, singleflight.get_group().get_num_shared() - num_shared)
+        for response, body in results:
+            self.assertEquals('gzip', response['Content-Encoding'])
+            self.assertEquals(LARGE_BODY, gunzip_data(body))
+
+    def _cache_user_ids(self):
+        for session_id, user_id in USER_IDS.items():
+            sessioncache.get_cache().put(session_id, user_id)
+
+    def test_coalesce_sessions_of_same_user(self):
+        self._cache_user_ids()
+        results = self._get_concurrently(['session-a', 'session-a2'])
+        self.assertEquals(1, TunnelEmulationHandler.num_overview_requests)
+        for response, body in results:
+            self.assertEquals(LARGE_BODY, body)
+
+    def test_coalesce_per_session_of_unknown_user(self):
+        results = self._get_concurrently(['session-a', 'session-a2'])
+        self.assertEquals(2, TunnelEmulationHandler.num_overview_requests)
+        for response, body in results:
+            self.assertEquals(LARGE_BODY, body)
+
+    def test_coalesce_per_user(self):
+        self._cache_user_ids()
+        results = self._get_concurrently(['session-a', 'session-b'])
+        self.assertEquals(2, TunnelEmulationHandler.num_overview_requests)
+        for response, body in results:
+            self.assertEquals(LARGE_BODY, body)
+
+    def test_coalesce_per_session_of_unknown_user(self):
+        results = self._get_concurrently(['session-a', 'session-a2'])
+        self.assertEquals(2, TunnelEmulationHandler.num_overview_requests)
+        for response, body in results:
+            self.assertEquals(LARGE_BODY, body)
@@ -0,0 +1,149 @@
+"""
+  Copyright (C) 2015 Project Hatohol
+
+  This file is part of Hatohol.
+
+  Hatohol is free software: you can redistribute it and/or modify
+  it under the terms of the GNU Lesser General Public License, version 3
+  as published by the Free Software Foundation.
+
+  Hatohol is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+  GNU Lesser General Public License for more details.
+
+  You should have received a copy of the GNU Lesser General Public
+  License along with Hatohol. If not, see
+  <http://www.gnu.org/licenses/>.
+"""
+import unittest
+import sys
+import time
+import threading
+import subprocess
+import httplib
+from BaseHTTPServer import BaseHTTPRequestHandler
+from BaseHTTPServer import HTTPServer
+from SocketServer import ThreadingMixIn
+
+try:
+    import gevent
+except ImportError:
+    gevent = None
+
+UPSTREAM_DELAY = 0.5
+NUM_REQUESTS = 10
+MAX_DB_REQUESTS = 2
+
+# The server has to run in another process because the standard modules
+# are patched by gevent. The application forwards requests to the
+# upstream server like the tunnel. Requests for other paths stand for
+# the ones using the database.
+SERVER_SCRIPT = """
+import sys
+from gevent import monkey
+monkey.patch_all()
+from hatohol import geventserver
+from hatohol import httpclient
+
+pool = httpclient.ConnectionPool('127.0.0.1', int(sys.argv[1]))
+
+def application(environ, start_response):
+    body = pool.request('GET', environ['PATH_INFO']).body
+    start_response('200 OK', [('Content-Type', 'application/json'),
+                              ('Content-Length', str(len(body)))])
+    return [body]
+
+server = geventserver.create_server('127.0.0.1', 0,
+                                    max_db_requests=int(sys.argv[2]),
+                                    application=application)
+server.start()
+sys.stdout.write('%d\\n' % server.server_port)
+sys.stdout.flush()
+server.serve_forever()
+"""
+
+
+class SlowUpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.num_in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight,
+                                            self.server.num_in_flight)
+        time.sleep(UPSTREAM_DELAY)
+        with self.server.lock:
+            self.server.num_in_flight -= 1
+        body = '{}'
+        self.send_response(httplib.OK)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    # The default backlog (5) delays some of the concurrent connections.
+    request_queue_size = NUM_REQUESTS * 2
+
+
+@unittest.skipIf(gevent is None, 'gevent is not installed.')
+class TestGeventServer(unittest.TestCase):
+
+    def setUp(self):
+        self._upstream = ThreadingHTTPServer(('127.0.0.1', 0),
+                                             SlowUpstreamHandler)
+        self._upstream.lock = threading.Lock()
+        self._upstream.num_in_flight = 0
+        self._upstream.max_in_flight = 0
+        self._upstream_thread = threading.Thread(
+            target=self._upstream.serve_forever)
+        self._upstream_thread.start()
+        self._server = subprocess.Popen(
+            [sys.executable, '-c', SERVER_SCRIPT,
+             str(self._upstream.server_address[1]), str(MAX_DB_REQUESTS)],
+            stdout=subprocess.PIPE)
+        self._port = int(self._server.stdout.readline())
+
+    def tearDown(self):
+        self._server.terminate()
+        self._server.wait()
+        self._upstream.shutdown()
+        self._upstream.server_close()
+        self._upstream_thread.join()
+
+    def _get(self, results, i, path):
+        conn = httplib.HTTPConnection('127.0.0.1', self._port, timeout=30)
+        try:
+            conn.request('GET', path)
+            results[i] = conn.getresponse().status
+        finally:
+            conn.close()
+
+    def _get_concurrently(self, path):
+        results = [None] * NUM_REQUESTS
+        threads = [threading.Thread(target=self._get,
+                                    args=(results, i, path))
+                   for i in range(NUM_REQUESTS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_requests_wait_for_upstream_concurrently(self):
+        start_time = time.time()
+        results = self._get_concurrently('/tunnel/overview')
+        elapsed = time.time() - start_time
+        self.assertEquals([httplib.OK] * NUM_REQUESTS, results)
+        self.assertEquals(NUM_REQUESTS, self._upstream.max_in_flight)
+        self.assertTrue(elapsed < UPSTREAM_DELAY * NUM_REQUESTS / 2)
+
+    def test_database_requests_are_limited(self):
+        results = self._get_concurrently('/userconfig')
+        self.assertEquals([httplib.OK] * NUM_REQUESTS, results)
+        self.assertEquals(MAX_DB_REQUESTS, self._upstream.max_in_flight)
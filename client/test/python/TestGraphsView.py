@@ -24,9 +24,11 @@ import json
 import httplib
 import urllib
 from hatohol.models import Graph
+from hatohol import views
 from hatohol.views import graphs
 from hatohol_server_emulator import HatoholServerEmulator
 from hatohol import hatoholserver
+from hatohol import sessioncache
 
 
 class TestGraphsView(unittest.TestCase):
@@ -64,6 +66,9 @@ class TestGraphsView(unittest.TestCase):
 
     def setUp(self):
         Graph.objects.all().delete()
+        # The tests use the same fake session ID with different server
+        # responses.
+        sessioncache.get_cache().clear()
         self._setup_emulator()
 
     def tearDown(self):
@@ -109,6 +114,33 @@ class TestGraphsViewAuthorized(TestGraphsView):
         self.assertEquals(json.loads(response.content),
                           [])
 
+    def test_get_many(self):
+        num_graphs = views.STREAMING_MIN_RECORDS + 1
+        Graph.objects.bulk_create(
+            [Graph(user_id=5, settings_json='{"item_id":%d}' % i)
+             for i in range(num_graphs)])
+        response = self._get(None)
+        self.assertEquals(response.status_code, httplib.OK)
+        self.assertTrue(response.streaming)
+        records = json.loads(''.join(response.streaming_content))
+        self.assertEquals(sorted([record['item_id'] for record in records]),
+                          range(num_graphs))
+
+    def test_get_with_settings_overlapping_fields(self):
+        graph = Graph(
+            user_id=5,
+            settings_json='{"id":100,"user_id":4,"item_id":3}')
+        graph.save()
+        response = self._get(None)
+        self.assertEquals(response.status_code, httplib.OK)
+        record = {
+            'id': graph.id,
+            'user_id': graph.user_id,
+            'item_id': 3,
+        }
+        self.assertEquals(json.loads(response.content),
+                          [record])
+
     def test_get_with_id(self):
         graph = Graph(
             user_id=5,
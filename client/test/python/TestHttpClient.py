@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+"""
+  Copyright (C) 2015 Project Hatohol
+
+  This file is part of Hatohol.
+
+  Hatohol is free software: you can redistribute it and/or modify
+  it under the terms of the GNU Lesser General Public License, version 3
+  as published by the Free Software Foundation.
+
+  Hatohol is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+  GNU Lesser General Public License for more details.
+
+  You should have received a copy of the GNU Lesser General Public
+  License along with Hatohol. If not, see
+  <http://www.gnu.org/licenses/>.
+"""
+import unittest
+import threading
+import httplib
+from BaseHTTPServer import BaseHTTPRequestHandler
+from BaseHTTPServer import HTTPServer
+
+from hatohol import httpclient
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.client_ports.append(self.client_address[1])
+        if self.path == '/missing':
+            self._reply(httplib.NOT_FOUND, 'not found')
+            return
+        if self.path == '/chunked':
+            self.send_response(httplib.OK)
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for chunk in ('abc', 'defg', ''):
+                self.wfile.write('%x\r\n%s\r\n' % (len(chunk), chunk))
+            return
+        self._reply(httplib.OK, self.path)
+
+    def do_POST(self):
+        self.server.client_ports.append(self.client_address[1])
+        length = int(self.headers.getheader('Content-Length'))
+        body = self.rfile.read(length)
+        if self.path == '/drop':
+            # Close the connection without a response like a server that
+            # went down after applying the request.
+            self.close_connection = 1
+            return
+        self._reply(httplib.OK, body)
+
+    def _reply(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestHttpClient(unittest.TestCase):
+
+    def setUp(self):
+        self._server = HTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+        self._server.client_ports = []
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.start()
+        self._pool = httpclient.ConnectionPool(
+            '127.0.0.1', self._server.server_address[1], max_size=2,
+            timeout=5)
+
+    def tearDown(self):
+        self._pool.clear()
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def test_get(self):
+        response = self._pool.request('GET', '/foo?a=1')
+        self.assertEquals(httplib.OK, response.status)
+        self.assertEquals('/foo?a=1', response.body)
+        self.assertEquals('application/json',
+                          response.getheader('content-type'))
+
+    def test_post(self):
+        response = self._pool.request(
+            'POST', '/foo', 'a=1',
+            {'Content-Type': 'application/x-www-form-urlencoded'})
+        self.assertEquals('a=1', response.body)
+
+    def test_error_status_is_returned(self):
+        response = self._pool.request('GET', '/missing')
+        self.assertEquals(httplib.NOT_FOUND, response.status)
+        self.assertEquals('not found', response.body)
+
+    def test_connection_is_reused(self):
+        for i in range(3):
+            self._pool.request('GET', '/foo')
+        self.assertEquals(1, len(set(self._server.client_ports)))
+        self.assertEquals(1, self._pool.get_num_idle_connections())
+
+    def test_retry_on_closed_connection(self):
+        self._pool.request('GET', '/foo')
+        # Close the pooled connection like a server-side idle timeout.
+        self._pool._idle_connections[0].sock.close()
+        response = self._pool.request('GET', '/bar')
+        self.assertEquals('/bar', response.body)
+        self.assertEquals(2, len(set(self._server.client_ports)))
+
+    def test_no_retry_of_post_sent_on_reused_connection(self):
+        self._pool.request('GET', '/foo')
+        self.assertRaises(httplib.BadStatusLine, self._pool.request,
+                          'POST', '/drop', 'a=1')
+        self.assertEquals(2, len(self._server.client_ports))
+
+    def test_retry_of_post_not_sent_on_closed_connection(self):
+        self._pool.request('GET', '/foo')
+        self._pool._idle_connections[0].sock.close()
+        response = self._pool.request('POST', '/foo', 'a=1')
+        self.assertEquals('a=1', response.body)
+        self.assertEquals(2, len(set(self._server.client_ports)))
+
+    def test_stream(self):
+        response = self._pool.stream('GET', '/0123456789', chunk_size=4)
+        self.assertEquals(httplib.OK, response.status)
+        self.assertEquals(['/012', '3456', '789'], list(response))
+        self.assertEquals(1, self._pool.get_num_idle_connections())
+
+    def test_stream_chunked(self):
+        response = self._pool.stream('GET', '/chunked')
+        self.assertEquals('abcdefg', response.read())
+        self.assertEquals(1, self._pool.get_num_idle_connections())
+
+    def test_stream_error_status(self):
+        response = self._pool.stream('GET', '/missing')
+        self.assertEquals(httplib.NOT_FOUND, response.status)
+        self.assertEquals('not found', response.read())
+
+    def test_close_stream_before_end(self):
+        response = self._pool.stream('GET', '/0123456789', chunk_size=4)
+        iter(response).next()
+        response.close()
+        self.assertEquals(0, self._pool.get_num_idle_connections())
+        self.assertEquals('/foo', self._pool.request('GET', '/foo').body)
+
+
+class TestHttpClientSharedPool(unittest.TestCase):
+
+    def tearDown(self):
+        httpclient.reset_pool()
+
+    def test_get_pool(self):
+        pool = httpclient.get_pool()
+        self.assertTrue(pool is httpclient.get_pool())
+        httpclient.reset_pool()
+        self.assertFalse(pool is httpclient.get_pool())
@@ -27,6 +27,7 @@ from hatohol.models import LogSearchSystem
 from hatohol.views import log_search_systems
 from hatohol_server_emulator import HatoholServerEmulator
 from hatohol import hatoholserver
+from hatohol import sessioncache
 
 
 class TestLogSearchSystemsView(unittest.TestCase):
@@ -60,6 +61,9 @@ class TestLogSearchSystemsView(unittest.TestCase):
 
     def setUp(self):
         LogSearchSystem.objects.all().delete()
+        # The tests use the same fake session ID with different server
+        # responses.
+        sessioncache.get_cache().clear()
         self._setup_emulator()
 
     def tearDown(self):
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+"""
+  Copyright (C) 2015 Project Hatohol
+
+  This file is part of Hatohol.
+
+  Hatohol is free software: you can redistribute it and/or modify
+  it under the terms of the GNU Lesser General Public License, version 3
+  as published by the Free Software Foundation.
+
+  Hatohol is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+  GNU Lesser General Public License for more details.
+
+  You should have received a copy of the GNU Lesser General Public
+  License along with Hatohol. If not, see
+  <http://www.gnu.org/licenses/>.
+"""
+import unittest
+import os
+import time
+import shutil
+import httplib
+import json
+import tempfile
+from django.http import HttpRequest
+from django.http import QueryDict
+from hatohol import sessioncache
+from hatohol import forwardview
+from hatohol import httpclient
+from hatohol import hatoholserver
+from hatohol import hatohol_def
+from viewer import userconfig
+from hatohol_server_emulator import HatoholServerEmulator
+from hatohol_server_emulator import HatoholServerEmulationHandler
+
+SESSION_ID = 'c579a3da-65db-44b4-a0da-ebf27548f4fd'
+
+
+class CountingEmulationHandler(HatoholServerEmulationHandler):
+    num_user_me_requests = 0
+    valid_session = True
+
+    def _request_user_me(self):
+        CountingEmulationHandler.num_user_me_requests += 1
+        if CountingEmulationHandler.valid_session:
+            return HatoholServerEmulationHandler._request_user_me(self)
+        self.send_response(httplib.OK)
+        return json.dumps({'apiVersion': hatohol_def.FACE_REST_API_VERSION,
+                           'errorCode': hatohol_def.HTERR_OK + 1})
+
+
+class TestSessionCache(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._cache = sessioncache.SessionCache(self._dir, ttl=60,
+                                                negative_ttl=60)
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_get_missing(self):
+        self.assertEquals((False, None), self._cache.get(SESSION_ID))
+
+    def test_put_and_get(self):
+        self._cache.put(SESSION_ID, 5)
+        self.assertEquals((True, 5), self._cache.get(SESSION_ID))
+
+    def test_negative_entry(self):
+        self._cache.put(SESSION_ID, None)
+        self.assertEquals((True, None), self._cache.get(SESSION_ID))
+
+    def test_shared_with_another_object(self):
+        self._cache.put(SESSION_ID, 5)
+        another = sessioncache.SessionCache(self._dir)
+        self.assertEquals((True, 5), another.get(SESSION_ID))
+        another.invalidate(SESSION_ID)
+        self.assertEquals((False, None), self._cache.get(SESSION_ID))
+
+    def test_expired(self):
+        cache = sessioncache.SessionCache(self._dir, ttl=0.01)
+        cache.put(SESSION_ID, 5)
+        time.sleep(0.02)
+        self.assertEquals((False, None), cache.get(SESSION_ID))
+        self.assertEquals([], os.listdir(self._dir))
+
+    def test_sweep(self):
+        cache = sessioncache.SessionCache(self._dir, ttl=0.01)
+        cache.put(SESSION_ID, 5)
+        self._cache.put('another-session', 6)
+        time.sleep(0.02)
+        cache.sweep()
+        self.assertEquals(1, len(os.listdir(self._dir)))
+        self.assertEquals((True, 6), self._cache.get('another-session'))
+
+    def test_clear(self):
+        self._cache.put(SESSION_ID, 5)
+        self._cache.clear()
+        self.assertEquals((False, None), self._cache.get(SESSION_ID))
+
+    def test_disabled(self):
+        cache = sessioncache.SessionCache(self._dir, ttl=0)
+        self.assertFalse(cache.is_enabled())
+        cache.put(SESSION_ID, 5)
+        self.assertEquals((False, None), cache.get(SESSION_ID))
+
+    def test_directory_writable_by_others(self):
+        os.chmod(self._dir, 0777)
+        cache = sessioncache.SessionCache(self._dir)
+        self.assertFalse(cache.is_enabled())
+
+
+class TestSessionCacheWithServer(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._saved_env = {}
+        for name, value in ((sessioncache.DIR_ENV_NAME, self._dir),
+                            (sessioncache.TTL_ENV_NAME, '60'),
+                            (sessioncache.NEGATIVE_TTL_ENV_NAME, '60')):
+            self._saved_env[name] = os.environ.get(name)
+            os.environ[name] = value
+        sessioncache.reset_cache()
+        CountingEmulationHandler.num_user_me_requests = 0
+        CountingEmulationHandler.valid_session = True
+        self._emulator = HatoholServerEmulator(
+            handler=CountingEmulationHandler)
+        self._emulator.start_and_wait_setup_done()
+
+    def tearDown(self):
+        httpclient.reset_pool()
+        self._emulator.shutdown()
+        self._emulator.join()
+        for name, value in self._saved_env.items():
+            if value is None:
+                del os.environ[name]
+            else:
+                os.environ[name] = value
+        sessioncache.reset_cache()
+        shutil.rmtree(self._dir)
+
+    def _create_request(self):
+        request = HttpRequest()
+        request.method = 'GET'
+        request.GET = QueryDict('')
+        request.META[hatoholserver.SESSION_NAME_META] = SESSION_ID
+        return request
+
+    def test_user_id_is_cached(self):
+        for i in range(3):
+            user_id = userconfig.get_user_id_from_hatohol_server(
+                self._create_request())
+            self.assertEquals(5, user_id)
+        self.assertEquals(1, CountingEmulationHandler.num_user_me_requests)
+
+    def test_invalid_session_is_cached(self):
+        CountingEmulationHandler.valid_session = False
+        for i in range(3):
+            self.assertRaises(userconfig.NoHatoholUser,
+                              userconfig.get_user_id_from_hatohol_server,
+                              self._create_request())
+        self.assertEquals(1, CountingEmulationHandler.num_user_me_requests)
+
+    def test_invalidate_on_logout(self):
+        userconfig.get_user_id_from_hatohol_server(self._create_request())
+        response = forwardview.jsonforward(self._create_request(), 'logout')
+        response.close()
+        userconfig.get_user_id_from_hatohol_server(self._create_request())
+        self.assertEquals(2, CountingEmulationHandler.num_user_me_requests)
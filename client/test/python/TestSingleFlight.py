@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+  Copyright (C) 2015 Project Hatohol
+
+  This file is part of Hatohol.
+
+  Hatohol is free software: you can redistribute it and/or modify
+  it under the terms of the GNU Lesser General Public License, version 3
+  as published by the Free Software Foundation.
+
+  Hatohol is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+  GNU Lesser General Public License for more details.
+
+  You should have received a copy of the GNU Lesser General Public
+  License along with Hatohol. If not, see
+  <http://www.gnu.org/licenses/>.
+"""
+import unittest
+import time
+import threading
+from hatohol import singleflight
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def setUp(self):
+        self._group = singleflight.Group()
+        self._release = threading.Event()
+        self._num_calls = 0
+
+    def _func(self):
+        self._num_calls += 1
+        self._release.wait()
+        return ['result']
+
+    def _run_followers(self, num_followers, func):
+        results = []
+        errors = []
+
+        def follower():
+            try:
+                results.append(self._group.do('key', func))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=follower)
+                   for i in range(num_followers)]
+        for thread in threads:
+            thread.start()
+        return threads, results, errors
+
+    def _wait_followers(self, num_followers):
+        while self._group.get_num_shared() < num_followers:
+            time.sleep(0.01)
+
+    def test_do(self):
+        self._release.set()
+        self.assertEquals(['result'], self._group.do('key', self._func))
+        self.assertEquals(['result'], self._group.do('key', self._func))
+        self.assertEquals(2, self._num_calls)
+        self.assertEquals(0, self._group.get_num_in_flight())
+
+    def test_share_result(self):
+        leader, leader_results, leader_errors = \
+            self._run_followers(1, self._func)
+        while self._num_calls == 0:
+            time.sleep(0.01)
+        threads, results, errors = self._run_followers(3, self._func)
+        self._wait_followers(3)
+        self._release.set()
+        for thread in leader + threads:
+            thread.join()
+        self.assertEquals(1, self._num_calls)
+        self.assertEquals(4, len(leader_results + results))
+        for result in results:
+            self.assertIs(leader_results[0], result)
+        self.assertEquals(0, self._group.get_num_in_flight())
+
+    def test_share_exception(self):
+        def fail():
+            self._num_calls += 1
+            self._release.wait()
+            raise ValueError('failed')
+
+        leader, leader_results, leader_errors = self._run_followers(1, fail)
+        while self._num_calls == 0:
+            time.sleep(0.01)
+        threads, results, errors = self._run_followers(2, fail)
+        self._wait_followers(2)
+        self._release.set()
+        for thread in leader + threads:
+            thread.join()
+        self.assertEquals(1, self._num_calls)
+        self.assertEquals([], leader_results + results)
+        self.assertEquals(3, len(leader_errors + errors))
+        for error in leader_errors + errors:
+            self.assertTrue(isinstance(error, ValueError))
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""
+  Copyright (C) 2015 Project Hatohol
+
+  This file is part of Hatohol.
+
+  Hatohol is free software: you can redistribute it and/or modify
+  it under the terms of the GNU Lesser General Public License, version 3
+  as published by the Free Software Foundation.
+
+  Hatohol is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+  GNU Lesser General Public License for more details.
+
+  You should have received a copy of the GNU Lesser General Public
+  License along with Hatohol. If not, see
+  <http://www.gnu.org/licenses/>.
+"""
+import unittest
+import warnings
+import base64
+import cPickle
+from StringIO import StringIO
+from django.db import connection
+from django.core.management import call_command
+from hatohol import smartfield
+from hatohol.models import UserConfig
+
+
+def encode_legacy(value):
+    return base64.b64encode(cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL))
+
+
+class TestSmartField(unittest.TestCase):
+
+    def _assert_round_trip(self, value, fmt):
+        data = smartfield.encode(value)
+        self.assertTrue(data.startswith(fmt + smartfield.FORMAT_SEPARATOR))
+        self.assertEquals(value, smartfield.decode(data))
+
+    def test_json(self):
+        self._assert_round_trip(None, smartfield.FORMAT_JSON)
+        self._assert_round_trip(17, smartfield.FORMAT_JSON)
+        self._assert_round_trip(172.5, smartfield.FORMAT_JSON)
+        self._assert_round_trip(u'\u3042', smartfield.FORMAT_JSON)
+        self._assert_round_trip({'a': [1, 'b', {'c': False}]},
+                                smartfield.FORMAT_JSON)
+
+    def test_compact_json(self):
+        self.assertEquals('J:{"a":[1,2]}', smartfield.encode({'a': [1, 2]}))
+
+    def test_pickle(self):
+        self._assert_round_trip((1, 2), smartfield.FORMAT_PICKLE)
+        self._assert_round_trip({1: 'a'}, smartfield.FORMAT_PICKLE)
+        self._assert_round_trip('\xe3\x81\x82', smartfield.FORMAT_PICKLE)
+        self._assert_round_trip(float('inf'), smartfield.FORMAT_PICKLE)
+        self._assert_round_trip([set([1])], smartfield.FORMAT_PICKLE)
+        self._assert_round_trip({'\xe3\x81\x82': 1},
+                                smartfield.FORMAT_PICKLE)
+
+    def test_non_ascii_string_without_warning(self):
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            smartfield.encode(['\xe3\x81\x82'])
+        self.assertEquals([], caught)
+
+    def test_decode_legacy(self):
+        data = encode_legacy({'a': (1, 2)})
+        self.assertTrue(smartfield.is_legacy_format(data))
+        self.assertEquals({'a': (1, 2)}, smartfield.decode(data))
+        self.assertFalse(smartfield.is_legacy_format(smartfield.encode(1)))
+
+    def test_decode_unicode(self):
+        self.assertEquals([1], smartfield.decode(u'J:[1]'))
+
+    def test_unknown_format(self):
+        self.assertRaises(ValueError, smartfield.decode, 'X:1')
+
+    def test_lazy_decode(self):
+        # A model object is created in this way when it is loaded.
+        user_conf = UserConfig(1, 'name', 5, smartfield.encode('Foo'))
+        self.assertTrue(isinstance(user_conf.__dict__['value'],
+                                   smartfield._EncodedValue))
+        self.assertEquals('Foo', user_conf.value)
+        self.assertEquals('Foo', user_conf.__dict__['value'])
+
+
+class TestConvertUserConfig(unittest.TestCase):
+
+    def setUp(self):
+        UserConfig.objects.all().delete()
+
+    def _store_legacy(self, item_name, value):
+        user_conf = UserConfig(item_name=item_name, user_id=5, value=None)
+        user_conf.save()
+        cursor = connection.cursor()
+        cursor.execute('UPDATE %s SET value = %%s WHERE id = %%s' %
+                       UserConfig._meta.db_table,
+                       [encode_legacy(value), user_conf.id])
+
+    def _get_raw_values(self):
+        return [data for data in
+                UserConfig.objects.values_list('value', flat=True)]
+
+    def test_convert(self):
+        values = {'age': 17, 'name': 'Foo', 'pair': (1, 2)}
+        for item_name, value in values.iteritems():
+            self._store_legacy(item_name, value)
+        UserConfig.store_items({'height': 172.5}, 5)
+        out = StringIO()
+        call_command('convert_user_config', batch_size=2, stdout=out)
+        self.assertEquals('Converted 3 records.\n', out.getvalue())
+        for data in self._get_raw_values():
+            self.assertFalse(smartfield.is_legacy_format(data))
+        values['height'] = 172.5
+        self.assertEquals(values, UserConfig.get_items(values.keys(), 5))
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+  Copyright (C) 2015 Project Hatohol
+
+  This file is part of Hatohol.
+
+  Hatohol is free software: you can redistribute it and/or modify
+  it under the terms of the GNU Lesser General Public License, version 3
+  as published by the Free Software Foundation.
+
+  Hatohol is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+  GNU Lesser General Public License for more details.
+
+  You should have received a copy of the GNU Lesser General Public
+  License along with Hatohol. If not, see
+  <http://www.gnu.org/licenses/>.
+"""
+import unittest
+import os
+import time
+import shutil
+import tempfile
+from hatohol import tunnelcache
+from hatohol import userconfigcache
+
+
+class TestTunnelCache(unittest.TestCase):
+
+    def setUp(self):
+        self._cache = tunnelcache.TunnelCache({'server': (60, 2),
+                                               'short': (0.01, 10)})
+
+    def test_is_cacheable(self):
+        self.assertTrue(self._cache.is_cacheable('server'))
+        self.assertFalse(self._cache.is_cacheable('event'))
+
+    def test_put_and_get(self):
+        entry = self._cache.put('server', [('a', '1')], 'sid', '{}',
+                                'application/json')
+        self.assertIs(entry, self._cache.get('server', [('a', '1')], 'sid'))
+        self.assertIsNone(self._cache.get('server', [('a', '2')], 'sid'))
+        self.assertIsNone(self._cache.get('server', [('a', '1')], 'other'))
+
+    def test_query_order(self):
+        entry = self._cache.put('server', [('a', '1'), ('b', '2')], 'sid',
+                                '{}', 'application/json')
+        self.assertIs(entry, self._cache.get('server',
+                                             [('b', '2'), ('a', '1')], 'sid'))
+
+    def test_expired(self):
+        self._cache.put('short', [], 'sid', '{}', 'application/json')
+        time.sleep(0.02)
+        self.assertIsNone(self._cache.get('short', [], 'sid'))
+
+    def test_evict_least_recently_used(self):
+        for sid in ('sid1', 'sid2'):
+            self._cache.put('server', [], sid, sid, 'application/json')
+        self._cache.get('server', [], 'sid1')
+        self._cache.put('server', [], 'sid3', 'sid3', 'application/json')
+        self.assertIsNotNone(self._cache.get('server', [], 'sid1'))
+        self.assertIsNone(self._cache.get('server', [], 'sid2'))
+        self.assertIsNotNone(self._cache.get('server', [], 'sid3'))
+
+    def test_invalidate_session(self):
+        self._cache.put('server', [], 'sid1', '{}', 'application/json')
+        self._cache.put('short', [], 'sid1', '{}', 'application/json')
+        self._cache.put('server', [], 'sid2', '{}', 'application/json')
+        self._cache.invalidate_session('sid1')
+        self.assertEquals(1, self._cache.get_num_entries())
+
+    def test_etag(self):
+        entry1 = self._cache.put('server', [], 'sid1', '{"a": 1}', 'json')
+        entry2 = self._cache.put('server', [], 'sid2', '{"a": 2}', 'json')
+        self.assertNotEquals(entry1.etag, entry2.etag)
+        self.assertTrue(entry1.matches(entry1.etag))
+        self.assertTrue(entry1.matches('"x", W/%s' % entry1.etag))
+        self.assertTrue(entry1.matches('*'))
+        self.assertFalse(entry1.matches(entry2.etag))
+        self.assertFalse(entry1.matches(''))
+
+
+class TestTunnelCacheGeneration(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        path = os.path.join(self._dir, 'generation')
+        # Each cache has its own table like worker processes.
+        self._caches = [
+            tunnelcache.TunnelCache(
+                {'server': (60, 10)},
+                userconfigcache.VersionTable(path, num_slots=1))
+            for i in range(2)]
+
+    def tearDown(self):
+        for cache in self._caches:
+            cache.close()
+        shutil.rmtree(self._dir)
+
+    def test_clear_in_other_process(self):
+        for cache in self._caches:
+            cache.put('server', [], 'sid', '{}', 'application/json')
+        self._caches[0].clear()
+        self.assertIsNone(self._caches[1].get('server', [], 'sid'))
+        self.assertEquals(0, self._caches[1].get_num_entries())
+
+    def test_put_of_old_generation(self):
+        cache = self._caches[1]
+        generation = cache.get_generation()
+        self._caches[0].clear()
+        cache.put('server', [], 'sid', '{}', 'application/json', generation)
+        self.assertIsNone(cache.get('server', [], 'sid'))
+        cache.put('server', [], 'sid', '{}', 'application/json',
+                  cache.get_generation())
+        self.assertIsNotNone(cache.get('server', [], 'sid'))
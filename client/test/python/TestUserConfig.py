@@ -18,15 +18,22 @@
   <http://www.gnu.org/licenses/>.
 """
 import unittest
+import re
 
 from hatohol.models import UserConfig
+from hatohol import userconfigcache
 from django.db import connection
+from django.conf import settings
+
+STATEMENT_PATTERN = re.compile(r'\b(SELECT|INSERT|UPDATE|DELETE)\b')
 
 
 class TestUserConfig(unittest.TestCase):
 
     def setUp(self):
         UserConfig.objects.all().delete()
+        # The table is changed directly without invalidating the cache.
+        userconfigcache.reset_cache()
 
     def test_create_integer(self):
         user_conf = UserConfig(item_name='age', user_id=5, value=17)
@@ -106,5 +113,41 @@ class TestUserConfig(unittest.TestCase):
         self.assertEquals(len(all_objs), 1)
         self.assertEquals(all_objs[0].value, 55)
 
+    def _count_queries(self, func, *args):
+        # Statements for transactions are not counted.
+        saved_debug = settings.DEBUG
+        settings.DEBUG = True
+        try:
+            num_queries = len(connection.queries)
+            result = func(*args)
+            queries = connection.queries[num_queries:]
+        finally:
+            settings.DEBUG = saved_debug
+        return result, len([query for query in queries
+                            if STATEMENT_PATTERN.search(query['sql'])])
+
+    def test_get_items(self):
+        self.test_create_integer()
+        self.test_create_string()
+        UserConfig(item_name='age', user_id=6, value=30).save()
+        items, num_queries = self._count_queries(
+            UserConfig.get_items, ['age', 'name', 'height'], 5)
+        self.assertEquals(items, {'age': 17, 'name': 'Foo', 'height': None})
+        self.assertEquals(num_queries, 1)
+
+    def test_get_items_empty(self):
+        self.assertEquals(UserConfig.get_items([], 5), {})
+
+    def test_store_items(self):
+        UserConfig.store_items({'age': 17, 'name': 'Foo'}, 5)
+        UserConfig.store_items({'age': 30}, 6)
+        result, num_queries = self._count_queries(
+            UserConfig.store_items, {'age': 18, 'height': 172.5}, 5)
+        self.assertEquals(num_queries, 2)
+        self.assertEquals(UserConfig.objects.filter(user_id=5).count(), 3)
+        self.assertEquals(UserConfig.get_items(['age', 'name', 'height'], 5),
+                          {'age': 18, 'name': 'Foo', 'height': 172.5})
+        self.assertEquals(UserConfig.get('age', 6), 30)
+
 if __name__ == '__main__':
     unittest.main()
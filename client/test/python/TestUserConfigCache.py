@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+"""
+  Copyright (C) 2015 Project Hatohol
+
+  This file is part of Hatohol.
+
+  Hatohol is free software: you can redistribute it and/or modify
+  it under the terms of the GNU Lesser General Public License, version 3
+  as published by the Free Software Foundation.
+
+  Hatohol is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+  GNU Lesser General Public License for more details.
+
+  You should have received a copy of the GNU Lesser General Public
+  License along with Hatohol. If not, see
+  <http://www.gnu.org/licenses/>.
+"""
+import unittest
+import os
+import time
+import shutil
+import tempfile
+from hatohol import userconfigcache
+from hatohol.models import UserConfig
+
+
+class TestVersionTable(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._path = os.path.join(self._dir, 'versions')
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_increment(self):
+        versions = userconfigcache.VersionTable(self._path, num_slots=8)
+        self.assertEquals(0, versions.get(5))
+        self.assertEquals(1, versions.increment(5))
+        self.assertEquals(1, versions.get(5))
+        self.assertEquals(0, versions.get(6))
+        versions.close()
+
+    def test_shared_with_another_table(self):
+        # Each worker process maps the same file.
+        versions1 = userconfigcache.VersionTable(self._path, num_slots=8)
+        versions2 = userconfigcache.VersionTable(self._path, num_slots=8)
+        versions1.increment(5)
+        self.assertEquals(1, versions2.get(5))
+        versions2.increment(5)
+        self.assertEquals(2, versions1.get(5))
+        versions1.close()
+        versions2.close()
+
+
+class TestUserConfigCache(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._versions = userconfigcache.VersionTable(
+            os.path.join(self._dir, 'versions'), num_slots=8)
+        self._cache = userconfigcache.UserConfigCache(self._versions,
+                                                      max_entries=10)
+
+    def tearDown(self):
+        self._versions.close()
+        shutil.rmtree(self._dir)
+
+    def test_put_and_get(self):
+        version = self._cache.get_version(5)
+        self._cache.put_items({'age': 17, 'name': None}, 5, version)
+        items, missing = self._cache.get_items(['age', 'name', 'height'], 5,
+                                               version)
+        self.assertEquals({'age': 17, 'name': None}, items)
+        self.assertEquals(['height'], missing)
+
+    def test_invalidate(self):
+        version = self._cache.get_version(5)
+        self._cache.put_items({'age': 17}, 5, version)
+        self._cache.put_items({'age': 30}, 6, self._cache.get_version(6))
+        self._cache.invalidate(5)
+        items, missing = self._cache.get_items(['age'], 5,
+                                               self._cache.get_version(5))
+        self.assertEquals(['age'], missing)
+        items, missing = self._cache.get_items(['age'], 6,
+                                               self._cache.get_version(6))
+        self.assertEquals({'age': 30}, items)
+
+    def test_values_read_before_change_are_not_used(self):
+        version = self._cache.get_version(5)
+        # Another process changes the configuration here.
+        self._versions.increment(5)
+        self._cache.put_items({'age': 17}, 5, version)
+        items, missing = self._cache.get_items(['age'], 5,
+                                               self._cache.get_version(5))
+        self.assertEquals(['age'], missing)
+
+    def test_evict_least_recently_used(self):
+        version = self._cache.get_version(5)
+        self._cache.put_items({'item0': 0}, 5, version)
+        for i in range(1, 10):
+            self._cache.put_items({'item%d' % i: i}, 5, version)
+            self._cache.get_items(['item0'], 5, version)
+        self._cache.put_items({'item10': 10}, 5, version)
+        self.assertEquals(9, self._cache.get_num_entries())
+        items, missing = self._cache.get_items(['item0', 'item1'], 5,
+                                               version)
+        self.assertEquals({'item0': 0}, items)
+        self.assertEquals(['item1'], missing)
+
+    def test_expire(self):
+        cache = userconfigcache.UserConfigCache(self._versions, ttl=0.01)
+        version = cache.get_version(5)
+        cache.put_items({'age': 17}, 5, version)
+        time.sleep(0.02)
+        items, missing = cache.get_items(['age'], 5, version)
+        self.assertEquals(['age'], missing)
+
+    def test_disabled(self):
+        cache = userconfigcache.UserConfigCache(None)
+        self.assertFalse(cache.is_enabled())
+        cache.put_items({'age': 17}, 5, cache.get_version(5))
+        self.assertEquals(({}, ['age']), cache.get_items(['age'], 5, None))
+
+
+class TestUserConfigWithCache(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._saved_env = {}
+        for name, value in (
+                (userconfigcache.DIR_ENV_NAME, self._dir),
+                (userconfigcache.MAX_ENTRIES_ENV_NAME, '100')):
+            self._saved_env[name] = os.environ.get(name)
+            os.environ[name] = value
+        userconfigcache.reset_cache()
+        UserConfig.objects.all().delete()
+
+    def tearDown(self):
+        for name, value in self._saved_env.items():
+            if value is None:
+                del os.environ[name]
+            else:
+                os.environ[name] = value
+        userconfigcache.reset_cache()
+        shutil.rmtree(self._dir)
+
+    def test_values_are_cached(self):
+        UserConfig.store_items({'age': 17}, 5)
+        self.assertEquals({'age': 17, 'name': None},
+                          UserConfig.get_items(['age', 'name'], 5))
+        # The cache doesn't know changes without store_items().
+        UserConfig.objects.all().delete()
+        self.assertEquals({'age': 17, 'name': None},
+                          UserConfig.get_items(['age', 'name'], 5))
+        self.assertEquals(2, userconfigcache.get_cache().get_num_entries())
+
+    def test_store_items_invalidates(self):
+        UserConfig.store_items({'age': 17}, 5)
+        self.assertEquals(17, UserConfig.get('age', 5))
+        UserConfig.store_items({'age': 18}, 5)
+        self.assertEquals(18, UserConfig.get('age', 5))
+
+    def test_store_invalidates(self):
+        UserConfig(item_name='age', user_id=5, value=17).store()
+        self.assertEquals(17, UserConfig.get('age', 5))
+        UserConfig(item_name='age', user_id=5, value=18).store()
+        self.assertEquals(18, UserConfig.get('age', 5))
+
+    def test_invalidated_by_another_process(self):
+        UserConfig.store_items({'age': 17}, 5)
+        self.assertEquals(17, UserConfig.get('age', 5))
+        UserConfig.objects.filter(user_id=5).update(value=18)
+        versions = userconfigcache.VersionTable(
+            os.path.join(self._dir, userconfigcache.VERSIONS_FILE_NAME))
+        versions.increment(5)
+        versions.close()
+        self.assertEquals(18, UserConfig.get('age', 5))
@@ -24,10 +24,12 @@ import urllib
 import json
 import httplib
 from hatohol.models import UserConfig
+from hatohol import userconfigcache
 from viewer import userconfig
 from hatohol_server_emulator import HatoholServerEmulator
 from hatohol_server_emulator import EmulationHandlerNotReturnUserInfo
 from hatohol import hatoholserver
+from hatohol import sessioncache
 
 
 class TestUserConfigView(unittest.TestCase):
@@ -72,6 +74,11 @@ class TestUserConfigView(unittest.TestCase):
     #
     def setUp(self):
         UserConfig.objects.all().delete()
+        # The table is changed directly without invalidating the cache.
+        userconfigcache.reset_cache()
+        # The tests use the same fake session ID with different server
+        # responses.
+        sessioncache.get_cache().clear()
 
     def tearDown(self):
         if self._emulator is not None:
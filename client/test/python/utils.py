@@ -17,6 +17,7 @@
 
 from django.http import HttpResponse
 from hatohol.models import UserConfig
+from hatohol import userconfigcache
 
 
 def hello(request):
@@ -24,5 +25,9 @@ def hello(request):
 
 
 def delete_user_config(request):
+    user_ids = set(UserConfig.objects.values_list('user_id', flat=True))
     UserConfig.objects.all().delete()
+    cache = userconfigcache.get_cache()
+    for user_id in user_ids:
+        cache.invalidate(user_id)
     return HttpResponse()
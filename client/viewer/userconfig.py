@@ -17,11 +17,12 @@
 
 from django.http import HttpResponse
 from hatohol.models import UserConfig
-import urllib2
 import httplib
 import json
 from hatohol import hatoholserver
 from hatohol import hatohol_def
+from hatohol import httpclient
+from hatohol import sessioncache
 import logging
 import traceback
 
@@ -41,16 +42,25 @@ def get_user_id_from_hatohol_server(request):
     if hatoholserver.SESSION_NAME_META not in request.META:
         raise NoHatoholSession
     session_id = request.META[hatoholserver.SESSION_NAME_META]
-    server = hatoholserver.get_address()
-    port = hatoholserver.get_port()
-    path = '/user/me'
-    url = 'http://%s:%d%s' % (server, port, path)
+    cache = sessioncache.get_cache()
+    found, user_id = cache.get(session_id)
+    if found:
+        if user_id is None:
+            raise NoHatoholUser
+        return user_id
+
     hdrs = {hatohol_def.FACE_REST_SESSION_ID_HEADER_NAME: session_id}
-    req = urllib2.Request(url, headers=hdrs)
-    response = urllib2.urlopen(req)
-    body = response.read()
-    user_info = json.loads(body)
+    response = httpclient.get_pool().request('GET', '/user/me', headers=hdrs)
+    if response.status != httplib.OK:
+        raise httpclient.HTTPError(response.status, response.reason)
+    user_info = json.loads(response.body)
+    error_code = user_info.get('errorCode', hatohol_def.HTERR_OK)
+    if error_code != hatohol_def.HTERR_OK:
+        # The session is unknown to the server or has expired.
+        cache.put(session_id, None)
+        raise NoHatoholUser
     user_id = user_info['users'][0]['userId']
+    cache.put(session_id, user_id)
     if user_id is None:
         raise NoHatoholUser
     return user_id
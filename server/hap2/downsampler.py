@@ -0,0 +1,156 @@
+#! /usr/bin/env python
+"""
+  Copyright (C) 2015 Project Hatohol
+
+  This file is part of Hatohol.
+
+  Hatohol is free software: you can redistribute it and/or modify
+  it under the terms of the GNU Lesser General Public License, version 3
+  as published by the Free Software Foundation.
+
+  Hatohol is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+  GNU Lesser General Public License for more details.
+
+  You should have received a copy of the GNU Lesser General Public
+  License along with Hatohol. If not, see
+  <http://www.gnu.org/licenses/>.
+"""
+
+import haptime
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+METHOD_LTTB = "LTTB"
+METHOD_MIN_MAX = "MIN_MAX"
+
+
+def downsample_histories(histories, max_points, method=METHOD_LTTB,
+                         use_numpy=None):
+    """
+    Reduce the number of samples for putHistory keeping the shape of the
+    graph.
+    @param histories
+    A list of samples ({"value": ..., "time": ...}) in the order of time.
+    @param max_points
+    The maximum number of samples to be returned. None or a number less
+    than 1 means no limit.
+    @param method
+    METHOD_LTTB (Largest-Triangle-Three-Buckets) or METHOD_MIN_MAX
+    (the minimum and the maximum in each bucket).
+    @param use_numpy
+    If True, NumPy is used. If False, it isn't. If None, it is used when
+    available.
+    @return
+    A list of the selected samples. If some values are not numbers or
+    missing, 'histories' is returned as it is.
+    """
+    if max_points is None or max_points < 1 or \
+       len(histories) <= max_points:
+        return histories
+    try:
+        values = [float(sample["value"]) for sample in histories]
+    except (TypeError, ValueError, KeyError):
+        # This is called after the fetch request has been answered. So a
+        # broken sample must not abort putHistory.
+        return histories
+    times = haptime.parse_times([sample["time"] for sample in histories],
+                                use_numpy=use_numpy)
+    if use_numpy is None:
+        use_numpy = numpy is not None
+
+    if method == METHOD_LTTB:
+        indexes = select_lttb(times, values, max_points, use_numpy)
+    elif method == METHOD_MIN_MAX:
+        indexes = select_min_max(values, max_points, use_numpy)
+    else:
+        raise ValueError("Unknown method: %s" % method)
+    return [histories[i] for i in indexes]
+
+
+def select_lttb(times, values, max_points, use_numpy=False):
+    """
+    @param times A list of times in nanoseconds.
+    @param values A list of values.
+    @param max_points The maximum number of points to be selected.
+    @return A list of indexes of the selected points.
+    """
+    num_points = len(values)
+    if num_points <= max_points:
+        return range(num_points)
+    if max_points < 3:
+        return [0, num_points - 1][:max_points]
+
+    # Use seconds from the first sample to keep the precision.
+    base_time = times[0]
+    xs = [(t - base_time) / float(haptime.NSEC_PER_SEC) for t in times]
+    ys = values
+    if use_numpy:
+        xs = numpy.array(xs)
+        ys = numpy.array(ys)
+    bucket_size = float(num_points - 2) / (max_points - 2)
+    selected = [0]
+    prev = 0
+    for i in range(max_points - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, num_points)
+        if use_numpy:
+            avg_x = xs[end:next_end].mean()
+            avg_y = ys[end:next_end].mean()
+            bucket_xs = xs[start:end]
+            bucket_ys = ys[start:end]
+            areas = numpy.abs((xs[prev] - avg_x) * (bucket_ys - ys[prev]) -
+                              (xs[prev] - bucket_xs) * (avg_y - ys[prev]))
+            prev = start + int(areas.argmax())
+        else:
+            avg_x = sum(xs[end:next_end]) / (next_end - end)
+            avg_y = sum(ys[end:next_end]) / (next_end - end)
+            max_area = -1
+            for j in range(start, end):
+                area = abs((xs[prev] - avg_x) * (ys[j] - ys[prev]) -
+                           (xs[prev] - xs[j]) * (avg_y - ys[prev]))
+                if area > max_area:
+                    max_area = area
+                    candidate = j
+            prev = candidate
+        selected.append(prev)
+    selected.append(num_points - 1)
+    return selected
+
+
+def select_min_max(values, max_points, use_numpy=False):
+    """
+    @param values A list of values.
+    @param max_points The maximum number of points to be selected.
+    @return
+    A list of indexes of the minimum and the maximum in each bucket in
+    the order of time.
+    """
+    num_points = len(values)
+    if num_points <= max_points:
+        return range(num_points)
+    num_buckets = max(max_points / 2, 1)
+    bucket_size = float(num_points) / num_buckets
+    if use_numpy:
+        values = numpy.array(values)
+    selected = []
+    for i in range(num_buckets):
+        start = int(i * bucket_size)
+        end = int((i + 1) * bucket_size)
+        bucket = values[start:end]
+        if use_numpy:
+            lowest = start + int(bucket.argmin())
+            highest = start + int(bucket.argmax())
+        else:
+            lowest = start + bucket.index(min(bucket))
+            highest = start + bucket.index(max(bucket))
+        if max_points == 1:
+            selected.append(lowest)
+            continue
+        selected.extend(sorted(set([lowest, highest])))
+    return selected
@@ -19,11 +19,16 @@
   <http://www.gnu.org/licenses/>.
 """
 
+import os
 import sys
 import time
+import signal
+import atexit
+import cProfile
 import logging
 import traceback
 import multiprocessing
+import threading
 import Queue
 import json
 import transporter
@@ -62,6 +67,7 @@ PROCEDURES_DEFS = {
             "beginTime": {"type": unicode(), "mandatory": True},
             "endTime": {"type": unicode(), "mandatory": True},
             "fetchId": {"type": unicode(), "mandatory": True},
+            "maxPoints": {"type": int(), "mandatory": False},
         }
     },
     "fetchTriggers": {
@@ -134,12 +140,156 @@ ERROR_DICT = {
 
 MAX_EVENT_CHUNK_SIZE = 1000
 
+DEFAULT_MAX_FETCH_WORKERS = 8
+DEFAULT_NUM_HOSTS_PER_FETCH = 10
+DEFAULT_FETCH_TIMEOUT_SEC = 60
+DEFAULT_DEDUP_CAPACITY = 100000
+DEFAULT_NUM_PREFETCH_PAGES = 4
+DEFAULT_SAMPLING_INTERVAL_SEC = 0.01
+DEFAULT_ERROR_SUMMARY_INTERVAL_SEC = 60
+DEFAULT_ERROR_IDLE_SEC = 3600
+DEFAULT_LOG_QUEUE_SIZE = 10000
+
+
+def validate_arguments(procedure_name, params):
+    """
+    Validate parameters of a procedure with PROCEDURES_DEFS.
+    @param procedure_name A procedure name.
+    @param params A dictionary of the parameters.
+    @return
+    None if the parameters are valid. Otherwise ERR_CODE_METHOD_NOT_FOUND
+    or ERR_CODE_INVALID_PARAMS.
+    """
+    procedure_def = PROCEDURES_DEFS.get(procedure_name)
+    if procedure_def is None:
+        return ERR_CODE_METHOD_NOT_FOUND
+    if not isinstance(params, dict):
+        return ERR_CODE_INVALID_PARAMS
+    for name, arg_def in procedure_def["args"].items():
+        if name not in params:
+            if arg_def["mandatory"]:
+                return ERR_CODE_INVALID_PARAMS
+            continue
+        expected_type = arg_def["type"]
+        if not isinstance(expected_type, type):
+            expected_type = type(expected_type)
+        if expected_type is unicode:
+            expected_type = basestring
+        if not isinstance(params[name], expected_type):
+            return ERR_CODE_INVALID_PARAMS
+    return None
+
+
+class ErrorAggregator:
+    """
+    Log exceptions without flooding. Exceptions are identified by the type
+    and the locations in the traceback. The first occurrence is logged
+    with the traceback. Later ones are only counted and a summary of them
+    is logged at most once per 'summary_interval_sec' by the next
+    occurrence or by a background thread. Exceptions that haven't occurred
+    for 'idle_sec' are forgotten.
+    This object is thread-safe.
+    """
+    def __init__(self,
+                 summary_interval_sec=DEFAULT_ERROR_SUMMARY_INTERVAL_SEC,
+                 idle_sec=DEFAULT_ERROR_IDLE_SEC):
+        self.__summary_interval_sec = summary_interval_sec
+        self.__idle_sec = idle_sec
+        # fingerprint -> [the number of unlogged occurrences, last log time,
+        #                 last occurrence time]
+        self.__entries = {}
+        self.__lock = threading.Lock()
+        self.__flusher = None
+
+    def report(self, exctype, value, tb):
+        fingerprint = self.__get_fingerprint(exctype, tb)
+        now = time.time()
+        with self.__lock:
+            entry = self.__entries.get(fingerprint)
+            if entry is None:
+                self.__entries[fingerprint] = [0, now, now]
+            else:
+                entry[2] = now
+                entry[0] += 1
+                if now - entry[1] < self.__summary_interval_sec:
+                    self.__start_flusher()
+                    return
+                num_suppressed = entry[0]
+                entry[0] = 0
+                entry[1] = now
+        if entry is None:
+            logging.error("Unexpected error: %s, %s, %s" % \
+                          (exctype, value, traceback.format_tb(tb)))
+        else:
+            logging.error("Unexpected error: %s, %s (%d more occurrences)" %
+                          (exctype, value, num_suppressed))
+
+    def flush(self, force=True):
+        """
+        Log summaries of counted but not yet logged occurrences and forget
+        idle exceptions.
+        @param force
+        If False, only summaries that are due by 'summary_interval_sec'
+        are logged.
+        """
+        now = time.time()
+        summaries = []
+        with self.__lock:
+            for fingerprint, entry in self.__entries.items():
+                if entry[0] > 0:
+                    if force or \
+                       now - entry[1] >= self.__summary_interval_sec:
+                        summaries.append((fingerprint, entry[0]))
+                        entry[0] = 0
+                        entry[1] = now
+                elif now - entry[2] >= self.__idle_sec:
+                    del self.__entries[fingerprint]
+        for (exctype, locations), num_suppressed in summaries:
+            filename, lineno = locations[-1]
+            logging.error("Unexpected error: %s at %s:%d "
+                          "(%d more occurrences)" %
+                          (exctype, filename, lineno, num_suppressed))
+
+    def get_num_entries(self):
+        with self.__lock:
+            return len(self.__entries)
+
+    def __start_flusher(self):
+        # This is called with the lock held.
+        if self.__flusher is not None:
+            return
+        self.__flusher = threading.Thread(target=self.__run_flusher)
+        self.__flusher.daemon = True
+        self.__flusher.start()
+
+    def __run_flusher(self):
+        while True:
+            time.sleep(self.__summary_interval_sec)
+            try:
+                self.flush(force=False)
+            except:
+                # Don't use handle_exception() not to report to itself.
+                pass
+
+    def __get_fingerprint(self, exctype, tb):
+        locations = []
+        while tb is not None:
+            locations.append((tb.tb_frame.f_code.co_filename, tb.tb_lineno))
+            tb = tb.tb_next
+        return exctype, tuple(locations)
+
+
+error_aggregator = ErrorAggregator()
+# The tail of a burst would be lost without this.
+atexit.register(error_aggregator.flush)
+
 
 def handle_exception(raises=()):
     """
     Logging exception information including back trace and return
     some information. This method is supposed to be used in 'except:' block.
     Note that if the exception class is Signal, this method doesn't log it.
+    Repeated exceptions are aggregated by error_aggregator.
 
     @raises
     A sequence of exceptionclass names. If the handling exception is one of
@@ -152,11 +302,102 @@ def handle_exception(raises=()):
     if exctype in raises:
         raise
     if exctype is not Signal:
-        logging.error("Unexpected error: %s, %s, %s" % \
-                      (exctype, value, traceback.format_tb(tb)))
+        error_aggregator.report(exctype, value, tb)
     return exctype, value
 
 
+class QueueLogHandler(logging.Handler):
+    """
+    A log handler that passes records to other handlers on a background
+    thread through a bounded queue. So a slow handler doesn't block the
+    logging thread. When the queue is full, DEBUG records are dropped and
+    records of other levels wait for a space.
+    """
+    def __init__(self, handlers, max_queue_size=DEFAULT_LOG_QUEUE_SIZE):
+        """
+        @param handlers A list of handlers that actually emit records.
+        @param max_queue_size The maximum number of queued records.
+        """
+        logging.Handler.__init__(self)
+        self.__handlers = handlers
+        self.__queue = Queue.Queue(max_queue_size)
+        self.__num_dropped = 0
+        self.__num_dropped_lock = threading.Lock()
+        self.__num_reported_drops = 0
+        self.__thread = threading.Thread(target=self.__run)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def get_num_dropped(self):
+        with self.__num_dropped_lock:
+            return self.__num_dropped
+
+    def emit(self, record):
+        try:
+            self.__queue.put_nowait(record)
+        except Queue.Full:
+            if record.levelno <= logging.DEBUG:
+                # emit() is called from many threads.
+                with self.__num_dropped_lock:
+                    self.__num_dropped += 1
+            else:
+                self.__queue.put(record)
+
+    def close(self):
+        """
+        Emit the queued records and stop the background thread.
+        """
+        if self.__thread.is_alive():
+            self.__queue.put(None)
+            self.__thread.join()
+        for handler in self.__handlers:
+            handler.close()
+        logging.Handler.close(self)
+
+    def __run(self):
+        while True:
+            record = self.__queue.get()
+            if record is None:
+                return
+            self.__dispatch(record)
+            num_dropped = self.get_num_dropped()
+            if num_dropped != self.__num_reported_drops:
+                msg = "Dropped %d debug log records." % \
+                      (num_dropped - self.__num_reported_drops)
+                self.__num_reported_drops = num_dropped
+                self.__dispatch(logging.LogRecord(
+                    record.name, logging.WARNING, __file__, 0, msg, None,
+                    None))
+
+    def __dispatch(self, record):
+        for handler in self.__handlers:
+            if record.levelno < handler.level:
+                continue
+            try:
+                handler.handle(record)
+            except:
+                # The thread must keep running not to block emit().
+                self.handleError(record)
+
+
+def setup_queue_logging(max_queue_size=DEFAULT_LOG_QUEUE_SIZE):
+    """
+    Move the handlers of the root logger behind a QueueLogHandler. This
+    should be called after the handlers are configured, e.g., by
+    logging.basicConfig().
+    @param max_queue_size The maximum number of queued records.
+    @return The installed QueueLogHandler object.
+    """
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    for handler in handlers:
+        root.removeHandler(handler)
+    queue_handler = QueueLogHandler(handlers, max_queue_size)
+    root.addHandler(queue_handler)
+    atexit.register(queue_handler.close)
+    return queue_handler
+
+
 class Signal:
     """
     This class is supposed to raise as an exception in order to
@@ -223,7 +464,34 @@ class CommandQueue(Callback):
             self.__wait(0)
 
 
-class MonitoringServerInfo:
+class ValueObject(object):
+    """
+    A base class of slotted value objects. Objects are equal when they are
+    the same class and the values of all public slots are equal.
+    """
+    __slots__ = ()
+    __hash__ = None
+
+    def __values(self):
+        return tuple([getattr(self, name) for name in self.__slots__
+                      if not name.startswith("_")])
+
+    def __eq__(self, other):
+        return type(self) is type(other) and \
+            self.__values() == other.__values()
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+
+_NOT_DECODED = object()
+
+
+class MonitoringServerInfo(ValueObject):
+    __slots__ = ("server_id", "url", "type", "nick_name", "user_name",
+                 "password", "polling_interval_sec", "retry_interval_sec",
+                 "extended_info", "__extended_info_dict")
+
     def __init__(self, ms_info_dict):
         self.server_id = ms_info_dict["serverId"]
         self.url = ms_info_dict["url"]
@@ -234,9 +502,23 @@ class MonitoringServerInfo:
         self.polling_interval_sec = ms_info_dict["pollingIntervalSec"]
         self.retry_interval_sec = ms_info_dict["retryIntervalSec"]
         self.extended_info = ms_info_dict["extendedInfo"]
+        self.__extended_info_dict = _NOT_DECODED
+
+    @property
+    def extended_info_dict(self):
+        """
+        The JSON-decoded extended_info. It is decoded on the first access
+        and the result is reused after that. ValueError is raised if
+        extended_info is not valid JSON.
+        """
+        if self.__extended_info_dict is _NOT_DECODED:
+            self.__extended_info_dict = json.loads(self.extended_info)
+        return self.__extended_info_dict
 
 
-class ParsedMessage:
+class ParsedMessage(ValueObject):
+    __slots__ = ("error_code", "message_id", "message_dict", "error_message")
+
     def __init__(self):
         self.error_code = None
         self.message_id = None
@@ -248,7 +530,10 @@ class ParsedMessage:
                (self.error_code, self.message_id, self.error_message)
 
 
-class ArmInfo:
+class ArmInfo(ValueObject):
+    __slots__ = ("last_status", "failure_reason", "last_success_time",
+                 "last_failure_time", "num_success", "num_failure")
+
     def __init__(self):
         self.last_status = str()
         self.failure_reason = str()
@@ -273,10 +558,113 @@ class RabbitMQHapiConnector(RabbitMQConnector):
         RabbitMQConnector.setup(self, transporter_args)
 
 
+class TokenBucket:
+    """
+    A thread-safe token bucket. Tokens are refilled at 'rate' per second
+    up to 'capacity'.
+    """
+    def __init__(self, rate, capacity=None):
+        """
+        @param rate The number of tokens refilled per second.
+        @param capacity
+        The maximum number of tokens, that is, the allowed burst size.
+        If None, it is the same as 'rate'.
+        """
+        assert rate > 0
+        if capacity is None:
+            capacity = rate
+        self.__rate = float(rate)
+        self.__capacity = float(capacity)
+        self.__tokens = self.__capacity
+        self.__last_time = time.time()
+        self.__lock = threading.Lock()
+
+    def reserve(self, amount=1):
+        """
+        Take tokens without blocking. The bucket may run into debt, so that
+        a request larger than the capacity is also accepted.
+        @param amount The number of tokens to be taken.
+        @return
+        Seconds the caller should wait before using the tokens.
+        0 means that they are available now.
+        """
+        with self.__lock:
+            now = time.time()
+            elapsed = max(now - self.__last_time, 0)
+            self.__last_time = now
+            self.__tokens = min(self.__tokens + elapsed * self.__rate,
+                                self.__capacity)
+            self.__tokens -= amount
+            if self.__tokens >= 0:
+                return 0
+            return -self.__tokens / self.__rate
+
+
+class RateLimiter:
+    """
+    Limit the number of messages and bytes per second for each procedure.
+    """
+    def __init__(self):
+        self.__buckets = {}
+
+    def set_limit(self, procedure_name=None, msgs_per_sec=None,
+                  bytes_per_sec=None, burst_sec=1.0):
+        """
+        @param procedure_name
+        A procedure name to be limited. If None, the limit is applied to
+        procedures that don't have their own limit.
+        @param msgs_per_sec
+        The maximum number of messages per second. None means no limit.
+        @param bytes_per_sec
+        The maximum number of bytes per second. None means no limit.
+        @param burst_sec
+        The burst size of each bucket in seconds of its rate.
+        """
+        def create_bucket(rate):
+            if rate is None:
+                return None
+            return TokenBucket(rate, rate * burst_sec)
+
+        self.__buckets[procedure_name] = (create_bucket(msgs_per_sec),
+                                          create_bucket(bytes_per_sec))
+
+    def reserve(self, procedure_name, num_bytes):
+        """
+        Reserve a message without blocking. This is supposed to be used by
+        a caller that schedules sending by itself.
+        @param procedure_name A procedure name of the message.
+        @param num_bytes The size of the message.
+        @return Seconds to wait before sending the message.
+        """
+        buckets = self.__buckets.get(procedure_name)
+        if buckets is None:
+            buckets = self.__buckets.get(None)
+            if buckets is None:
+                return 0
+        msg_bucket, byte_bucket = buckets
+        wait_time = 0
+        if msg_bucket is not None:
+            wait_time = msg_bucket.reserve()
+        if byte_bucket is not None:
+            wait_time = max(wait_time, byte_bucket.reserve(num_bytes))
+        return wait_time
+
+    def acquire(self, procedure_name, num_bytes):
+        """
+        Block until the message can be sent.
+        @param procedure_name A procedure name of the message.
+        @param num_bytes The size of the message.
+        """
+        wait_time = self.reserve(procedure_name, num_bytes)
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
 class Sender:
     def __init__(self, transporter_args):
         transporter_args["direction"] = transporter.DIR_SEND
         self.__connector = transporter.Factory.create(transporter_args)
+        self.__rate_limiter = None
 
     def get_connector(self):
         return self.__connector
@@ -284,11 +672,25 @@ class Sender:
     def set_connector(self, connector):
         self.__connector = connector
 
+    def get_rate_limiter(self):
+        return self.__rate_limiter
+
+    def set_rate_limiter(self, rate_limiter):
+        """
+        @param rate_limiter
+        A RateLimiter object applied to requests and notifications.
+        If None, they are sent without limitation.
+        """
+        self.__rate_limiter = rate_limiter
+
     def request(self, procedure_name, params, request_id):
         body = {"jsonrpc": "2.0", "method": procedure_name, "params": params}
         if request_id is not None:
             body["id"] = request_id
-        self.__connector.call(json.dumps(body))
+        msg = json.dumps(body)
+        if self.__rate_limiter is not None:
+            self.__rate_limiter.acquire(procedure_name, len(msg))
+        self.__connector.call(msg)
 
     def response(self, result, response_id):
         response = json.dumps({"jsonrpc": "2.0", "result": result,
@@ -304,3 +706,457 @@ class Sender:
 
     def notify(self, procedure_name, params):
         self.request(procedure_name, params, request_id=None)
+
+
+class RequestIdGenerator:
+    """
+    A thread-safe generator of IDs for JSON-RPC requests.
+    """
+    def __init__(self, start=1):
+        self.__lock = threading.Lock()
+        self.__next_id = start
+
+    def __call__(self):
+        with self.__lock:
+            request_id = self.__next_id
+            self.__next_id += 1
+        return request_id
+
+
+class EventDeduplicator:
+    """
+    Drop events that were already sent. Recent event IDs are kept in two
+    generations of sets. When the current generation is full, the older
+    one is discarded. So the memory usage is bounded by twice of
+    'capacity' IDs. This object is thread-safe.
+    """
+    def __init__(self, capacity=DEFAULT_DEDUP_CAPACITY):
+        """
+        @param capacity
+        The number of IDs in a generation. At least this number of the
+        latest IDs are remembered.
+        """
+        assert capacity > 0
+        self.__capacity = capacity
+        self.__current = set()
+        self.__previous = set()
+        self.__num_dropped = 0
+        self.__lock = threading.Lock()
+
+    def get_num_dropped(self):
+        return self.__num_dropped
+
+    def filter(self, events):
+        """
+        @param events A list of events for putEvents.
+        @return
+        A list of events whose IDs are not seen. The order is kept.
+        The IDs of them are remembered.
+        """
+        fresh_events = []
+        with self.__lock:
+            for event in events:
+                event_id = event["eventId"]
+                if event_id in self.__current:
+                    continue
+                seen = event_id in self.__previous
+                self.__add(event_id)
+                if not seen:
+                    fresh_events.append(event)
+            self.__num_dropped += len(events) - len(fresh_events)
+        return fresh_events
+
+    def __add(self, event_id):
+        if len(self.__current) >= self.__capacity:
+            self.__previous = self.__current
+            self.__current = set()
+        self.__current.add(event_id)
+
+
+class ParallelFetcher:
+    """
+    Fetch data of many hosts concurrently and send the results as chunked
+    put requests such as putItems. The host list is partitioned and each
+    partition is fetched by a worker thread. Every chunk is tagged with
+    the same fetchId and all chunks except the last one have mayMoreFlag.
+    The last chunk is sent without mayMoreFlag even if some partitions
+    timed out or failed because the server completes the fetch only
+    with it. Such partitions are logged and returned instead.
+    """
+    def __init__(self, sender, fetch_func,
+                 max_workers=DEFAULT_MAX_FETCH_WORKERS,
+                 num_hosts_per_fetch=DEFAULT_NUM_HOSTS_PER_FETCH,
+                 timeout_sec=DEFAULT_FETCH_TIMEOUT_SEC,
+                 put_procedure="putItems", result_key="items",
+                 request_id_generator=None):
+        """
+        @param sender A Sender object used to send the results.
+        @param fetch_func
+        A callable that takes a list of host IDs and returns a list of
+        fetched objects. None is passed to fetch data of all hosts.
+        It is called from worker threads.
+        @param max_workers The maximum number of concurrent fetches.
+        @param num_hosts_per_fetch The number of hosts in a partition.
+        @param timeout_sec
+        A partition that doesn't complete within this time after its fetch
+        started is abandoned. The results are sent without it. The worker
+        fetching it is replaced and exits when the fetch returns.
+        @param put_procedure The procedure name to send the results.
+        @param result_key The parameter name of the results.
+        @param request_id_generator
+        A callable that returns a request ID. If None, a RequestIdGenerator
+        is used.
+        """
+        self.__sender = sender
+        self.__fetch_func = fetch_func
+        self.__max_workers = max_workers
+        self.__num_hosts_per_fetch = num_hosts_per_fetch
+        self.__timeout_sec = timeout_sec
+        self.__put_procedure = put_procedure
+        self.__result_key = result_key
+        if request_id_generator is None:
+            request_id_generator = RequestIdGenerator()
+        self.__generate_request_id = request_id_generator
+
+    def __call__(self, host_ids, fetch_id):
+        """
+        Fetch data of the given hosts and send them. This method returns
+        after the last chunk is sent.
+        @param host_ids
+        A list of host IDs. If it is None or empty, data of all hosts are
+        fetched at once.
+        @param fetch_id A fetch ID given by the fetch request.
+        @return
+        A list of partitions (lists of host IDs, or None for all hosts)
+        that timed out or failed. It is empty if the results are complete.
+        """
+        partitions = self.__partition(host_ids)
+        tasks = Queue.Queue()
+        results = Queue.Queue()
+        started = {}
+        started_lock = threading.Lock()
+        for index, partition in enumerate(partitions):
+            tasks.put((index, partition))
+
+        def start_worker():
+            worker = threading.Thread(target=self.__run_worker,
+                                      args=(tasks, results,
+                                            started, started_lock))
+            worker.daemon = True
+            worker.start()
+
+        for i in range(min(self.__max_workers, len(partitions))):
+            start_worker()
+
+        unfetched = []
+        pending = None
+        num_remaining = len(partitions)
+        while num_remaining > 0:
+            try:
+                index, fetched = results.get(
+                    timeout=self.__get_wait_time(started, started_lock))
+            except Queue.Empty:
+                for index in self.__pop_expired(started, started_lock):
+                    logging.warning("Fetch timed out: %s, hosts: %s" %
+                                    (fetch_id, partitions[index]))
+                    unfetched.append(partitions[index])
+                    num_remaining -= 1
+                    # The stalled thread is abandoned. Start another one
+                    # to keep the concurrency.
+                    start_worker()
+                continue
+
+            num_remaining -= 1
+            if fetched is None:
+                unfetched.append(partitions[index])
+                continue
+            if pending is not None:
+                self.__put(pending, fetch_id, may_more=True)
+            pending = fetched
+
+        if pending is None:
+            pending = []
+        self.__put(pending, fetch_id, may_more=False)
+        if unfetched:
+            logging.warning("Fetch is incomplete: %s, %d of %d partitions "
+                            "were not fetched." %
+                            (fetch_id, len(unfetched), len(partitions)))
+        return unfetched
+
+    def __partition(self, host_ids):
+        if not host_ids:
+            return [None]
+        size = self.__num_hosts_per_fetch
+        return [host_ids[i:i + size] for i in range(0, len(host_ids), size)]
+
+    def __run_worker(self, tasks, results, started, started_lock):
+        while True:
+            try:
+                index, partition = tasks.get(block=False)
+            except Queue.Empty:
+                return
+            with started_lock:
+                started[index] = time.time()
+            try:
+                fetched = self.__fetch_func(partition)
+            except:
+                handle_exception()
+                fetched = None
+            with started_lock:
+                abandoned = started.pop(index, None) is None
+            if abandoned:
+                # Another worker has replaced this one after the timeout.
+                # Taking another task would exceed max_workers.
+                return
+            results.put((index, fetched))
+
+    def __get_wait_time(self, started, started_lock):
+        with started_lock:
+            if not started:
+                return self.__timeout_sec
+            oldest = min(started.values())
+        return max(oldest + self.__timeout_sec - time.time(), 0)
+
+    def __pop_expired(self, started, started_lock):
+        now = time.time()
+        with started_lock:
+            expired = [index for index, start_time in started.items()
+                       if now - start_time >= self.__timeout_sec]
+            for index in expired:
+                del started[index]
+        return expired
+
+    def __put(self, fetched, fetch_id, may_more):
+        params = {self.__result_key: fetched, "fetchId": fetch_id,
+                  "mayMoreFlag": may_more}
+        self.__sender.request(self.__put_procedure, params,
+                              self.__generate_request_id())
+
+
+class EventPager:
+    """
+    Answer fetchEvents that may cover many pages. Pages of events are
+    fetched from the monitoring server by a background thread up to
+    'num_prefetch' pages ahead while the current page is being sent.
+    Each page is sent as a putEvents chunk with the same fetchId and all
+    chunks except the last one have mayMoreFlag.
+    """
+    def __init__(self, sender, fetch_func,
+                 num_prefetch=DEFAULT_NUM_PREFETCH_PAGES,
+                 page_size=MAX_EVENT_CHUNK_SIZE, deduplicate=False,
+                 request_id_generator=None):
+        """
+        @param sender A Sender object used to send the events.
+        @param fetch_func
+        A callable that takes 'last_info', 'count' and 'direction' like
+        fetchEvents and returns a list of events in the order of
+        'direction'. It is called from the prefetching thread.
+        @param num_prefetch The maximum number of prefetched pages.
+        @param page_size
+        The number of events in a page. It is limited to
+        MAX_EVENT_CHUNK_SIZE.
+        @param deduplicate
+        If True, events that were already sent in the same fetch, for
+        example because pages of the monitoring server overlap, are
+        dropped. Events sent by other fetches or by the poller are never
+        dropped because the server asked for them.
+        @param request_id_generator
+        A callable that returns a request ID. If None, a RequestIdGenerator
+        is used.
+        """
+        assert num_prefetch > 0
+        self.__sender = sender
+        self.__fetch_func = fetch_func
+        self.__num_prefetch = num_prefetch
+        self.__page_size = min(page_size, MAX_EVENT_CHUNK_SIZE)
+        self.__deduplicate = deduplicate
+        if request_id_generator is None:
+            request_id_generator = RequestIdGenerator()
+        self.__generate_request_id = request_id_generator
+
+    def __call__(self, last_info, count, direction, fetch_id):
+        """
+        Fetch events and send them. This method returns after the last
+        chunk is sent.
+        @param last_info
+        The ID of the event next to which events are fetched.
+        @param count The total number of events to be fetched.
+        @param direction "ASC" or "DESC".
+        @param fetch_id A fetch ID given by the fetch request.
+        @return
+        True if the events are fetched to the end. False if a fetch failed.
+        In that case, the last chunk is also sent without mayMoreFlag
+        because the server completes the fetch only with it.
+        """
+        pages = Queue.Queue(self.__num_prefetch)
+        stop_event = threading.Event()
+        # The prefetcher adds the lastInfo of a failed fetch.
+        failures = []
+        prefetcher = threading.Thread(
+            target=self.__run_prefetcher,
+            args=(last_info, count, direction, pages, stop_event, failures))
+        prefetcher.daemon = True
+        prefetcher.start()
+
+        event_deduplicator = None
+        if self.__deduplicate:
+            event_deduplicator = EventDeduplicator(capacity=max(count, 1))
+        pending = None
+        try:
+            while True:
+                page = pages.get()
+                if page is None:
+                    break
+                if event_deduplicator is not None:
+                    page = event_deduplicator.filter(page)
+                    if not page:
+                        continue
+                if pending is not None:
+                    self.__put(pending, fetch_id, may_more=True)
+                pending = page
+        finally:
+            stop_event.set()
+
+        if pending is None:
+            pending = []
+        self.__put(pending, fetch_id, may_more=False)
+        if failures:
+            logging.warning("Fetch is incomplete: %s, events after %s were "
+                            "not fetched." % (fetch_id, failures[0]))
+            return False
+        return True
+
+    def __run_prefetcher(self, last_info, count, direction, pages,
+                         stop_event, failures):
+        try:
+            while count > 0 and not stop_event.is_set():
+                num_requested = min(count, self.__page_size)
+                page = self.__fetch_func(last_info, num_requested, direction)
+                if page:
+                    self.__put_page(pages, page, stop_event)
+                if len(page) < num_requested:
+                    break
+                count -= len(page)
+                last_info = page[-1]["eventId"]
+        except:
+            handle_exception()
+            failures.append(last_info)
+        # None tells the end of the pages.
+        self.__put_page(pages, None, stop_event)
+
+    def __put_page(self, pages, page, stop_event):
+        while not stop_event.is_set():
+            try:
+                pages.put(page, timeout=1)
+                return
+            except Queue.Full:
+                pass
+
+    def __put(self, events, fetch_id, may_more):
+        params = {"events": events, "fetchId": fetch_id,
+                  "mayMoreFlag": may_more}
+        self.__sender.request("putEvents", params,
+                              self.__generate_request_id())
+
+
+class Profiler:
+    """
+    A profiler that can be started and stopped while the process is
+    running. In the default mode, cProfile is used and the stats are
+    written in the pstats format. Note that cProfile only profiles the
+    thread that starts it. In the sampling mode, stacks of all threads are
+    sampled periodically and the counts of them are written in the
+    collapsed stack format (one 'frame;frame;... count' per line).
+    """
+    def __init__(self, output_dir=".", sampling=False,
+                 sampling_interval_sec=DEFAULT_SAMPLING_INTERVAL_SEC):
+        """
+        @param output_dir A directory for output files.
+        @param sampling If True, the sampling mode is used.
+        @param sampling_interval_sec An interval of sampling in seconds.
+        """
+        self.__output_dir = output_dir
+        self.__sampling = sampling
+        self.__sampling_interval_sec = sampling_interval_sec
+        self.__profile = None
+        self.__sampler = None
+        self.__stop_event = None
+        self.__samples = {}
+
+    def is_running(self):
+        return self.__profile is not None or self.__sampler is not None
+
+    def start(self):
+        if self.is_running():
+            logging.warning("Profiler is already running.")
+            return
+        if self.__sampling:
+            self.__samples = {}
+            self.__stop_event = threading.Event()
+            self.__sampler = threading.Thread(target=self.__run_sampler)
+            self.__sampler.daemon = True
+            self.__sampler.start()
+        else:
+            self.__profile = cProfile.Profile()
+            self.__profile.enable()
+        logging.info("Profiler started.")
+
+    def stop(self):
+        """
+        Stop profiling and write the result to a file whose name has the
+        current time and the process ID.
+        @return The path of the output file. None if not running.
+        """
+        if not self.is_running():
+            logging.warning("Profiler is not running.")
+            return None
+        name = "hap2-%s-%d" % (time.strftime("%Y%m%d-%H%M%S"), os.getpid())
+        if self.__sampling:
+            self.__stop_event.set()
+            self.__sampler.join()
+            self.__sampler = None
+            path = os.path.join(self.__output_dir, name + ".stacks")
+            with open(path, "w") as f:
+                for stack, count in sorted(self.__samples.items()):
+                    f.write("%s %d\n" % (stack, count))
+        else:
+            self.__profile.disable()
+            path = os.path.join(self.__output_dir, name + ".prof")
+            self.__profile.dump_stats(path)
+            self.__profile = None
+        logging.info("Profiler stopped: %s" % path)
+        return path
+
+    def install_signal_handlers(self, start_signal=signal.SIGUSR1,
+                                stop_signal=signal.SIGUSR2):
+        """
+        Start and stop profiling by signals. This method has to be called
+        from the main thread.
+        """
+        signal.signal(start_signal, lambda signum, frame: self.start())
+        signal.signal(stop_signal, lambda signum, frame: self.stop())
+
+    def sample(self):
+        """
+        Record the current stacks of all threads except the caller.
+        """
+        names = dict([(thread.ident, thread.name)
+                      for thread in threading.enumerate()])
+        current_ident = threading.current_thread().ident
+        for ident, frame in sys._current_frames().items():
+            if ident == current_ident:
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                filename = os.path.basename(code.co_filename)
+                frames.append("%s (%s:%d)" % (code.co_name, filename,
+                                              frame.f_lineno))
+                frame = frame.f_back
+            frames.append(names.get(ident, str(ident)))
+            stack = ";".join(reversed(frames))
+            self.__samples[stack] = self.__samples.get(stack, 0) + 1
+
+    def __run_sampler(self):
+        while not self.__stop_event.wait(self.__sampling_interval_sec):
+            self.sample()
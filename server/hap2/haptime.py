@@ -0,0 +1,204 @@
+#! /usr/bin/env python
+"""
+  Copyright (C) 2015 Project Hatohol
+
+  This file is part of Hatohol.
+
+  Hatohol is free software: you can redistribute it and/or modify
+  it under the terms of the GNU Lesser General Public License, version 3
+  as published by the Free Software Foundation.
+
+  Hatohol is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+  GNU Lesser General Public License for more details.
+
+  You should have received a copy of the GNU Lesser General Public
+  License along with Hatohol. If not, see
+  <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+import time
+import calendar
+import argparse
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Conversion between times in the HAPI format (YYYYMMDDhhmmss.nnnnnnnnn
+# in UTC) and integer nanoseconds since the epoch. Formatting caches the
+# string of each second. Parsing caches the date part and computes the
+# rest arithmetically.
+
+NSEC_PER_SEC = 1000000000
+SEC_PER_DAY = 86400
+TIME_STRING_LENGTH = 24
+MAX_CACHE_SIZE = 4096
+
+_format_cache = {}
+_parse_cache = {}
+
+
+def format_time(nsec):
+    """
+    @param nsec Nanoseconds since the epoch.
+    @return A time string in the HAPI format.
+    """
+    sec, frac = divmod(nsec, NSEC_PER_SEC)
+    prefix = _format_cache.get(sec)
+    if prefix is None:
+        prefix = time.strftime("%Y%m%d%H%M%S", time.gmtime(sec))
+        if len(_format_cache) >= MAX_CACHE_SIZE:
+            _format_cache.clear()
+        _format_cache[sec] = prefix
+    return "%s.%09d" % (prefix, frac)
+
+
+def parse_time(time_str):
+    """
+    @param time_str
+    A time string in the HAPI format. The fraction part may be shorter
+    than 9 digits or omitted.
+    @return Nanoseconds since the epoch.
+    """
+    date_str = time_str[:8]
+    day_sec = _parse_cache.get(date_str)
+    if day_sec is None:
+        day_sec = calendar.timegm((int(date_str[0:4]), int(date_str[4:6]),
+                                   int(date_str[6:8]), 0, 0, 0, 0, 0, 0))
+        if len(_parse_cache) >= MAX_CACHE_SIZE:
+            _parse_cache.clear()
+        _parse_cache[date_str] = day_sec
+    sec = day_sec + int(time_str[8:10]) * 3600 + \
+        int(time_str[10:12]) * 60 + int(time_str[12:14])
+    nsec = sec * NSEC_PER_SEC
+    frac = time_str[15:TIME_STRING_LENGTH]
+    if frac:
+        nsec += int(frac.ljust(9, "0"))
+    return nsec
+
+
+def format_times(nsecs, use_numpy=None):
+    """
+    @param nsecs A sequence of nanoseconds since the epoch.
+    @param use_numpy
+    If True, NumPy is used. If False, it isn't. If None, it is used when
+    available.
+    @return A list of time strings in the HAPI format.
+    """
+    if _should_use_numpy(use_numpy):
+        return _format_times_numpy(nsecs)
+    return [format_time(nsec) for nsec in nsecs]
+
+
+def parse_times(time_strs, use_numpy=None):
+    """
+    @param time_strs A sequence of time strings in the HAPI format.
+    @param use_numpy The same as that of format_times().
+    @return A list of nanoseconds since the epoch.
+    """
+    if _should_use_numpy(use_numpy):
+        return _parse_times_numpy(time_strs)
+    return [parse_time(time_str) for time_str in time_strs]
+
+
+def _should_use_numpy(use_numpy):
+    if use_numpy is None:
+        return numpy is not None
+    if use_numpy and numpy is None:
+        raise ImportError("NumPy is not available.")
+    return use_numpy
+
+
+# The positions of digits in "YYYY-MM-DDThh:mm:ss".
+_ISO_DIGIT_COLUMNS = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]
+_ISO_TEMPLATE = "0000-00-00T00:00:00"
+_FRAC_DIVISORS = [10 ** i for i in range(8, -1, -1)]
+
+
+def _format_times_numpy(nsecs):
+    nsecs = numpy.asarray(nsecs, dtype=numpy.int64)
+    if nsecs.size == 0:
+        return []
+    secs = nsecs // NSEC_PER_SEC
+    fracs = nsecs - secs * NSEC_PER_SEC
+    iso = numpy.datetime_as_string(secs.astype("datetime64[s]"))
+    iso_chars = iso.astype("S19").view(numpy.uint8).reshape(-1, 19)
+
+    chars = numpy.empty((len(nsecs), TIME_STRING_LENGTH), dtype=numpy.uint8)
+    chars[:, :14] = iso_chars[:, _ISO_DIGIT_COLUMNS]
+    chars[:, 14] = ord(".")
+    divisors = numpy.array(_FRAC_DIVISORS, dtype=numpy.int64)
+    chars[:, 15:] = fracs[:, None] // divisors % 10 + ord("0")
+    return chars.view("S%d" % TIME_STRING_LENGTH).ravel().tolist()
+
+
+def _parse_times_numpy(time_strs):
+    strs = numpy.array(time_strs, dtype="S%d" % TIME_STRING_LENGTH)
+    if strs.size == 0:
+        return []
+    chars = strs.view(numpy.uint8).reshape(-1, TIME_STRING_LENGTH)
+
+    iso_chars = numpy.empty((len(strs), 19), dtype=numpy.uint8)
+    iso_chars[:] = numpy.frombuffer(_ISO_TEMPLATE, dtype=numpy.uint8)
+    iso_chars[:, _ISO_DIGIT_COLUMNS] = chars[:, :14]
+    secs = iso_chars.view("S19").ravel().astype("datetime64[s]")
+
+    # Missing digits of the fraction are padded with NUL by NumPy.
+    frac_chars = chars[:, 15:]
+    digits = frac_chars.astype(numpy.int64) - ord("0")
+    digits[frac_chars == 0] = 0
+    divisors = numpy.array(_FRAC_DIVISORS, dtype=numpy.int64)
+    fracs = (digits * divisors).sum(axis=1)
+    return (secs.astype(numpy.int64) * NSEC_PER_SEC + fracs).tolist()
+
+
+def _format_time_without_cache(nsec):
+    sec, frac = divmod(nsec, NSEC_PER_SEC)
+    return time.strftime("%Y%m%d%H%M%S", time.gmtime(sec)) + ".%09d" % frac
+
+
+def _benchmark(label, func, arg):
+    start = time.time()
+    func(arg)
+    elapsed = time.time() - start
+    print "%-28s %8.3f sec (%.0f /sec)" % (label, elapsed,
+                                            len(arg) / max(elapsed, 1e-9))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Benchmark conversion of HAPI time strings.")
+    parser.add_argument("--num-samples", type=int, default=100000)
+    parser.add_argument("--interval-sec", type=float, default=60,
+                        help="The interval between samples.")
+    args = parser.parse_args(argv)
+
+    begin = int(time.time()) * NSEC_PER_SEC
+    step = int(args.interval_sec * NSEC_PER_SEC)
+    nsecs = [begin + i * step for i in range(args.num_samples)]
+    time_strs = format_times(nsecs, use_numpy=False)
+
+    _benchmark("format: strftime",
+               lambda a: [_format_time_without_cache(n) for n in a], nsecs)
+    _benchmark("format: cached second",
+               lambda a: format_times(a, use_numpy=False), nsecs)
+    _benchmark("parse: strptime",
+               lambda a: [calendar.timegm(time.strptime(s[:14],
+                                                        "%Y%m%d%H%M%S"))
+                          for s in a], time_strs)
+    _benchmark("parse: cached date",
+               lambda a: parse_times(a, use_numpy=False), time_strs)
+    if numpy is None:
+        print "NumPy is not available."
+        return
+    _benchmark("format: NumPy", lambda a: format_times(a, use_numpy=True),
+               nsecs)
+    _benchmark("parse: NumPy", lambda a: parse_times(a, use_numpy=True),
+               time_strs)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
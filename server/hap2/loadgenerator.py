@@ -0,0 +1,438 @@
+#!/usr/bin/env python
+"""
+  Copyright (C) 2015 Project Hatohol
+
+  This file is part of Hatohol.
+
+  Hatohol is free software: you can redistribute it and/or modify
+  it under the terms of the GNU Lesser General Public License, version 3
+  as published by the Free Software Foundation.
+
+  Hatohol is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+  GNU Lesser General Public License for more details.
+
+  You should have received a copy of the GNU Lesser General Public
+  License along with Hatohol. If not, see
+  <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+import time
+import json
+import random
+import logging
+import argparse
+import threading
+import collections
+import haplib
+import haptime
+import downsampler
+import transporter
+
+TRIGGER_SEVERITIES = ("INFO", "WARNING", "ERROR", "CRITICAL", "EMERGENCY")
+MAX_KEPT_EVENTS = 100000
+IMPLEMENTED_PROCEDURES = ("exchangeProfile", "fetchItems", "fetchHistory",
+                          "fetchTriggers", "fetchEvents")
+
+
+def format_time(sec):
+    """
+    @param sec Seconds since the epoch.
+    @return A time string in the HAPI format: YYYYMMDDhhmmss.nnnnnnnnn
+    """
+    return haptime.format_time(to_nsec(sec))
+
+
+def parse_time(time_str):
+    """
+    @param time_str A time string in the HAPI format.
+    @return Seconds since the epoch.
+    """
+    return haptime.parse_time(time_str) / float(haptime.NSEC_PER_SEC)
+
+
+def to_nsec(sec):
+    return int(sec) * haptime.NSEC_PER_SEC + \
+        int(round((sec - int(sec)) * haptime.NSEC_PER_SEC))
+
+
+class SimulatedMonitoringServer:
+    """
+    Hosts, items, triggers and events of a virtual monitoring server.
+    The data are built in the HAPI format of the put procedures.
+    """
+    def __init__(self, server_id, num_hosts, num_items_per_host,
+                 num_triggers_per_host, seed=None):
+        self.server_id = server_id
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.__hosts = []
+        self.__items = collections.OrderedDict()
+        self.__triggers = collections.OrderedDict()
+        self.__events = collections.deque(maxlen=MAX_KEPT_EVENTS)
+        self.__next_event_id = 1
+
+        now = format_time(time.time())
+        for host_idx in range(num_hosts):
+            host_id = "%d" % (host_idx + 1)
+            host_name = "server%d-host%d" % (server_id, host_idx + 1)
+            self.__hosts.append({"hostId": host_id, "hostName": host_name})
+            self.__items[host_id] = [
+                {"itemId": "%s-%d" % (host_id, item_idx + 1),
+                 "hostId": host_id,
+                 "brief": "item %d" % (item_idx + 1),
+                 "lastValueTime": now,
+                 "lastValue": "%.3f" % self.__random.random(),
+                 "itemGroupName": "group %d" % (item_idx % 4),
+                 "unit": "%"}
+                for item_idx in range(num_items_per_host)]
+            for trigger_idx in range(num_triggers_per_host):
+                trigger_id = "%s-%d" % (host_id, trigger_idx + 1)
+                self.__triggers[trigger_id] = {
+                    "triggerId": trigger_id,
+                    "status": "OK",
+                    "severity": self.__random.choice(TRIGGER_SEVERITIES),
+                    "lastChangeTime": now,
+                    "hostId": host_id,
+                    "hostName": host_name,
+                    "brief": "trigger %d" % (trigger_idx + 1),
+                    "extendedInfo": ""}
+
+    def get_hosts(self):
+        return list(self.__hosts)
+
+    def get_items(self, host_ids=None):
+        if host_ids is None:
+            host_ids = self.__items.keys()
+        items = []
+        for host_id in host_ids:
+            items.extend(self.__items.get(host_id, []))
+        return items
+
+    def get_history(self, item_id, begin_time, end_time, interval_sec=60):
+        begin = haptime.parse_time(begin_time)
+        end = haptime.parse_time(end_time)
+        step = to_nsec(interval_sec)
+        times = haptime.format_times(range(begin, end + 1, step))
+        return [{"value": "%.3f" % self.__random.random(), "time": t}
+                for t in times]
+
+    def get_triggers(self, host_ids=None):
+        with self.__lock:
+            triggers = [dict(trigger) for trigger in self.__triggers.values()]
+        if host_ids is None:
+            return triggers
+        host_id_set = set(host_ids)
+        return [trigger for trigger in triggers
+                if trigger["hostId"] in host_id_set]
+
+    def get_events(self, last_info, count, direction):
+        """
+        @param last_info An event ID given as lastInfo.
+        @param count The maximum number of events.
+        @param direction "ASC" or "DESC".
+        @return
+        Events after last_info in ascending order for "ASC" and events
+        before it in descending order for "DESC".
+        """
+        last_id = int(last_info) if last_info else 0
+        with self.__lock:
+            events = list(self.__events)
+        if direction == "DESC":
+            events = [event for event in reversed(events)
+                      if last_id == 0 or int(event["eventId"]) < last_id]
+        else:
+            events = [event for event in events
+                      if int(event["eventId"]) > last_id]
+        return events[:count]
+
+    def churn_triggers(self, num_triggers):
+        """
+        Flip the status of randomly chosen triggers and generate events
+        for them.
+        @param num_triggers The number of triggers to be changed.
+        @return A sequence of changed triggers and generated events.
+        """
+        changed_triggers = []
+        events = []
+        if not self.__triggers:
+            return changed_triggers, events
+        now = format_time(time.time())
+        with self.__lock:
+            trigger_ids = self.__triggers.keys()
+            for i in range(num_triggers):
+                trigger = \
+                    self.__triggers[self.__random.choice(trigger_ids)]
+                trigger["status"] = \
+                    "NG" if trigger["status"] == "OK" else "OK"
+                trigger["lastChangeTime"] = now
+                changed_triggers.append(dict(trigger))
+                events.append(self.__create_event(trigger, now))
+        return changed_triggers, events
+
+    def __create_event(self, trigger, event_time):
+        event = {"eventId": "%d" % self.__next_event_id,
+                 "time": event_time,
+                 "type": "BAD" if trigger["status"] == "NG" else "GOOD",
+                 "triggerId": trigger["triggerId"],
+                 "status": trigger["status"],
+                 "severity": trigger["severity"],
+                 "hostId": trigger["hostId"],
+                 "hostName": trigger["hostName"],
+                 "brief": trigger["brief"],
+                 "extendedInfo": ""}
+        self.__next_event_id += 1
+        self.__events.append(event)
+        return event
+
+
+class RequestHandler:
+    """
+    A receiver that answers requests from the Hatohol server with
+    the data of a SimulatedMonitoringServer.
+    """
+    def __init__(self, server, sender, max_fetch_workers):
+        """
+        @param server A SimulatedMonitoringServer object.
+        @param sender A Sender object to send responses and data.
+        @param max_fetch_workers
+        The maximum number of concurrent fetches for fetchItems.
+        """
+        self.__server = server
+        self.__sender = sender
+        self.__generate_request_id = haplib.RequestIdGenerator()
+        self.__item_fetcher = haplib.ParallelFetcher(
+            sender, server.get_items, max_workers=max_fetch_workers,
+            request_id_generator=self.__generate_request_id)
+        self.__event_pager = haplib.EventPager(
+            sender, server.get_events,
+            deduplicate=True,
+            request_id_generator=self.__generate_request_id)
+        self.__handlers = {
+            "exchangeProfile": self.__exchange_profile,
+            "fetchItems": self.__fetch_items,
+            "fetchHistory": self.__fetch_history,
+            "fetchTriggers": self.__fetch_triggers,
+            "fetchEvents": self.__fetch_events,
+        }
+
+    def __call__(self, channel, msg):
+        try:
+            self.handle(msg)
+        except:
+            haplib.handle_exception()
+
+    def handle(self, msg):
+        try:
+            msg_dict = json.loads(msg)
+        except ValueError:
+            self.__sender.error(haplib.ERR_CODE_PARSER_ERROR, None)
+            return
+        procedure_name = msg_dict.get("method")
+        if procedure_name is None:
+            # A response for a request from this generator.
+            return
+        request_id = msg_dict.get("id")
+        params = msg_dict.get("params", {})
+        handler = self.__handlers.get(procedure_name)
+        if handler is None:
+            self.__sender.error(haplib.ERR_CODE_METHOD_NOT_FOUND, request_id)
+            return
+        error_code = haplib.validate_arguments(procedure_name, params)
+        if error_code is not None:
+            self.__sender.error(error_code, request_id)
+            return
+        handler(params, request_id)
+
+    def __exchange_profile(self, params, request_id):
+        self.__sender.response({"name": "hap2-load-generator",
+                                "procedures": list(IMPLEMENTED_PROCEDURES)},
+                               request_id)
+
+    def __fetch_items(self, params, request_id):
+        self.__sender.response("SUCCESS", request_id)
+        self.__item_fetcher(params.get("hostIds"), params["fetchId"])
+
+    def __fetch_history(self, params, request_id):
+        self.__sender.response("SUCCESS", request_id)
+        histories = self.__server.get_history(params["itemId"],
+                                              params["beginTime"],
+                                              params["endTime"])
+        histories = downsampler.downsample_histories(
+            histories, params.get("maxPoints"))
+        self.__put("putHistory", {"itemId": params["itemId"],
+                                  "histories": histories,
+                                  "fetchId": params["fetchId"]})
+
+    def __fetch_triggers(self, params, request_id):
+        self.__sender.response("SUCCESS", request_id)
+        triggers = self.__server.get_triggers(params.get("hostIds"))
+        self.__put("putTriggers", {"triggers": triggers,
+                                   "updateType": "ALL",
+                                   "fetchId": params["fetchId"]})
+
+    def __fetch_events(self, params, request_id):
+        self.__sender.response("SUCCESS", request_id)
+        self.__event_pager(params["lastInfo"], params["count"],
+                           params["direction"], params["fetchId"])
+
+    def __put(self, procedure_name, params):
+        self.__sender.request(procedure_name, params,
+                              self.__generate_request_id())
+
+
+class LoadGenerator:
+    """
+    Drive a SimulatedMonitoringServer: send the initial data, answer
+    fetch requests and send trigger changes and events periodically.
+    """
+    def __init__(self, server, transporter_args, event_rate,
+                 max_fetch_workers=haplib.DEFAULT_MAX_FETCH_WORKERS,
+                 interval_sec=1.0):
+        """
+        @param server A SimulatedMonitoringServer object.
+        @param transporter_args
+        Arguments for transporters. 'amqp_hapi_queue' is set to the
+        queue name of the server.
+        @param event_rate
+        The number of trigger changes per second. Each change generates
+        an event.
+        @param max_fetch_workers
+        The maximum number of concurrent fetches for fetchItems.
+        @param interval_sec The interval to send generated data.
+        """
+        self.__server = server
+        self.__event_rate = event_rate
+        self.__interval_sec = interval_sec
+        self.__generate_request_id = haplib.RequestIdGenerator()
+        self.__num_sent_events = 0
+        self.__stop_event = threading.Event()
+
+        queue_name = "hapi2.%d" % server.server_id
+        send_args = dict(transporter_args, amqp_hapi_queue=queue_name)
+        self.__sender = haplib.Sender(send_args)
+
+        reply_args = dict(transporter_args, amqp_hapi_queue=queue_name)
+        reply_sender = haplib.Sender(reply_args)
+        recv_args = dict(transporter_args, amqp_hapi_queue=queue_name,
+                         direction=transporter.DIR_RECV)
+        self.__receiver = transporter.Factory.create(recv_args)
+        self.__receiver.set_receiver(
+            RequestHandler(server, reply_sender, max_fetch_workers))
+
+    def get_num_sent_events(self):
+        return self.__num_sent_events
+
+    def start(self):
+        receiver_thread = threading.Thread(
+            target=self.__receiver.run_receive_loop)
+        receiver_thread.daemon = True
+        receiver_thread.start()
+
+        self.__put("exchangeProfile",
+                   {"name": "hap2-load-generator",
+                    "procedures": list(IMPLEMENTED_PROCEDURES)})
+        self.__put("putHosts", {"hosts": self.__server.get_hosts(),
+                                "updateType": "ALL"})
+        self.__put("putTriggers", {"triggers": self.__server.get_triggers(),
+                                   "updateType": "ALL"})
+
+        poller_thread = threading.Thread(target=self.__run_poll_loop)
+        poller_thread.daemon = True
+        poller_thread.start()
+
+    def stop(self):
+        self.__stop_event.set()
+
+    def __run_poll_loop(self):
+        num_pending = 0.0
+        while not self.__stop_event.wait(self.__interval_sec):
+            num_pending += self.__event_rate * self.__interval_sec
+            num_changes = int(num_pending)
+            num_pending -= num_changes
+            if num_changes == 0:
+                continue
+            try:
+                self.__send_changes(num_changes)
+            except:
+                haplib.handle_exception()
+
+    def __send_changes(self, num_changes):
+        triggers, events = self.__server.churn_triggers(num_changes)
+        if not triggers:
+            return
+        self.__put("putTriggers", {"triggers": triggers,
+                                   "updateType": "UPDATED",
+                                   "lastInfo": events[-1]["eventId"]})
+        for i in range(0, len(events), haplib.MAX_EVENT_CHUNK_SIZE):
+            chunk = events[i:i + haplib.MAX_EVENT_CHUNK_SIZE]
+            self.__put("putEvents", {"events": chunk,
+                                     "lastInfo": chunk[-1]["eventId"]})
+        self.__num_sent_events += len(events)
+
+    def __put(self, procedure_name, params):
+        self.__sender.request(procedure_name, params,
+                              self.__generate_request_id())
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Simulate monitoring servers connected via HAPI 2.0.")
+    parser.add_argument("--num-servers", type=int, default=1)
+    parser.add_argument("--server-id-base", type=int, default=1,
+                        help="The server ID of the first simulated server.")
+    parser.add_argument("--num-hosts", type=int, default=100,
+                        help="The number of hosts per server.")
+    parser.add_argument("--num-items-per-host", type=int, default=10)
+    parser.add_argument("--num-triggers-per-host", type=int, default=5)
+    parser.add_argument("--event-rate", type=float, default=1.0,
+                        help="Trigger changes (events) per second "
+                             "per server.")
+    parser.add_argument("--max-fetch-workers", type=int,
+                        default=haplib.DEFAULT_MAX_FETCH_WORKERS)
+    parser.add_argument("--duration", type=float, default=None,
+                        help="Seconds to run. Runs until interrupted "
+                             "if omitted.")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--log-level", type=str, default="INFO",
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    haplib.RabbitMQHapiConnector.define_arguments(parser)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=getattr(logging, args.log_level))
+    haplib.setup_queue_logging()
+
+    transporter_args = haplib.RabbitMQHapiConnector.parse_arguments(args)
+    transporter_args["class"] = haplib.RabbitMQHapiConnector
+
+    generators = []
+    for i in range(args.num_servers):
+        server = SimulatedMonitoringServer(
+            args.server_id_base + i, args.num_hosts,
+            args.num_items_per_host, args.num_triggers_per_host,
+            seed=None if args.seed is None else args.seed + i)
+        generator = LoadGenerator(server, transporter_args, args.event_rate,
+                                  max_fetch_workers=args.max_fetch_workers)
+        generator.start()
+        generators.append(generator)
+    logging.info("Started %d simulated servers." % len(generators))
+
+    start_time = time.time()
+    try:
+        while args.duration is None or \
+              time.time() - start_time < args.duration:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    for generator in generators:
+        generator.stop()
+
+    elapsed = time.time() - start_time
+    num_events = sum([g.get_num_sent_events() for g in generators])
+    logging.info("Sent %d events in %.1f sec (%.1f events/sec)." %
+                 (num_events, elapsed, num_events / elapsed))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
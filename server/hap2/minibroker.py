@@ -0,0 +1,757 @@
+#!/usr/bin/env python
+"""
+  Copyright (C) 2015 Project Hatohol
+
+  This file is part of Hatohol.
+
+  Hatohol is free software: you can redistribute it and/or modify
+  it under the terms of the GNU Lesser General Public License, version 3
+  as published by the Free Software Foundation.
+
+  Hatohol is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+  GNU Lesser General Public License for more details.
+
+  You should have received a copy of the GNU Lesser General Public
+  License along with Hatohol. If not, see
+  <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+import time
+import uuid
+import socket
+import struct
+import logging
+import argparse
+import threading
+import collections
+import Queue
+
+# This module implements a small subset of AMQP 0-9-1 that is enough for
+# pika's BlockingConnection used by RabbitMQConnector. It is a stand-in of
+# RabbitMQ for tests and benchmarks. Only the default exchange is supported.
+
+PROTOCOL_HEADER = "AMQP\x00\x00\x09\x01"
+FRAME_METHOD = 1
+FRAME_HEADER = 2
+FRAME_BODY = 3
+FRAME_HEARTBEAT = 8
+FRAME_END = "\xce"
+FRAME_HEADER_STRUCT = struct.Struct("!BHI")
+FRAME_MAX = 131072
+
+CONNECTION_START = (10, 10)
+CONNECTION_START_OK = (10, 11)
+CONNECTION_TUNE = (10, 30)
+CONNECTION_TUNE_OK = (10, 31)
+CONNECTION_OPEN = (10, 40)
+CONNECTION_OPEN_OK = (10, 41)
+CONNECTION_CLOSE = (10, 50)
+CONNECTION_CLOSE_OK = (10, 51)
+CHANNEL_OPEN = (20, 10)
+CHANNEL_OPEN_OK = (20, 11)
+CHANNEL_CLOSE = (20, 40)
+CHANNEL_CLOSE_OK = (20, 41)
+QUEUE_DECLARE = (50, 10)
+QUEUE_DECLARE_OK = (50, 11)
+QUEUE_PURGE = (50, 30)
+QUEUE_PURGE_OK = (50, 31)
+QUEUE_DELETE = (50, 40)
+QUEUE_DELETE_OK = (50, 41)
+BASIC_QOS = (60, 10)
+BASIC_QOS_OK = (60, 11)
+BASIC_CONSUME = (60, 20)
+BASIC_CONSUME_OK = (60, 21)
+BASIC_CANCEL = (60, 30)
+BASIC_CANCEL_OK = (60, 31)
+BASIC_PUBLISH = (60, 40)
+BASIC_DELIVER = (60, 60)
+BASIC_GET = (60, 70)
+BASIC_GET_OK = (60, 71)
+BASIC_GET_EMPTY = (60, 72)
+BASIC_ACK = (60, 80)
+BASIC_REJECT = (60, 90)
+BASIC_NACK = (60, 120)
+CONFIRM_SELECT = (85, 10)
+CONFIRM_SELECT_OK = (85, 11)
+
+REPLY_NOT_FOUND = 404
+REPLY_COMMAND_INVALID = 503
+REPLY_NOT_IMPLEMENTED = 540
+
+
+class _ConnectionClosed(Exception):
+    pass
+
+
+class _ChannelError(Exception):
+    def __init__(self, reply_code, reply_text):
+        Exception.__init__(self, reply_text)
+        self.reply_code = reply_code
+        self.reply_text = reply_text
+
+
+class _ArgumentReader:
+    def __init__(self, payload, offset=0):
+        self.__payload = payload
+        self.__offset = offset
+
+    def __unpack(self, fmt):
+        size = struct.calcsize(fmt)
+        values = struct.unpack_from(fmt, self.__payload, self.__offset)
+        self.__offset += size
+        return values[0]
+
+    def octet(self):
+        return self.__unpack("!B")
+
+    def short(self):
+        return self.__unpack("!H")
+
+    def long(self):
+        return self.__unpack("!I")
+
+    def longlong(self):
+        return self.__unpack("!Q")
+
+    def shortstr(self):
+        length = self.octet()
+        value = self.__payload[self.__offset:self.__offset + length]
+        self.__offset += length
+        return value
+
+    def longstr(self):
+        length = self.long()
+        value = self.__payload[self.__offset:self.__offset + length]
+        self.__offset += length
+        return value
+
+    def bits(self, num):
+        value = self.octet()
+        return [bool(value & (1 << i)) for i in range(num)]
+
+    def table(self):
+        # The contents of tables sent by clients aren't used.
+        return self.longstr()
+
+
+def _shortstr(value):
+    if isinstance(value, unicode):
+        value = value.encode("utf-8")
+    return struct.pack("!B", len(value)) + value
+
+
+def _longstr(value):
+    if isinstance(value, unicode):
+        value = value.encode("utf-8")
+    return struct.pack("!I", len(value)) + value
+
+
+def _bits(*flags):
+    value = 0
+    for i, flag in enumerate(flags):
+        if flag:
+            value |= 1 << i
+    return struct.pack("!B", value)
+
+
+def _table(table):
+    encoded = []
+    for key, value in table.items():
+        encoded.append(_shortstr(key))
+        if isinstance(value, bool):
+            encoded.append("t" + struct.pack("!B", value))
+        elif isinstance(value, dict):
+            encoded.append("F" + _table(value))
+        else:
+            encoded.append("S" + _longstr(value))
+    return _longstr("".join(encoded))
+
+
+def _frame(frame_type, channel_id, payload):
+    return FRAME_HEADER_STRUCT.pack(frame_type, channel_id, len(payload)) + \
+        payload + FRAME_END
+
+
+def _method_frame(channel_id, method, args=""):
+    return _frame(FRAME_METHOD, channel_id, struct.pack("!HH", *method) + args)
+
+
+class _Message:
+    __slots__ = ("routing_key", "properties", "body", "redelivered")
+
+    def __init__(self, routing_key, properties, body):
+        self.routing_key = routing_key
+        self.properties = properties
+        self.body = body
+        self.redelivered = False
+
+
+class _Consumer:
+    __slots__ = ("channel", "tag", "queue", "no_ack")
+
+    def __init__(self, channel, tag, queue, no_ack):
+        self.channel = channel
+        self.tag = tag
+        self.queue = queue
+        self.no_ack = no_ack
+
+
+class _Queue:
+    def __init__(self, name):
+        self.name = name
+        self.messages = collections.deque()
+        self.consumers = []
+        self.next_consumer_idx = 0
+
+
+class _Channel:
+    def __init__(self, connection, channel_id):
+        self.connection = connection
+        self.channel_id = channel_id
+        self.prefetch_count = 0
+        self.consumers = {}
+        self.unacked = collections.OrderedDict()
+        self.next_delivery_tag = 1
+        self.confirm_mode = False
+        self.next_publish_seq = 1
+        self.closing = False
+        self.publishing = None
+        self.body_size = 0
+        self.body_parts = []
+
+    def can_deliver(self, consumer):
+        return consumer.no_ack or self.prefetch_count == 0 or \
+            len(self.unacked) < self.prefetch_count
+
+    def deliver(self, consumer, message):
+        delivery_tag = self.next_delivery_tag
+        self.next_delivery_tag += 1
+        if not consumer.no_ack:
+            self.unacked[delivery_tag] = (consumer.queue, message)
+        args = _shortstr(consumer.tag) + \
+            struct.pack("!Q", delivery_tag) + \
+            _bits(message.redelivered) + _shortstr("") + \
+            _shortstr(message.routing_key)
+        self.connection.send_content(self.channel_id, BASIC_DELIVER, args,
+                                     message)
+
+
+class _Connection:
+    def __init__(self, broker, sock):
+        self.__broker = broker
+        self.__sock = sock
+        self.__out_queue = Queue.Queue()
+        self.__channels = {}
+        self.__vhost = None
+        self.__frame_max = FRAME_MAX
+        self.__reader = threading.Thread(target=self.__run_reader)
+        self.__reader.daemon = True
+        self.__writer = threading.Thread(target=self.__run_writer)
+        self.__writer.daemon = True
+
+    def start(self):
+        self.__writer.start()
+        self.__reader.start()
+
+    def shutdown(self):
+        try:
+            self.__sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+
+    def send(self, data):
+        self.__out_queue.put(data)
+
+    def send_method(self, channel_id, method, args=""):
+        self.send(_method_frame(channel_id, method, args))
+
+    def send_content(self, channel_id, method, args, message):
+        frames = [_method_frame(channel_id, method, args),
+                  _frame(FRAME_HEADER, channel_id,
+                         struct.pack("!HHQ", 60, 0, len(message.body)) +
+                         message.properties)]
+        max_body_size = self.__frame_max - 8
+        for i in range(0, len(message.body), max_body_size):
+            frames.append(_frame(FRAME_BODY, channel_id,
+                                 message.body[i:i + max_body_size]))
+        self.send("".join(frames))
+
+    def __run_writer(self):
+        while True:
+            data = self.__out_queue.get()
+            if data is None:
+                return
+            try:
+                self.__sock.sendall(data)
+            except socket.error:
+                return
+
+    def __run_reader(self):
+        try:
+            if self.__recv_exact(len(PROTOCOL_HEADER)) != PROTOCOL_HEADER:
+                self.__sock.sendall(PROTOCOL_HEADER)
+                return
+            self.__send_start()
+            while True:
+                frame_type, channel_id, payload = self.__read_frame()
+                self.__handle_frame(frame_type, channel_id, payload)
+        except (_ConnectionClosed, socket.error):
+            pass
+        except:
+            logging.exception("Unexpected error in a broker connection.")
+        finally:
+            self.__broker.release_connection(self, self.__channels.values())
+            self.__out_queue.put(None)
+            self.__writer.join()
+            self.__sock.close()
+
+    def __recv_exact(self, size):
+        chunks = []
+        while size > 0:
+            chunk = self.__sock.recv(size)
+            if not chunk:
+                raise _ConnectionClosed()
+            chunks.append(chunk)
+            size -= len(chunk)
+        return "".join(chunks)
+
+    def __read_frame(self):
+        frame_type, channel_id, size = \
+            FRAME_HEADER_STRUCT.unpack(
+                self.__recv_exact(FRAME_HEADER_STRUCT.size))
+        payload = self.__recv_exact(size)
+        if self.__recv_exact(1) != FRAME_END:
+            raise _ConnectionClosed()
+        return frame_type, channel_id, payload
+
+    def __send_start(self):
+        properties = {"product": "hap2-minibroker",
+                      "capabilities": {"publisher_confirms": True,
+                                       "basic.nack": True,
+                                       "consumer_cancel_notify": False}}
+        self.send_method(0, CONNECTION_START,
+                         struct.pack("!BB", 0, 9) + _table(properties) +
+                         _longstr("PLAIN AMQPLAIN") + _longstr("en_US"))
+
+    def __close(self, reply_code, reply_text, method=(0, 0)):
+        self.send_method(0, CONNECTION_CLOSE,
+                         struct.pack("!H", reply_code) +
+                         _shortstr(reply_text) + struct.pack("!HH", *method))
+        raise _ConnectionClosed()
+
+    def __handle_frame(self, frame_type, channel_id, payload):
+        if frame_type == FRAME_HEARTBEAT:
+            self.send(_frame(FRAME_HEARTBEAT, 0, ""))
+            return
+        if channel_id == 0:
+            if frame_type != FRAME_METHOD:
+                self.__close(REPLY_COMMAND_INVALID, "unexpected frame")
+            self.__handle_connection_method(payload)
+            return
+
+        channel = self.__channels.get(channel_id)
+        if frame_type == FRAME_METHOD:
+            method = struct.unpack_from("!HH", payload)
+            args = _ArgumentReader(payload, 4)
+            if method == CHANNEL_OPEN:
+                self.__channels[channel_id] = _Channel(self, channel_id)
+                self.send_method(channel_id, CHANNEL_OPEN_OK, _longstr(""))
+                return
+            if channel is None:
+                self.__close(REPLY_COMMAND_INVALID, "channel not open", method)
+            if channel.closing:
+                if method in (CHANNEL_CLOSE, CHANNEL_CLOSE_OK):
+                    self.__release_channel(channel)
+                    if method == CHANNEL_CLOSE:
+                        self.send_method(channel_id, CHANNEL_CLOSE_OK)
+                return
+            try:
+                self.__handle_channel_method(channel, method, args)
+            except _ChannelError as e:
+                channel.closing = True
+                self.send_method(channel_id, CHANNEL_CLOSE,
+                                 struct.pack("!H", e.reply_code) +
+                                 _shortstr(e.reply_text) +
+                                 struct.pack("!HH", *method))
+        elif channel is None or channel.closing:
+            return
+        elif channel.publishing is None:
+            self.__close(REPLY_COMMAND_INVALID, "unexpected content frame")
+        elif frame_type == FRAME_HEADER:
+            channel.body_size = struct.unpack_from("!Q", payload, 4)[0]
+            channel.body_parts = []
+            channel.publishing.properties = payload[12:]
+            if channel.body_size == 0:
+                self.__finish_publish(channel)
+        elif frame_type == FRAME_BODY:
+            channel.body_parts.append(payload)
+            channel.body_size -= len(payload)
+            if channel.body_size <= 0:
+                self.__finish_publish(channel)
+
+    def __handle_connection_method(self, payload):
+        method = struct.unpack_from("!HH", payload)
+        args = _ArgumentReader(payload, 4)
+        if method == CONNECTION_START_OK:
+            self.send_method(0, CONNECTION_TUNE,
+                             struct.pack("!HIH", 0, FRAME_MAX, 0))
+        elif method == CONNECTION_TUNE_OK:
+            args.short()
+            frame_max = args.long()
+            if frame_max:
+                self.__frame_max = min(frame_max, FRAME_MAX)
+        elif method == CONNECTION_OPEN:
+            self.__vhost = args.shortstr()
+            self.send_method(0, CONNECTION_OPEN_OK, _shortstr(""))
+        elif method == CONNECTION_CLOSE:
+            self.send_method(0, CONNECTION_CLOSE_OK)
+            raise _ConnectionClosed()
+        elif method == CONNECTION_CLOSE_OK:
+            raise _ConnectionClosed()
+        else:
+            self.__close(REPLY_NOT_IMPLEMENTED, "not implemented", method)
+
+    def __handle_channel_method(self, channel, method, args):
+        broker = self.__broker
+        channel_id = channel.channel_id
+        if method == CHANNEL_CLOSE:
+            self.__release_channel(channel)
+            self.send_method(channel_id, CHANNEL_CLOSE_OK)
+        elif method == BASIC_PUBLISH:
+            args.short()
+            exchange = args.shortstr()
+            routing_key = args.shortstr()
+            if exchange:
+                raise _ChannelError(REPLY_NOT_FOUND,
+                                    "NOT_FOUND - no exchange '%s'" % exchange)
+            channel.publishing = _Message(routing_key, "", "")
+        elif method == QUEUE_DECLARE:
+            args.short()
+            name = args.shortstr()
+            passive, durable, exclusive, auto_delete, no_wait = args.bits(5)
+            if not name:
+                name = "amq.gen-%s" % uuid.uuid4()
+            num_messages, num_consumers = \
+                broker.declare_queue(self.__vhost, name, passive)
+            if not no_wait:
+                self.send_method(channel_id, QUEUE_DECLARE_OK,
+                                 _shortstr(name) +
+                                 struct.pack("!II", num_messages,
+                                             num_consumers))
+        elif method == QUEUE_PURGE:
+            args.short()
+            name = args.shortstr()
+            no_wait = args.bits(1)[0]
+            num_messages = broker.purge_queue(self.__vhost, name)
+            if not no_wait:
+                self.send_method(channel_id, QUEUE_PURGE_OK,
+                                 struct.pack("!I", num_messages))
+        elif method == QUEUE_DELETE:
+            args.short()
+            name = args.shortstr()
+            if_unused, if_empty, no_wait = args.bits(3)
+            num_messages = broker.delete_queue(self.__vhost, name)
+            if not no_wait:
+                self.send_method(channel_id, QUEUE_DELETE_OK,
+                                 struct.pack("!I", num_messages))
+        elif method == BASIC_QOS:
+            args.long()
+            channel.prefetch_count = args.short()
+            self.send_method(channel_id, BASIC_QOS_OK)
+            broker.dispatch_channel(channel)
+        elif method == BASIC_CONSUME:
+            args.short()
+            queue_name = args.shortstr()
+            tag = args.shortstr()
+            no_local, no_ack, exclusive, no_wait = args.bits(4)
+            if not tag:
+                tag = "amq.ctag-%s" % uuid.uuid4()
+            # ConsumeOk has to be sent before any deliveries.
+            broker.declare_queue(self.__vhost, queue_name, passive=True)
+            if not no_wait:
+                self.send_method(channel_id, BASIC_CONSUME_OK, _shortstr(tag))
+            broker.consume(channel, self.__vhost, queue_name, tag, no_ack)
+        elif method == BASIC_CANCEL:
+            tag = args.shortstr()
+            no_wait = args.bits(1)[0]
+            broker.cancel(channel, tag)
+            if not no_wait:
+                self.send_method(channel_id, BASIC_CANCEL_OK, _shortstr(tag))
+        elif method == BASIC_GET:
+            args.short()
+            queue_name = args.shortstr()
+            no_ack = args.bits(1)[0]
+            broker.get(channel, self.__vhost, queue_name, no_ack)
+        elif method == BASIC_ACK:
+            delivery_tag = args.longlong()
+            multiple = args.bits(1)[0]
+            broker.ack(channel, delivery_tag, multiple)
+        elif method == BASIC_REJECT:
+            delivery_tag = args.longlong()
+            requeue = args.bits(1)[0]
+            broker.nack(channel, delivery_tag, False, requeue)
+        elif method == BASIC_NACK:
+            delivery_tag = args.longlong()
+            multiple, requeue = args.bits(2)
+            broker.nack(channel, delivery_tag, multiple, requeue)
+        elif method == CONFIRM_SELECT:
+            no_wait = args.bits(1)[0]
+            channel.confirm_mode = True
+            if not no_wait:
+                self.send_method(channel_id, CONFIRM_SELECT_OK)
+        else:
+            self.__close(REPLY_NOT_IMPLEMENTED, "not implemented", method)
+
+    def __finish_publish(self, channel):
+        message = channel.publishing
+        message.body = "".join(channel.body_parts)
+        channel.publishing = None
+        channel.body_parts = []
+        self.__broker.publish(self.__vhost, message)
+        if channel.confirm_mode:
+            self.send_method(channel.channel_id, BASIC_ACK,
+                             struct.pack("!Q", channel.next_publish_seq) +
+                             _bits(False))
+            channel.next_publish_seq += 1
+
+    def __release_channel(self, channel):
+        self.__broker.release_channel(channel)
+        self.__channels.pop(channel.channel_id, None)
+
+
+class MiniBroker:
+    """
+    An in-process stand-in of an AMQP broker. Queues are kept in memory
+    and only the default exchange is available.
+    """
+    def __init__(self, host="127.0.0.1", port=0):
+        """
+        @param host An address to listen on.
+        @param port A port to listen on. 0 chooses a free port.
+        """
+        self.__address = (host, port)
+        self.__lock = threading.RLock()
+        self.__queues = {}
+        self.__connections = set()
+        self.__listener = None
+        self.__stop_event = threading.Event()
+        self.__accept_thread = None
+
+    def start(self):
+        self.__listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.__listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.__listener.bind(self.__address)
+        self.__listener.listen(16)
+        self.__listener.settimeout(0.1)
+        self.__accept_thread = threading.Thread(target=self.__run_accept)
+        self.__accept_thread.daemon = True
+        self.__accept_thread.start()
+
+    def shutdown(self):
+        self.__stop_event.set()
+        if self.__accept_thread is not None:
+            self.__accept_thread.join()
+        with self.__lock:
+            connections = list(self.__connections)
+        for connection in connections:
+            connection.shutdown()
+
+    def get_port(self):
+        return self.__listener.getsockname()[1]
+
+    def get_num_messages(self, queue_name, vhost="/"):
+        """
+        @return
+        The number of messages waiting in the queue. None if the queue
+        doesn't exist.
+        """
+        with self.__lock:
+            queue = self.__queues.get((vhost, queue_name))
+            if queue is None:
+                return None
+            return len(queue.messages)
+
+    def __run_accept(self):
+        while not self.__stop_event.is_set():
+            try:
+                sock, address = self.__listener.accept()
+            except socket.timeout:
+                continue
+            sock.settimeout(None)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection = _Connection(self, sock)
+            with self.__lock:
+                self.__connections.add(connection)
+            connection.start()
+        self.__listener.close()
+
+    def release_connection(self, connection, channels):
+        with self.__lock:
+            for channel in channels:
+                self.release_channel(channel)
+            self.__connections.discard(connection)
+
+    def release_channel(self, channel):
+        with self.__lock:
+            for consumer in channel.consumers.values():
+                consumer.queue.consumers.remove(consumer)
+            channel.consumers.clear()
+            self.__requeue(channel, channel.unacked.keys())
+
+    def declare_queue(self, vhost, name, passive):
+        with self.__lock:
+            queue = self.__queues.get((vhost, name))
+            if queue is None:
+                if passive:
+                    raise _ChannelError(REPLY_NOT_FOUND,
+                                        "NOT_FOUND - no queue '%s'" % name)
+                queue = _Queue(name)
+                self.__queues[(vhost, name)] = queue
+            return len(queue.messages), len(queue.consumers)
+
+    def purge_queue(self, vhost, name):
+        with self.__lock:
+            queue = self.__get_queue(vhost, name)
+            num_messages = len(queue.messages)
+            queue.messages.clear()
+            return num_messages
+
+    def delete_queue(self, vhost, name):
+        with self.__lock:
+            queue = self.__queues.pop((vhost, name), None)
+            if queue is None:
+                return 0
+            for consumer in queue.consumers:
+                consumer.channel.consumers.pop(consumer.tag, None)
+            return len(queue.messages)
+
+    def publish(self, vhost, message):
+        with self.__lock:
+            queue = self.__queues.get((vhost, message.routing_key))
+            if queue is None:
+                # Unroutable messages are dropped as RabbitMQ does.
+                return
+            queue.messages.append(message)
+            self.__dispatch(queue)
+
+    def consume(self, channel, vhost, queue_name, tag, no_ack):
+        with self.__lock:
+            queue = self.__get_queue(vhost, queue_name)
+            consumer = _Consumer(channel, tag, queue, no_ack)
+            channel.consumers[tag] = consumer
+            queue.consumers.append(consumer)
+            self.__dispatch(queue)
+
+    def cancel(self, channel, tag):
+        with self.__lock:
+            consumer = channel.consumers.pop(tag, None)
+            if consumer is not None and consumer in consumer.queue.consumers:
+                consumer.queue.consumers.remove(consumer)
+
+    def get(self, channel, vhost, queue_name, no_ack):
+        with self.__lock:
+            queue = self.__get_queue(vhost, queue_name)
+            if not queue.messages:
+                channel.connection.send_method(channel.channel_id,
+                                               BASIC_GET_EMPTY, _shortstr(""))
+                return
+            message = queue.messages.popleft()
+            delivery_tag = channel.next_delivery_tag
+            channel.next_delivery_tag += 1
+            if not no_ack:
+                channel.unacked[delivery_tag] = (queue, message)
+            args = struct.pack("!Q", delivery_tag) + \
+                _bits(message.redelivered) + _shortstr("") + \
+                _shortstr(message.routing_key) + \
+                struct.pack("!I", len(queue.messages))
+            channel.connection.send_content(channel.channel_id, BASIC_GET_OK,
+                                            args, message)
+
+    def ack(self, channel, delivery_tag, multiple):
+        with self.__lock:
+            for tag in self.__select_tags(channel, delivery_tag, multiple):
+                del channel.unacked[tag]
+            self.dispatch_channel(channel)
+
+    def nack(self, channel, delivery_tag, multiple, requeue):
+        with self.__lock:
+            tags = self.__select_tags(channel, delivery_tag, multiple)
+            if requeue:
+                self.__requeue(channel, tags)
+            else:
+                for tag in tags:
+                    del channel.unacked[tag]
+            self.dispatch_channel(channel)
+
+    def dispatch_channel(self, channel):
+        with self.__lock:
+            for consumer in channel.consumers.values():
+                self.__dispatch(consumer.queue)
+
+    def __get_queue(self, vhost, name):
+        queue = self.__queues.get((vhost, name))
+        if queue is None:
+            raise _ChannelError(REPLY_NOT_FOUND,
+                                "NOT_FOUND - no queue '%s'" % name)
+        return queue
+
+    def __select_tags(self, channel, delivery_tag, multiple):
+        if multiple:
+            return [tag for tag in channel.unacked.keys()
+                    if delivery_tag == 0 or tag <= delivery_tag]
+        if delivery_tag in channel.unacked:
+            return [delivery_tag]
+        return []
+
+    def __requeue(self, channel, tags):
+        requeued = collections.defaultdict(list)
+        for tag in tags:
+            queue, message = channel.unacked.pop(tag)
+            message.redelivered = True
+            requeued[queue].append(message)
+        for queue, messages in requeued.items():
+            queue.messages.extendleft(reversed(messages))
+            self.__dispatch(queue)
+
+    def __dispatch(self, queue):
+        while queue.messages and queue.consumers:
+            consumer = self.__next_consumer(queue)
+            if consumer is None:
+                return
+            consumer.channel.deliver(consumer, queue.messages.popleft())
+
+    def __next_consumer(self, queue):
+        num_consumers = len(queue.consumers)
+        for i in range(num_consumers):
+            idx = (queue.next_consumer_idx + i) % num_consumers
+            consumer = queue.consumers[idx]
+            if consumer.channel.can_deliver(consumer):
+                queue.next_consumer_idx = idx + 1
+                return consumer
+        return None
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Run a minimal in-memory AMQP broker.")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5672)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    broker = MiniBroker(args.host, args.port)
+    broker.start()
+    logging.info("Listening on %s:%d" % (args.host, broker.get_port()))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    broker.shutdown()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
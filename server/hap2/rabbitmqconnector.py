@@ -26,6 +26,7 @@ class RabbitMQConnector(Transporter):
     def __init__(self):
         Transporter.__init__(self)
         self._channel = None
+        self.__confirm_delivery = False
 
     def setup(self, transporter_args):
         """
@@ -37,6 +38,11 @@ class RabbitMQConnector(Transporter):
         - amqp_queue      A queue name.
         - amqp_user       A user name.
         - amqp_password   A password.
+        The following key is optional.
+        - amqp_confirm_delivery
+                          If it is True, call() and reply() wait for the
+                          broker to confirm the message and raise an
+                          exception when it is rejected.
         """
 
         def set_if_not_none(kwargs, key, val):
@@ -63,6 +69,10 @@ class RabbitMQConnector(Transporter):
         connection = pika.adapters.blocking_connection.BlockingConnection(param)
         self._channel = connection.channel()
         self._channel.queue_declare(queue=queue_name)
+        self.__confirm_delivery = \
+            transporter_args.get("amqp_confirm_delivery", False)
+        if self.__confirm_delivery:
+            self._channel.confirm_delivery()
 
     def call(self, msg):
         self.__publish(msg)
@@ -85,8 +95,10 @@ class RabbitMQConnector(Transporter):
         receiver(self._channel, body)
 
     def __publish(self, msg):
-        self._channel.basic_publish(exchange="", routing_key=self._queue_name,
-                                    body=msg)
+        delivered = self._channel.basic_publish(
+            exchange="", routing_key=self._queue_name, body=msg)
+        if self.__confirm_delivery and delivered is False:
+            raise Exception("The broker didn't confirm the message.")
 
     @classmethod
     def define_arguments(cls, parser):
@@ -0,0 +1,458 @@
+#! /usr/bin/env python
+"""
+  Copyright (C) 2015 Project Hatohol
+
+  This file is part of Hatohol.
+
+  Hatohol is free software: you can redistribute it and/or modify
+  it under the terms of the GNU Lesser General Public License, version 3
+  as published by the Free Software Foundation.
+
+  Hatohol is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+  GNU Lesser General Public License for more details.
+
+  You should have received a copy of the GNU Lesser General Public
+  License along with Hatohol. If not, see
+  <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import re
+import time
+import mmap
+import zlib
+import struct
+import logging
+import threading
+import transporter
+from transporter import Transporter
+
+# A record consists of a header (the kind of the message, the length of
+# the message and CRC32 of it) and the message. The unused area of
+# a segment is filled with zero, that is, the kind is 0.
+KIND_CALL = 1
+KIND_REPLY = 2
+RECORD_HEADER = struct.Struct("!BII")
+CURSOR = struct.Struct("!QQ")
+CURSOR_FILE_NAME = "cursor"
+SEGMENT_NAME_FORMAT = "%016d.seg"
+SEGMENT_NAME_PATTERN = re.compile(r"^(\d{16})\.seg$")
+
+DEFAULT_SEGMENT_SIZE = 16 * 1024 * 1024
+DEFAULT_DRAIN_RATE = 100.0
+DEFAULT_RETRY_INTERVAL_SEC = 10.0
+
+
+class _Segment:
+    def __init__(self, path, size=None):
+        if size is None:
+            f = open(path, "r+b")
+            size = os.path.getsize(path)
+        else:
+            f = open(path, "w+b")
+            f.truncate(size)
+        self.path = path
+        self.size = size
+        self.map = mmap.mmap(f.fileno(), size)
+        f.close()
+
+    def read(self, offset):
+        """
+        @return
+        A sequence of the kind, the message and the offset of the next
+        record. None if no valid record is at the offset.
+        """
+        if offset + RECORD_HEADER.size > self.size:
+            return None
+        kind, length, crc = RECORD_HEADER.unpack_from(self.map, offset)
+        if kind not in (KIND_CALL, KIND_REPLY):
+            return None
+        start = offset + RECORD_HEADER.size
+        end = start + length
+        if end > self.size:
+            return None
+        msg = self.map[start:end]
+        if zlib.crc32(msg) & 0xffffffff != crc:
+            return None
+        return kind, msg, end
+
+    def write(self, offset, kind, msg):
+        """
+        @return
+        The offset of the next record. None if the record doesn't fit.
+        """
+        end = offset + RECORD_HEADER.size + len(msg)
+        if end > self.size:
+            return None
+        crc = zlib.crc32(msg) & 0xffffffff
+        self.map[offset:end] = RECORD_HEADER.pack(kind, len(msg), crc) + msg
+        return end
+
+    def flush(self, start, end):
+        """
+        Write the area between start and end back to the file.
+        """
+        start -= start % mmap.ALLOCATIONGRANULARITY
+        self.map.flush(start, end - start)
+
+    def clear_after(self, offset):
+        self.map[offset:] = "\0" * (self.size - offset)
+
+    def close(self):
+        self.map.close()
+
+
+class Spool:
+    """
+    A persistent FIFO of messages. Messages are appended to memory-mapped
+    segment files in a directory. A segment file is removed after all
+    messages in it are confirmed. Appended messages are written back to
+    the file before append() returns, so they survive a crash of the
+    process or the host. A message that was peeked but not confirmed is
+    delivered again after a restart.
+    """
+    def __init__(self, directory, segment_size=DEFAULT_SEGMENT_SIZE):
+        """
+        @param directory
+        A directory for the segment files. It is created if it doesn't
+        exist.
+        @param segment_size The size of a segment file in bytes.
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.__directory = directory
+        self.__segment_size = segment_size
+        self.__num_messages = 0
+        self.__next_offset = None
+        self.__open_cursor()
+        self.__recover()
+
+    def __len__(self):
+        return self.__num_messages
+
+    def append(self, kind, msg):
+        """
+        @param kind KIND_CALL or KIND_REPLY.
+        @param msg A message to be appended.
+        """
+        if isinstance(msg, unicode):
+            msg = msg.encode("utf-8")
+        start = self.__tail_offset
+        offset = self.__tail.write(start, kind, msg)
+        if offset is None:
+            self.__add_segment(RECORD_HEADER.size + len(msg))
+            start = 0
+            offset = self.__tail.write(start, kind, msg)
+        self.__tail.flush(start, offset)
+        self.__tail_offset = offset
+        self.__num_messages += 1
+
+    def peek(self):
+        """
+        @return
+        A sequence of the kind and the oldest message that isn't
+        confirmed. None if the spool is empty.
+        """
+        while True:
+            record = self.__head.read(self.__head_offset)
+            if record is not None:
+                kind, msg, self.__next_offset = record
+                return kind, msg
+            if self.__head_no == self.__tail_no:
+                return None
+            self.__reclaim_head()
+
+    def confirm(self):
+        """
+        Remove the message returned by the last peek().
+        """
+        assert self.__next_offset is not None
+        self.__head_offset = self.__next_offset
+        self.__next_offset = None
+        self.__num_messages -= 1
+        self.__write_cursor()
+
+    def close(self):
+        if self.__head is not self.__tail:
+            self.__head.close()
+        self.__tail.close()
+        self.__cursor_map.close()
+
+    def __segment_path(self, segment_no):
+        return os.path.join(self.__directory, SEGMENT_NAME_FORMAT % segment_no)
+
+    def __list_segments(self):
+        segment_nos = []
+        for name in os.listdir(self.__directory):
+            match = SEGMENT_NAME_PATTERN.match(name)
+            if match is not None:
+                segment_nos.append(int(match.group(1)))
+        return sorted(segment_nos)
+
+    def __open_cursor(self):
+        path = os.path.join(self.__directory, CURSOR_FILE_NAME)
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(CURSOR.pack(0, 0))
+        with open(path, "r+b") as f:
+            self.__cursor_map = mmap.mmap(f.fileno(), CURSOR.size)
+        self.__head_no, self.__head_offset = \
+            CURSOR.unpack_from(self.__cursor_map)
+
+    def __write_cursor(self):
+        self.__cursor_map[:] = CURSOR.pack(self.__head_no, self.__head_offset)
+
+    def __recover(self):
+        segment_nos = []
+        for segment_no in self.__list_segments():
+            if segment_no < self.__head_no:
+                os.remove(self.__segment_path(segment_no))
+            else:
+                segment_nos.append(segment_no)
+
+        if not segment_nos or segment_nos[0] != self.__head_no:
+            # No segment at the cursor. It has been reclaimed completely.
+            if segment_nos:
+                self.__head_no = segment_nos[0]
+            self.__head_offset = 0
+            self.__write_cursor()
+        if not segment_nos:
+            segment_nos.append(self.__head_no)
+            _Segment(self.__segment_path(self.__head_no),
+                     self.__segment_size).close()
+
+        offset = self.__head_offset
+        for segment_no in segment_nos:
+            segment = _Segment(self.__segment_path(segment_no))
+            while True:
+                record = segment.read(offset)
+                if record is None:
+                    break
+                offset = record[2]
+                self.__num_messages += 1
+            if segment_no == segment_nos[-1]:
+                # A torn record may be left by a crash.
+                segment.clear_after(offset)
+                self.__tail = segment
+                self.__tail_no = segment_no
+                self.__tail_offset = offset
+            else:
+                segment.close()
+            offset = 0
+
+        if self.__head_no == self.__tail_no:
+            self.__head = self.__tail
+        else:
+            self.__head = _Segment(self.__segment_path(self.__head_no))
+        if self.__num_messages > 0:
+            logging.info("Spool has %d unsent messages." % self.__num_messages)
+
+    def __add_segment(self, min_size):
+        if self.__tail is not self.__head:
+            self.__tail.close()
+        self.__tail_no += 1
+        self.__tail = _Segment(self.__segment_path(self.__tail_no),
+                               max(self.__segment_size, min_size))
+        self.__tail_offset = 0
+
+    def __reclaim_head(self):
+        path = self.__head.path
+        self.__head.close()
+        self.__head_no += 1
+        self.__head_offset = 0
+        self.__write_cursor()
+        os.remove(path)
+        if self.__head_no == self.__tail_no:
+            self.__head = self.__tail
+        else:
+            self.__head = _Segment(self.__segment_path(self.__head_no))
+
+
+class SpoolingTransporter(Transporter):
+    """
+    A transporter that wraps another one. A message that cannot be sent
+    is stored in a Spool. Spooled messages are sent in order at a limited
+    rate by a background thread after the wrapped transporter is available
+    again. While the spool has messages, new messages are also spooled to
+    keep the order.
+
+    A message is removed from the spool after the wrapped transporter
+    returns from call() or reply(). The wrapped transporter is asked to
+    return after the broker confirms the message with the
+    amqp_confirm_delivery argument.
+    """
+    def __init__(self):
+        Transporter.__init__(self)
+        self.__connector = None
+        self.__next_connect_time = 0
+        self.__next_drain_time = 0
+        # Guards the spool and the wrapped transporter. It is notified when
+        # a message is spooled.
+        self.__cond = threading.Condition()
+        self.__drainer = None
+        self.__closed = False
+
+    def setup(self, transporter_args):
+        """
+        @param transporter_args
+        The following keys shall be included in addition to ones for the
+        wrapped transporter.
+        - spool_class            A class of the wrapped transporter.
+        - spool_dir              A directory for the spool.
+        The following keys are optional.
+        - spool_segment_size     The size of a segment file.
+        - spool_drain_rate       Messages per second to send spooled
+                                 messages. None means no limit.
+        - spool_retry_interval   Seconds between reconnections.
+        - spool_drain_thread     If it is False, no background thread is
+                                 started and the owner has to call drain().
+        """
+        self.__inner_args = dict(transporter_args)
+        self.__inner_args["class"] = transporter_args["spool_class"]
+        self.__inner_args["amqp_confirm_delivery"] = True
+        self.__spool = Spool(
+            transporter_args["spool_dir"],
+            transporter_args.get("spool_segment_size", DEFAULT_SEGMENT_SIZE))
+        self.__drain_rate = transporter_args.get("spool_drain_rate",
+                                                 DEFAULT_DRAIN_RATE)
+        self.__retry_interval_sec = transporter_args.get(
+            "spool_retry_interval", DEFAULT_RETRY_INTERVAL_SEC)
+        self.__connect()
+        if transporter_args.get("spool_drain_thread", True):
+            self.__drainer = threading.Thread(target=self.__run_drainer)
+            self.__drainer.daemon = True
+            self.__drainer.start()
+
+    def call(self, msg):
+        self.__send(KIND_CALL, msg)
+
+    def reply(self, msg):
+        self.__send(KIND_REPLY, msg)
+
+    def set_receiver(self, receiver):
+        Transporter.set_receiver(self, receiver)
+        with self.__cond:
+            if self.__connector is not None:
+                self.__connector.set_receiver(receiver)
+
+    def run_receive_loop(self):
+        assert self.__connector is not None
+        self.__connector.run_receive_loop()
+
+    def get_num_spooled(self):
+        return len(self.__spool)
+
+    def drain(self, max_messages=None):
+        """
+        Send spooled messages. The background thread calls this method.
+        The owner may also call it to send them at once.
+        @param max_messages
+        The maximum number of messages to be sent. None means all.
+        @return The number of sent messages.
+        """
+        num_sent = 0
+        while max_messages is None or num_sent < max_messages:
+            if self.__closed or len(self.__spool) == 0:
+                break
+            if self.__drain_rate:
+                sleep_time = self.__next_drain_time - time.time()
+                if sleep_time > 0:
+                    time.sleep(sleep_time)
+            with self.__cond:
+                record = self.__spool.peek()
+                if record is None:
+                    break
+                kind, msg = record
+                if not self.__publish(kind, msg):
+                    break
+                self.__spool.confirm()
+            num_sent += 1
+            if self.__drain_rate:
+                self.__next_drain_time = \
+                    max(self.__next_drain_time, time.time()) + \
+                    1.0 / self.__drain_rate
+        return num_sent
+
+    def close(self):
+        with self.__cond:
+            self.__closed = True
+            self.__cond.notify()
+        if self.__drainer is not None:
+            self.__drainer.join()
+        self.__spool.close()
+
+    def __send(self, kind, msg):
+        """
+        Send a message if nothing is spooled and the wrapped transporter is
+        connected. Otherwise the message is spooled and sent later by the
+        background thread, so the caller doesn't wait for a reconnection.
+        """
+        with self.__cond:
+            if len(self.__spool) == 0 and self.__connector is not None and \
+               self.__publish(kind, msg):
+                return
+            self.__spool.append(kind, msg)
+            self.__cond.notify()
+
+    def __run_drainer(self):
+        while True:
+            with self.__cond:
+                while len(self.__spool) == 0 and not self.__closed:
+                    self.__cond.wait()
+                if self.__closed:
+                    return
+            self.drain()
+            if len(self.__spool) == 0:
+                continue
+            # The wrapped transporter is unavailable.
+            with self.__cond:
+                if not self.__closed:
+                    self.__cond.wait(self.__retry_interval_sec)
+
+    def __connect(self):
+        if time.time() < self.__next_connect_time:
+            return False
+        try:
+            self.__connector = transporter.Factory.create(self.__inner_args)
+        except Exception as e:
+            logging.warning("Failed to connect: %s" % e)
+            self.__next_connect_time = time.time() + self.__retry_interval_sec
+            return False
+        receiver = self.get_receiver()
+        if receiver is not None:
+            self.__connector.set_receiver(receiver)
+        return True
+
+    def __publish(self, kind, msg):
+        if self.__connector is None and not self.__connect():
+            return False
+        try:
+            if kind == KIND_CALL:
+                self.__connector.call(msg)
+            else:
+                self.__connector.reply(msg)
+        except Exception as e:
+            logging.warning("Failed to send a message: %s" % e)
+            self.__connector = None
+            self.__next_connect_time = time.time() + self.__retry_interval_sec
+            return False
+        return True
+
+    @classmethod
+    def define_arguments(cls, parser):
+        parser.add_argument("--spool-dir", type=str, default=None)
+        parser.add_argument("--spool-segment-size", type=int,
+                            default=DEFAULT_SEGMENT_SIZE)
+        parser.add_argument("--spool-drain-rate", type=float,
+                            default=DEFAULT_DRAIN_RATE)
+        parser.add_argument("--spool-retry-interval", type=float,
+                            default=DEFAULT_RETRY_INTERVAL_SEC)
+
+    @classmethod
+    def parse_arguments(cls, args):
+        return {"spool_dir": args.spool_dir,
+                "spool_segment_size": args.spool_segment_size,
+                "spool_drain_rate": args.spool_drain_rate,
+                "spool_retry_interval": args.spool_retry_interval}
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""
+  Copyright (C) 2015 Project Hatohol
+
+  This file is part of Hatohol.
+
+  Hatohol is free software: you can redistribute it and/or modify
+  it under the terms of the GNU Lesser General Public License, version 3
+  as published by the Free Software Foundation.
+
+  Hatohol is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+  GNU Lesser General Public License for more details.
+
+  You should have received a copy of the GNU Lesser General Public
+  License along with Hatohol. If not, see
+  <http://www.gnu.org/licenses/>.
+"""
+import unittest
+import math
+import haptime
+import downsampler
+
+BEGIN_NSEC = 1427846400 * haptime.NSEC_PER_SEC
+
+
+def create_histories(values, interval_sec=60):
+    step = interval_sec * haptime.NSEC_PER_SEC
+    return [{"value": str(value),
+             "time": haptime.format_time(BEGIN_NSEC + i * step)}
+            for i, value in enumerate(values)]
+
+
+class Downsampler(unittest.TestCase):
+    def __values(self, histories):
+        return [float(sample["value"]) for sample in histories]
+
+    def test_no_reduction(self):
+        histories = create_histories([1, 2, 3])
+        self.assertEquals(histories,
+                          downsampler.downsample_histories(histories, 3))
+        self.assertEquals(histories,
+                          downsampler.downsample_histories(histories, None))
+        self.assertEquals(histories,
+                          downsampler.downsample_histories(histories, 0))
+
+    def test_non_numeric_values(self):
+        histories = create_histories(["a", "b", "c", "d"])
+        self.assertEquals(histories,
+                          downsampler.downsample_histories(histories, 2))
+
+    def test_none_value(self):
+        histories = create_histories([1, 2, 3, 4])
+        histories[1]["value"] = None
+        self.assertEquals(histories,
+                          downsampler.downsample_histories(histories, 2))
+
+    def test_missing_value(self):
+        histories = create_histories([1, 2, 3, 4])
+        del histories[1]["value"]
+        self.assertEquals(histories,
+                          downsampler.downsample_histories(histories, 2))
+
+    def test_lttb_keeps_peak(self):
+        values = [0] * 100
+        values[42] = 10
+        histories = create_histories(values)
+        result = downsampler.downsample_histories(histories, 10,
+                                                  use_numpy=False)
+        self.assertEquals(10, len(result))
+        self.assertEquals(histories[0], result[0])
+        self.assertEquals(histories[-1], result[-1])
+        self.assertTrue(histories[42] in result)
+
+    def test_lttb_small_max_points(self):
+        histories = create_histories(range(10))
+        self.assertEquals([histories[0], histories[-1]],
+                          downsampler.downsample_histories(histories, 2))
+        self.assertEquals([histories[0]],
+                          downsampler.downsample_histories(histories, 1))
+
+    def test_min_max(self):
+        values = [5, 1, 9, 5, 5, 0, 5, 7]
+        histories = create_histories(values)
+        result = downsampler.downsample_histories(
+            histories, 4, method=downsampler.METHOD_MIN_MAX, use_numpy=False)
+        self.assertEquals([1, 9, 0, 7], self.__values(result))
+
+    def test_unknown_method(self):
+        histories = create_histories(range(10))
+        self.assertRaises(ValueError, downsampler.downsample_histories,
+                          histories, 5, method="FOO")
+
+
+@unittest.skipIf(downsampler.numpy is None, "NumPy is not available")
+class Downsampler_numpy(unittest.TestCase):
+    def setUp(self):
+        self.__histories = create_histories(
+            [math.sin(i / 10.0) + (i % 7) * 0.1 for i in range(1000)])
+
+    def test_lttb(self):
+        for max_points in (3, 10, 100, 999):
+            self.assertEquals(
+                downsampler.downsample_histories(
+                    self.__histories, max_points, use_numpy=False),
+                downsampler.downsample_histories(
+                    self.__histories, max_points, use_numpy=True))
+
+    def test_min_max(self):
+        for max_points in (1, 10, 101):
+            self.assertEquals(
+                downsampler.downsample_histories(
+                    self.__histories, max_points,
+                    method=downsampler.METHOD_MIN_MAX, use_numpy=False),
+                downsampler.downsample_histories(
+                    self.__histories, max_points,
+                    method=downsampler.METHOD_MIN_MAX, use_numpy=True))
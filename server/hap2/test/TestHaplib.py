@@ -18,12 +18,18 @@
   <http://www.gnu.org/licenses/>.
 """
 import unittest
+import sys
+import logging
 import haplib
 import time
 import re
 import common
 import transporter
 import os
+import threading
+import shutil
+import signal
+import tempfile
 
 class Gadget:
     def __init__(self):
@@ -34,6 +40,44 @@ class Gadget:
         self.num_called += 1
 
 
+class TestHaplib_validate_arguments(unittest.TestCase):
+    def test_valid(self):
+        params = {"lastInfo": u"100", "count": 10, "direction": u"ASC",
+                  "fetchId": u"1"}
+        self.assertIsNone(haplib.validate_arguments("fetchEvents", params))
+
+    def test_without_optional_argument(self):
+        self.assertIsNone(haplib.validate_arguments("fetchItems",
+                                                    {"fetchId": u"1"}))
+
+    def test_unknown_procedure(self):
+        self.assertEquals(haplib.ERR_CODE_METHOD_NOT_FOUND,
+                          haplib.validate_arguments("fetchFoo", {}))
+
+    def test_without_mandatory_argument(self):
+        self.assertEquals(haplib.ERR_CODE_INVALID_PARAMS,
+                          haplib.validate_arguments("fetchItems", {}))
+
+    def test_wrong_type(self):
+        params = {"lastInfo": u"100", "count": u"10", "direction": u"ASC",
+                  "fetchId": u"1"}
+        self.assertEquals(haplib.ERR_CODE_INVALID_PARAMS,
+                          haplib.validate_arguments("fetchEvents", params))
+
+    def test_type_given_as_class(self):
+        params = {"hostId": u"1", "itemId": u"2", "beginTime": u"0",
+                  "endTime": u"1", "fetchId": u"1"}
+        self.assertIsNone(haplib.validate_arguments("fetchHistory", params))
+
+    def test_max_points_of_fetch_history(self):
+        params = {"hostId": u"1", "itemId": u"2", "beginTime": u"0",
+                  "endTime": u"1", "fetchId": u"1", "maxPoints": 100}
+        self.assertIsNone(haplib.validate_arguments("fetchHistory", params))
+        params["maxPoints"] = u"100"
+        self.assertEquals(haplib.ERR_CODE_INVALID_PARAMS,
+                          haplib.validate_arguments("fetchHistory", params))
+
+
 class TestHaplib_handle_exception(unittest.TestCase):
     def test_handle_exception(self):
         obj = Gadget()
@@ -51,6 +95,121 @@ class TestHaplib_handle_exception(unittest.TestCase):
             self.assertRaises(TypeError, haplib.handle_exception, (TypeError,))
 
 
+class LogRecorder(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class ErrorAggregator(unittest.TestCase):
+    def setUp(self):
+        self.__recorder = LogRecorder()
+        logging.getLogger().addHandler(self.__recorder)
+
+    def tearDown(self):
+        logging.getLogger().removeHandler(self.__recorder)
+
+    def __raise_and_report(self, aggregator, exctype):
+        try:
+            raise exctype("Failed")
+        except:
+            aggregator.report(*sys.exc_info())
+
+    def test_first_occurrence_has_traceback(self):
+        aggregator = haplib.ErrorAggregator()
+        self.__raise_and_report(aggregator, TypeError)
+        self.assertEquals(1, len(self.__recorder.messages))
+        self.assertTrue("__raise_and_report" in self.__recorder.messages[0])
+
+    def test_repeated_occurrences_are_suppressed(self):
+        aggregator = haplib.ErrorAggregator(summary_interval_sec=3600)
+        for i in range(5):
+            self.__raise_and_report(aggregator, TypeError)
+        self.__raise_and_report(aggregator, ValueError)
+        self.assertEquals(2, len(self.__recorder.messages))
+        aggregator.flush()
+        self.assertEquals(3, len(self.__recorder.messages))
+        self.assertTrue("(4 more occurrences)" in
+                        self.__recorder.messages[2])
+
+    def test_summary_interval(self):
+        aggregator = haplib.ErrorAggregator(summary_interval_sec=0)
+        for i in range(3):
+            self.__raise_and_report(aggregator, TypeError)
+        self.assertEquals(3, len(self.__recorder.messages))
+        self.assertTrue("(1 more occurrences)" in
+                        self.__recorder.messages[1])
+
+    def test_periodic_flush(self):
+        aggregator = haplib.ErrorAggregator(summary_interval_sec=0.05)
+        for i in range(3):
+            self.__raise_and_report(aggregator, TypeError)
+        self.assertEquals(1, len(self.__recorder.messages))
+        time.sleep(0.2)
+        self.assertEquals(2, len(self.__recorder.messages))
+        self.assertTrue("(2 more occurrences)" in
+                        self.__recorder.messages[1])
+
+    def test_forget_idle_exceptions(self):
+        aggregator = haplib.ErrorAggregator(summary_interval_sec=3600,
+                                            idle_sec=0)
+        self.__raise_and_report(aggregator, TypeError)
+        self.__raise_and_report(aggregator, TypeError)
+        aggregator.flush()
+        self.assertEquals(1, aggregator.get_num_entries())
+        aggregator.flush()
+        self.assertEquals(0, aggregator.get_num_entries())
+        self.__raise_and_report(aggregator, TypeError)
+        self.assertTrue("__raise_and_report" in self.__recorder.messages[-1])
+
+
+class QueueLogHandler(unittest.TestCase):
+    def __create_record(self, level, msg):
+        return logging.LogRecord("test", level, __file__, 0, msg, None, None)
+
+    def test_emit(self):
+        recorder = LogRecorder()
+        handler = haplib.QueueLogHandler([recorder])
+        handler.handle(self.__create_record(logging.INFO, "FOO"))
+        handler.handle(self.__create_record(logging.ERROR, "BAR"))
+        handler.close()
+        self.assertEquals(["FOO", "BAR"], recorder.messages)
+
+    def test_level_of_handlers(self):
+        recorder = LogRecorder()
+        recorder.setLevel(logging.WARNING)
+        handler = haplib.QueueLogHandler([recorder])
+        handler.handle(self.__create_record(logging.INFO, "FOO"))
+        handler.handle(self.__create_record(logging.ERROR, "BAR"))
+        handler.close()
+        self.assertEquals(["BAR"], recorder.messages)
+
+    def test_drop_debug_records(self):
+        class SlowRecorder(LogRecorder):
+            def __init__(self):
+                LogRecorder.__init__(self)
+                self.resume = threading.Event()
+
+            def emit(self, record):
+                self.resume.wait()
+                LogRecorder.emit(self, record)
+
+        recorder = SlowRecorder()
+        handler = haplib.QueueLogHandler([recorder], max_queue_size=2)
+        for i in range(10):
+            handler.handle(self.__create_record(logging.DEBUG, "D%d" % i))
+        self.assertTrue(handler.get_num_dropped() >= 7)
+        recorder.resume.set()
+        handler.handle(self.__create_record(logging.INFO, "FOO"))
+        handler.close()
+        self.assertEquals("FOO", recorder.messages[-1])
+        self.assertTrue(any(msg.startswith("Dropped ")
+                            for msg in recorder.messages))
+
+
 class TestHaplib_Signal(unittest.TestCase):
     def test_default(self):
         obj = haplib.Signal()
@@ -135,6 +294,49 @@ class MonitoringServerInfo(unittest.TestCase):
             actual = eval("ms_info.%s" % key_map[key])
             self.assertEquals(actual, val)
 
+    def __create_info_dict(self, **kwargs):
+        info_dict = {
+            "serverId": 10,
+            "url": "http://who@where:foo/hoge",
+            "type": "8e632c14-d1f7-11e4-8350-d43d7e3146fb",
+            "nickName": "carrot",
+            "userName": "ninjin",
+            "password": "radish",
+            "pollingIntervalSec": 30,
+            "retryIntervalSec": 15,
+            "extendedInfo": '{"hostGroups": ["a", "b"]}'
+        }
+        info_dict.update(kwargs)
+        return info_dict
+
+    def test_extended_info_dict(self):
+        ms_info = haplib.MonitoringServerInfo(self.__create_info_dict())
+        extended_info = ms_info.extended_info_dict
+        self.assertEquals({"hostGroups": ["a", "b"]}, extended_info)
+        self.assertIs(extended_info, ms_info.extended_info_dict)
+
+    def test_extended_info_dict_with_broken_json(self):
+        ms_info = haplib.MonitoringServerInfo(
+            self.__create_info_dict(extendedInfo="Time goes by."))
+        self.assertRaises(ValueError, getattr, ms_info, "extended_info_dict")
+
+    def test_equal(self):
+        ms_info1 = haplib.MonitoringServerInfo(self.__create_info_dict())
+        ms_info2 = haplib.MonitoringServerInfo(self.__create_info_dict())
+        ms_info1.extended_info_dict
+        self.assertEquals(ms_info1, ms_info2)
+        self.assertFalse(ms_info1 != ms_info2)
+
+    def test_not_equal(self):
+        ms_info1 = haplib.MonitoringServerInfo(self.__create_info_dict())
+        ms_info2 = haplib.MonitoringServerInfo(
+            self.__create_info_dict(pollingIntervalSec=60))
+        self.assertNotEquals(ms_info1, ms_info2)
+
+    def test_no_instance_dict(self):
+        ms_info = haplib.MonitoringServerInfo(self.__create_info_dict())
+        self.assertRaises(AttributeError, setattr, ms_info, "foo", 1)
+
 
 class ParsedMessage(unittest.TestCase):
     def test_create(self):
@@ -149,6 +351,13 @@ class ParsedMessage(unittest.TestCase):
         actual = "error code: None, message ID: None, error message: "
         self.assertEquals(actual, pm.get_error_message())
 
+    def test_equal(self):
+        pm1 = haplib.ParsedMessage()
+        pm2 = haplib.ParsedMessage()
+        self.assertEquals(pm1, pm2)
+        pm2.error_code = haplib.ERR_CODE_INVALID_PARAMS
+        self.assertNotEquals(pm1, pm2)
+
 
 class ArmInfo(unittest.TestCase):
     def test_create(self):
@@ -160,6 +369,69 @@ class ArmInfo(unittest.TestCase):
         self.assertEquals(0, arm_info.num_success)
         self.assertEquals(0, arm_info.num_failure)
 
+    def test_equal(self):
+        arm_info1 = haplib.ArmInfo()
+        arm_info2 = haplib.ArmInfo()
+        self.assertEquals(arm_info1, arm_info2)
+        arm_info2.num_success += 1
+        self.assertNotEquals(arm_info1, arm_info2)
+        self.assertNotEquals(arm_info1, haplib.ParsedMessage())
+
+
+class TokenBucket(unittest.TestCase):
+    def test_reserve_within_capacity(self):
+        bucket = haplib.TokenBucket(10, capacity=2)
+        self.assertEquals(0, bucket.reserve())
+        self.assertEquals(0, bucket.reserve())
+
+    def test_reserve_over_capacity(self):
+        bucket = haplib.TokenBucket(10, capacity=2)
+        bucket.reserve(2)
+        wait_time = bucket.reserve()
+        self.assertTrue(0.05 < wait_time <= 0.1)
+
+    def test_refill(self):
+        bucket = haplib.TokenBucket(100, capacity=1)
+        bucket.reserve()
+        time.sleep(0.05)
+        self.assertEquals(0, bucket.reserve())
+
+
+class RateLimiter(unittest.TestCase):
+    def test_no_limit(self):
+        limiter = haplib.RateLimiter()
+        self.assertEquals(0, limiter.reserve("putEvents", 100000))
+
+    def test_msgs_per_sec(self):
+        limiter = haplib.RateLimiter()
+        limiter.set_limit("putEvents", msgs_per_sec=10)
+        wait_times = [limiter.reserve("putEvents", 1) for i in range(11)]
+        self.assertEquals([0] * 10, wait_times[:10])
+        self.assertTrue(wait_times[10] > 0)
+        self.assertEquals(0, limiter.reserve("putItems", 1))
+
+    def test_bytes_per_sec(self):
+        limiter = haplib.RateLimiter()
+        limiter.set_limit("putEvents", bytes_per_sec=1000)
+        self.assertEquals(0, limiter.reserve("putEvents", 1000))
+        wait_time = limiter.reserve("putEvents", 500)
+        self.assertTrue(0.4 < wait_time <= 0.5)
+
+    def test_default_limit(self):
+        limiter = haplib.RateLimiter()
+        limiter.set_limit(msgs_per_sec=1)
+        limiter.set_limit("putItems", msgs_per_sec=100)
+        self.assertEquals(0, limiter.reserve("putEvents", 1))
+        self.assertTrue(limiter.reserve("putHosts", 1) > 0)
+        self.assertEquals(0, limiter.reserve("putItems", 1))
+
+    def test_acquire(self):
+        limiter = haplib.RateLimiter()
+        limiter.set_limit("putEvents", msgs_per_sec=20, burst_sec=0.05)
+        start_time = time.time()
+        [limiter.acquire("putEvents", 1) for i in range(3)]
+        self.assertTrue(time.time() - start_time >= 0.09)
+
 
 class RabbitMQHapiConnector(unittest.TestCase):
     def test_setup(self):
@@ -195,6 +467,20 @@ class Sender(unittest.TestCase):
         common.assertNotRaises(test_sender.request,
                                "test_procedure_name", "test_param", 1)
 
+    def test_request_with_rate_limiter(self):
+        class Limiter:
+            def acquire(self, procedure_name, num_bytes):
+                self.args = (procedure_name, num_bytes)
+
+        transporter_args = {"class": transporter.Transporter}
+        test_sender = haplib.Sender(transporter_args)
+        limiter = Limiter()
+        test_sender.set_rate_limiter(limiter)
+        self.assertEquals(limiter, test_sender.get_rate_limiter())
+        test_sender.request("test_procedure_name", "test_param", 1)
+        self.assertEquals("test_procedure_name", limiter.args[0])
+        self.assertTrue(limiter.args[1] > 0)
+
     def test_response(self):
         transporter_args = {"class": transporter.Transporter}
         test_sender = haplib.Sender(transporter_args)
@@ -210,3 +496,293 @@ class Sender(unittest.TestCase):
         transporter_args = {"class": transporter.Transporter}
         test_sender = haplib.Sender(transporter_args)
         common.assertNotRaises(test_sender.notify, "test_notify", 1)
+
+
+class RequestIdGenerator(unittest.TestCase):
+    def test_call(self):
+        generator = haplib.RequestIdGenerator()
+        self.assertEquals([1, 2, 3], [generator() for i in range(3)])
+
+    def test_start(self):
+        generator = haplib.RequestIdGenerator(start=100)
+        self.assertEquals(100, generator())
+
+
+class EventDeduplicator(unittest.TestCase):
+    def __events(self, event_ids):
+        return [{"eventId": event_id} for event_id in event_ids]
+
+    def test_filter(self):
+        dedup = haplib.EventDeduplicator()
+        self.assertEquals(self.__events(["1", "2"]),
+                          dedup.filter(self.__events(["1", "2"])))
+        self.assertEquals(self.__events(["3"]),
+                          dedup.filter(self.__events(["2", "3", "3"])))
+        self.assertEquals(2, dedup.get_num_dropped())
+
+    def test_capacity(self):
+        dedup = haplib.EventDeduplicator(capacity=2)
+        dedup.filter(self.__events(["1", "2", "3", "4", "5"]))
+        # Only the IDs in the current and the previous generation remain.
+        self.assertEquals(self.__events(["1", "2"]),
+                          dedup.filter(self.__events(["1", "2", "5"])))
+
+
+class RequestRecorder:
+    def __init__(self):
+        self.requests = []
+
+    def request(self, procedure_name, params, request_id):
+        self.requests.append((procedure_name, params, request_id))
+
+
+class ParallelFetcher(unittest.TestCase):
+    def test_fetch_all_hosts(self):
+        sender = RequestRecorder()
+        fetcher = haplib.ParallelFetcher(sender, lambda host_ids: [host_ids])
+        self.assertEquals([], fetcher(None, "fetch-1"))
+        expected = [("putItems", {"items": [None], "fetchId": "fetch-1",
+                                  "mayMoreFlag": False}, 1)]
+        self.assertEquals(expected, sender.requests)
+
+    def test_fetch_partitions(self):
+        sender = RequestRecorder()
+        fetcher = haplib.ParallelFetcher(sender, lambda host_ids: host_ids,
+                                         max_workers=3, num_hosts_per_fetch=2)
+        host_ids = [str(i) for i in range(9)]
+        fetcher(host_ids, "fetch-2")
+        self.assertEquals(5, len(sender.requests))
+        items = []
+        for procedure, params, request_id in sender.requests:
+            self.assertEquals("putItems", procedure)
+            self.assertEquals("fetch-2", params["fetchId"])
+            items.extend(params["items"])
+        self.assertEquals(host_ids, sorted(items))
+        may_more_flags = [req[1]["mayMoreFlag"] for req in sender.requests]
+        self.assertEquals([True] * 4 + [False], may_more_flags)
+
+    def test_max_workers(self):
+        lock = threading.Lock()
+        counter = {"running": 0, "max": 0}
+
+        def fetch(host_ids):
+            with lock:
+                counter["running"] += 1
+                counter["max"] = max(counter["max"], counter["running"])
+            time.sleep(0.05)
+            with lock:
+                counter["running"] -= 1
+            return host_ids
+
+        sender = RequestRecorder()
+        fetcher = haplib.ParallelFetcher(sender, fetch, max_workers=2,
+                                         num_hosts_per_fetch=1)
+        fetcher(["a", "b", "c", "d", "e"], "fetch-3")
+        self.assertEquals(2, counter["max"])
+        self.assertEquals(5, len(sender.requests))
+
+    def test_timeout(self):
+        def fetch(host_ids):
+            if host_ids == ["slow"]:
+                time.sleep(1)
+            return host_ids
+
+        sender = RequestRecorder()
+        fetcher = haplib.ParallelFetcher(sender, fetch, max_workers=1,
+                                         num_hosts_per_fetch=1,
+                                         timeout_sec=0.1)
+        unfetched = fetcher(["slow", "fast"], "fetch-4")
+        items = [req[1]["items"] for req in sender.requests]
+        self.assertEquals([["fast"]], items)
+        self.assertFalse(sender.requests[-1][1]["mayMoreFlag"])
+        self.assertEquals([["slow"]], unfetched)
+
+    def test_abandoned_worker_takes_no_task(self):
+        lock = threading.Lock()
+        counter = {"running": 0, "max": 0}
+
+        def fetch(host_ids):
+            if host_ids == ["slow"]:
+                time.sleep(0.3)
+                return host_ids
+            with lock:
+                counter["running"] += 1
+                counter["max"] = max(counter["max"], counter["running"])
+            time.sleep(0.05)
+            with lock:
+                counter["running"] -= 1
+            return host_ids
+
+        sender = RequestRecorder()
+        fetcher = haplib.ParallelFetcher(sender, fetch, max_workers=1,
+                                         num_hosts_per_fetch=1,
+                                         timeout_sec=0.15)
+        fetcher(["slow"] + [str(i) for i in range(6)], "fetch-6")
+        self.assertEquals(1, counter["max"])
+        self.assertEquals(6, len(sender.requests))
+
+    def test_fetch_failure(self):
+        def fetch(host_ids):
+            raise RuntimeError
+
+        sender = RequestRecorder()
+        fetcher = haplib.ParallelFetcher(sender, fetch,
+                                         put_procedure="putTriggers",
+                                         result_key="triggers")
+        unfetched = fetcher(["a"], "fetch-5")
+        expected = [("putTriggers", {"triggers": [], "fetchId": "fetch-5",
+                                     "mayMoreFlag": False}, 1)]
+        self.assertEquals(expected, sender.requests)
+        self.assertEquals([["a"]], unfetched)
+
+
+class EventPager(unittest.TestCase):
+    def __fetch(self, last_info, count, direction):
+        self.fetched.append((last_info, count, direction))
+        if direction == "ASC":
+            start = int(last_info) + 1
+            ids = range(start, min(start + count, 24))
+        else:
+            start = int(last_info) - 1
+            ids = range(start, max(start - count, 0), -1)
+        return [{"eventId": str(i)} for i in ids]
+
+    def setUp(self):
+        self.fetched = []
+
+    def __get_puts(self, sender):
+        return [([e["eventId"] for e in params["events"]],
+                 params["fetchId"], params["mayMoreFlag"])
+                for procedure, params, request_id in sender.requests]
+
+    def test_pages(self):
+        sender = RequestRecorder()
+        pager = haplib.EventPager(sender, self.__fetch, num_prefetch=2,
+                                  page_size=4)
+        pager("10", 10, "ASC", "1")
+        self.assertEquals([(["11", "12", "13", "14"], "1", True),
+                           (["15", "16", "17", "18"], "1", True),
+                           (["19", "20"], "1", False)],
+                          self.__get_puts(sender))
+        self.assertEquals([("10", 4, "ASC"), ("14", 4, "ASC"),
+                           ("18", 2, "ASC")], self.fetched)
+
+    def test_desc(self):
+        sender = RequestRecorder()
+        pager = haplib.EventPager(sender, self.__fetch, page_size=2)
+        pager("4", 10, "DESC", "2")
+        self.assertEquals([(["3", "2"], "2", True), (["1"], "2", False)],
+                          self.__get_puts(sender))
+
+    def test_short_page_ends(self):
+        sender = RequestRecorder()
+        pager = haplib.EventPager(sender, self.__fetch, page_size=4)
+        pager("20", 100, "ASC", "3")
+        self.assertEquals([(["21", "22", "23"], "3", False)],
+                          self.__get_puts(sender))
+        self.assertEquals(1, len(self.fetched))
+
+    def test_page_size_is_limited(self):
+        sender = RequestRecorder()
+        pager = haplib.EventPager(sender, self.__fetch,
+                                  page_size=haplib.MAX_EVENT_CHUNK_SIZE * 2)
+        pager("0", haplib.MAX_EVENT_CHUNK_SIZE * 2, "ASC", "4")
+        self.assertEquals(haplib.MAX_EVENT_CHUNK_SIZE, self.fetched[0][1])
+
+    def test_no_events(self):
+        sender = RequestRecorder()
+        pager = haplib.EventPager(sender, self.__fetch)
+        self.assertTrue(pager("23", 10, "ASC", "5"))
+        self.assertEquals([([], "5", False)], self.__get_puts(sender))
+
+    def test_fetch_failure(self):
+        def fetch(last_info, count, direction):
+            if last_info != "0":
+                raise Exception("Failed to fetch")
+            return self.__fetch(last_info, count, direction)
+
+        sender = RequestRecorder()
+        pager = haplib.EventPager(sender, fetch, page_size=2)
+        self.assertFalse(pager("0", 10, "ASC", "6"))
+        self.assertEquals([(["1", "2"], "6", False)],
+                          self.__get_puts(sender))
+
+    def test_deduplicate_overlapping_pages(self):
+        def fetch(last_info, count, direction):
+            # Each page starts with the last event of the previous one.
+            first = int(last_info) if last_info != "0" else 1
+            return [{"eventId": "%d" % i}
+                    for i in range(first, min(first + count, 6))]
+
+        sender = RequestRecorder()
+        pager = haplib.EventPager(sender, fetch, page_size=2,
+                                  deduplicate=True)
+        pager("0", 4, "ASC", "7")
+        self.assertEquals([(["1", "2"], "7", True), (["3"], "7", False)],
+                          self.__get_puts(sender))
+
+    def test_deduplicate_only_in_a_fetch(self):
+        sender = RequestRecorder()
+        pager = haplib.EventPager(sender, self.__fetch, page_size=2,
+                                  deduplicate=True)
+        pager("0", 2, "ASC", "8")
+        pager("0", 2, "ASC", "9")
+        self.assertEquals([(["1", "2"], "8", False),
+                           (["1", "2"], "9", False)],
+                          self.__get_puts(sender))
+
+
+class Profiler(unittest.TestCase):
+    def setUp(self):
+        self.__dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.__dir)
+
+    def test_cprofile(self):
+        profiler = haplib.Profiler(output_dir=self.__dir)
+        profiler.start()
+        self.assertTrue(profiler.is_running())
+        sum(range(1000))
+        path = profiler.stop()
+        self.assertFalse(profiler.is_running())
+        self.assertTrue(path.endswith(".prof"))
+        self.assertTrue(os.path.exists(path))
+
+    def test_stop_without_start(self):
+        profiler = haplib.Profiler(output_dir=self.__dir)
+        self.assertIsNone(profiler.stop())
+
+    def test_sampling(self):
+        stop_event = threading.Event()
+        thread = threading.Thread(target=stop_event.wait, name="waiter")
+        thread.start()
+        profiler = haplib.Profiler(output_dir=self.__dir, sampling=True,
+                                   sampling_interval_sec=0.001)
+        profiler.start()
+        time.sleep(0.05)
+        path = profiler.stop()
+        stop_event.set()
+        thread.join()
+        self.assertTrue(path.endswith(".stacks"))
+        with open(path) as f:
+            lines = f.readlines()
+        waiter_lines = [line for line in lines if line.startswith("waiter;")]
+        self.assertTrue(len(waiter_lines) > 0)
+        stack, count = waiter_lines[0].rsplit(" ", 1)
+        self.assertTrue(int(count) > 0)
+
+    def test_signal_handlers(self):
+        profiler = haplib.Profiler(output_dir=self.__dir)
+        old_handlers = (signal.getsignal(signal.SIGUSR1),
+                        signal.getsignal(signal.SIGUSR2))
+        try:
+            profiler.install_signal_handlers()
+            os.kill(os.getpid(), signal.SIGUSR1)
+            self.assertTrue(profiler.is_running())
+            os.kill(os.getpid(), signal.SIGUSR2)
+            self.assertFalse(profiler.is_running())
+        finally:
+            signal.signal(signal.SIGUSR1, old_handlers[0])
+            signal.signal(signal.SIGUSR2, old_handlers[1])
+        self.assertEquals(1, len(os.listdir(self.__dir)))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+  Copyright (C) 2015 Project Hatohol
+
+  This file is part of Hatohol.
+
+  Hatohol is free software: you can redistribute it and/or modify
+  it under the terms of the GNU Lesser General Public License, version 3
+  as published by the Free Software Foundation.
+
+  Hatohol is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+  GNU Lesser General Public License for more details.
+
+  You should have received a copy of the GNU Lesser General Public
+  License along with Hatohol. If not, see
+  <http://www.gnu.org/licenses/>.
+"""
+import unittest
+import haptime
+
+NSEC = 1427891696500000000
+TIME_STR = "20150401123456.500000000"
+
+
+class Haptime(unittest.TestCase):
+    def test_format_time(self):
+        self.assertEquals(TIME_STR, haptime.format_time(NSEC))
+        self.assertEquals("19700101000000.000000001", haptime.format_time(1))
+
+    def test_format_time_cached(self):
+        self.assertEquals(haptime.format_time(NSEC),
+                          haptime.format_time(NSEC))
+        self.assertEquals("20150401123456.000000007",
+                          haptime.format_time(NSEC - 500000000 + 7))
+
+    def test_parse_time(self):
+        self.assertEquals(NSEC, haptime.parse_time(TIME_STR))
+        self.assertEquals(NSEC, haptime.parse_time("20150401123456.5"))
+        self.assertEquals(NSEC - 500000000,
+                          haptime.parse_time("20150401123456"))
+
+    def test_parse_time_across_days(self):
+        self.assertEquals(NSEC - 500000000 + 86400 * 10 ** 9,
+                          haptime.parse_time("20150402123456"))
+        self.assertEquals(1425168000 * 10 ** 9,
+                          haptime.parse_time("20150301000000"))
+
+    def test_format_times(self):
+        self.assertEquals([], haptime.format_times([], use_numpy=False))
+        self.assertEquals([TIME_STR, "20150401123556.500000000"],
+                          haptime.format_times([NSEC, NSEC + 60 * 10 ** 9],
+                                               use_numpy=False))
+
+    def test_parse_times(self):
+        self.assertEquals([NSEC, NSEC - 500000000],
+                          haptime.parse_times([TIME_STR, "20150401123456"],
+                                              use_numpy=False))
+
+
+@unittest.skipIf(haptime.numpy is None, "NumPy is not available")
+class Haptime_numpy(unittest.TestCase):
+    def test_format_times(self):
+        nsecs = [NSEC + i * 1234567891 for i in range(100)]
+        self.assertEquals(haptime.format_times(nsecs, use_numpy=False),
+                          haptime.format_times(nsecs, use_numpy=True))
+        self.assertEquals([], haptime.format_times([], use_numpy=True))
+
+    def test_parse_times(self):
+        time_strs = [TIME_STR, "20150401123456", "20150401123456.5",
+                     u"20151231235959.999999999"]
+        self.assertEquals(haptime.parse_times(time_strs, use_numpy=False),
+                          haptime.parse_times(time_strs, use_numpy=True))
+        self.assertEquals([], haptime.parse_times([], use_numpy=True))
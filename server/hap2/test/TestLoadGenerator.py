@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+"""
+  Copyright (C) 2015 Project Hatohol
+
+  This file is part of Hatohol.
+
+  Hatohol is free software: you can redistribute it and/or modify
+  it under the terms of the GNU Lesser General Public License, version 3
+  as published by the Free Software Foundation.
+
+  Hatohol is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+  GNU Lesser General Public License for more details.
+
+  You should have received a copy of the GNU Lesser General Public
+  License along with Hatohol. If not, see
+  <http://www.gnu.org/licenses/>.
+"""
+import unittest
+import json
+import haplib
+import loadgenerator
+
+
+class SenderRecorder:
+    def __init__(self):
+        self.requests = []
+        self.responses = []
+        self.errors = []
+
+    def request(self, procedure_name, params, request_id):
+        self.requests.append((procedure_name, params))
+
+    def response(self, result, response_id):
+        self.responses.append((result, response_id))
+
+    def error(self, error_code, response_id):
+        self.errors.append((error_code, response_id))
+
+
+class TestLoadGenerator_time(unittest.TestCase):
+    def test_format_time(self):
+        self.assertEquals("20150401123456.500000000",
+                          loadgenerator.format_time(1427891696.5))
+
+    def test_parse_time(self):
+        self.assertEquals(1427891696.5,
+                          loadgenerator.parse_time("20150401123456.5"))
+        self.assertEquals(1427891696,
+                          loadgenerator.parse_time("20150401123456"))
+
+
+class SimulatedMonitoringServer(unittest.TestCase):
+    def setUp(self):
+        self.__server = loadgenerator.SimulatedMonitoringServer(
+            10, num_hosts=3, num_items_per_host=4, num_triggers_per_host=2,
+            seed=1)
+
+    def test_get_hosts(self):
+        hosts = self.__server.get_hosts()
+        self.assertEquals(["1", "2", "3"], [h["hostId"] for h in hosts])
+        self.assertEquals("server10-host1", hosts[0]["hostName"])
+
+    def test_get_items(self):
+        self.assertEquals(12, len(self.__server.get_items()))
+        items = self.__server.get_items(["2"])
+        self.assertEquals(4, len(items))
+        self.assertEquals(set(["2"]), set([i["hostId"] for i in items]))
+
+    def test_get_triggers(self):
+        self.assertEquals(6, len(self.__server.get_triggers()))
+        self.assertEquals(2, len(self.__server.get_triggers(["3"])))
+
+    def test_get_history(self):
+        histories = self.__server.get_history("1-1", "20150401000000",
+                                              "20150401001000")
+        self.assertEquals(11, len(histories))
+        self.assertEquals("20150401000000.000000000", histories[0]["time"])
+
+    def test_churn_triggers(self):
+        triggers, events = self.__server.churn_triggers(5)
+        self.assertEquals(5, len(triggers))
+        self.assertEquals(["1", "2", "3", "4", "5"],
+                          [e["eventId"] for e in events])
+        for trigger, event in zip(triggers, events):
+            self.assertEquals(trigger["triggerId"], event["triggerId"])
+            self.assertEquals(trigger["status"], event["status"])
+
+    def test_get_events(self):
+        self.__server.churn_triggers(5)
+        asc = self.__server.get_events("2", 2, "ASC")
+        self.assertEquals(["3", "4"], [e["eventId"] for e in asc])
+        desc = self.__server.get_events("4", 10, "DESC")
+        self.assertEquals(["3", "2", "1"], [e["eventId"] for e in desc])
+        latest = self.__server.get_events("", 2, "DESC")
+        self.assertEquals(["5", "4"], [e["eventId"] for e in latest])
+
+
+class RequestHandler(unittest.TestCase):
+    def setUp(self):
+        server = loadgenerator.SimulatedMonitoringServer(
+            1, num_hosts=5, num_items_per_host=2, num_triggers_per_host=1)
+        server.churn_triggers(3)
+        self.__sender = SenderRecorder()
+        self.__handler = loadgenerator.RequestHandler(server, self.__sender,
+                                                      max_fetch_workers=2)
+
+    def __request(self, method, params, request_id=1):
+        self.__handler(None, json.dumps({"jsonrpc": "2.0", "method": method,
+                                         "params": params,
+                                         "id": request_id}))
+
+    def test_fetch_items(self):
+        self.__request("fetchItems", {"hostIds": ["1", "2"], "fetchId": "5"})
+        self.assertEquals([("SUCCESS", 1)], self.__sender.responses)
+        self.assertEquals(["putItems"],
+                          [req[0] for req in self.__sender.requests])
+        params = self.__sender.requests[0][1]
+        self.assertEquals("5", params["fetchId"])
+        self.assertEquals(4, len(params["items"]))
+
+    def test_fetch_triggers(self):
+        self.__request("fetchTriggers", {"fetchId": "6"})
+        procedure, params = self.__sender.requests[0]
+        self.assertEquals("putTriggers", procedure)
+        self.assertEquals(5, len(params["triggers"]))
+        self.assertEquals("ALL", params["updateType"])
+
+    def test_fetch_events(self):
+        self.__request("fetchEvents", {"lastInfo": "1", "count": 10,
+                                       "direction": "ASC", "fetchId": "7"})
+        procedure, params = self.__sender.requests[0]
+        self.assertEquals("putEvents", procedure)
+        self.assertEquals(["2", "3"],
+                          [e["eventId"] for e in params["events"]])
+        self.assertFalse(params["mayMoreFlag"])
+
+    def test_fetch_events_returns_requested_page(self):
+        self.__request("fetchEvents", {"lastInfo": "1", "count": 10,
+                                       "direction": "ASC", "fetchId": "7"})
+        self.__request("fetchEvents", {"lastInfo": "", "count": 10,
+                                       "direction": "DESC", "fetchId": "8"})
+        procedure, params = self.__sender.requests[1]
+        self.assertEquals(["3", "2", "1"],
+                          [e["eventId"] for e in params["events"]])
+        self.assertEquals("8", params["fetchId"])
+
+    def test_fetch_history(self):
+        self.__request("fetchHistory", {"hostId": "1", "itemId": "1-1",
+                                        "beginTime": "20150401000000",
+                                        "endTime": "20150401000100",
+                                        "fetchId": "8"})
+        procedure, params = self.__sender.requests[0]
+        self.assertEquals("putHistory", procedure)
+        self.assertEquals("1-1", params["itemId"])
+        self.assertEquals(2, len(params["histories"]))
+
+    def test_fetch_history_with_max_points(self):
+        self.__request("fetchHistory", {"hostId": "1", "itemId": "1-1",
+                                        "beginTime": "20150401000000",
+                                        "endTime": "20150401010000",
+                                        "fetchId": "8", "maxPoints": 10})
+        procedure, params = self.__sender.requests[0]
+        self.assertEquals(10, len(params["histories"]))
+
+    def test_invalid_params(self):
+        self.__request("fetchEvents", {"fetchId": "9"}, request_id=3)
+        self.assertEquals([(haplib.ERR_CODE_INVALID_PARAMS, 3)],
+                          self.__sender.errors)
+
+    def test_unknown_method(self):
+        self.__request("fetchFoo", {}, request_id=4)
+        self.assertEquals([(haplib.ERR_CODE_METHOD_NOT_FOUND, 4)],
+                          self.__sender.errors)
+
+    def test_parse_error(self):
+        self.__handler(None, "{")
+        self.assertEquals([(haplib.ERR_CODE_PARSER_ERROR, None)],
+                          self.__sender.errors)
+
+    def test_ignore_response(self):
+        self.__handler(None, json.dumps({"jsonrpc": "2.0",
+                                         "result": "SUCCESS", "id": 1}))
+        self.assertEquals([], self.__sender.requests)
+        self.assertEquals([], self.__sender.errors)
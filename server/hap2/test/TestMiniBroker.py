@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+"""
+  Copyright (C) 2015 Project Hatohol
+
+  This file is part of Hatohol.
+
+  Hatohol is free software: you can redistribute it and/or modify
+  it under the terms of the GNU Lesser General Public License, version 3
+  as published by the Free Software Foundation.
+
+  Hatohol is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+  GNU Lesser General Public License for more details.
+
+  You should have received a copy of the GNU Lesser General Public
+  License along with Hatohol. If not, see
+  <http://www.gnu.org/licenses/>.
+"""
+import unittest
+import pika
+import haplib
+import transporter
+from minibroker import MiniBroker
+from rabbitmqconnector import RabbitMQConnector
+
+
+class TestMiniBroker(unittest.TestCase):
+    def setUp(self):
+        self.__broker = MiniBroker()
+        self.__broker.start()
+        self.__connections = []
+
+    def tearDown(self):
+        for connection in self.__connections:
+            if connection.is_open:
+                connection.close()
+        self.__broker.shutdown()
+
+    def __open_channel(self, vhost="test"):
+        credentials = pika.credentials.PlainCredentials("test_user",
+                                                        "test_password")
+        param = pika.connection.ConnectionParameters(
+            host="127.0.0.1", port=self.__broker.get_port(),
+            virtual_host=vhost, credentials=credentials)
+        connection = pika.adapters.blocking_connection.BlockingConnection(param)
+        self.__connections.append(connection)
+        return connection.channel()
+
+    def __consume(self, channel, queue_name, num_messages, no_ack=False):
+        received = []
+
+        def callback(ch, method, properties, body):
+            received.append(body)
+            if not no_ack:
+                ch.basic_ack(method.delivery_tag)
+            if len(received) == num_messages:
+                ch.stop_consuming()
+
+        channel.basic_consume(callback, queue=queue_name, no_ack=no_ack)
+        channel.start_consuming()
+        return received
+
+    def test_publish_and_get(self):
+        channel = self.__open_channel()
+        channel.queue_declare(queue="test_queue")
+        channel.basic_publish(exchange="", routing_key="test_queue",
+                              body="FOO")
+        method, properties, body = channel.basic_get("test_queue",
+                                                     no_ack=True)
+        self.assertEquals("FOO", body)
+        method, properties, body = channel.basic_get("test_queue")
+        self.assertIsNone(method)
+
+    def test_queue_declare_returns_counts(self):
+        channel = self.__open_channel()
+        channel.queue_declare(queue="test_queue")
+        channel.basic_publish(exchange="", routing_key="test_queue",
+                              body="FOO")
+        result = channel.queue_declare(queue="test_queue")
+        self.assertEquals(1, result.method.message_count)
+
+    def test_consume(self):
+        channel = self.__open_channel()
+        channel.queue_declare(queue="test_queue")
+        bodies = ["msg%d" % i for i in range(10)]
+        for body in bodies:
+            channel.basic_publish(exchange="", routing_key="test_queue",
+                                  body=body)
+        self.assertEquals(bodies, self.__consume(channel, "test_queue", 10))
+        self.assertEquals(0, self.__broker.get_num_messages("test_queue",
+                                                            "test"))
+
+    def test_large_message(self):
+        channel = self.__open_channel()
+        channel.queue_declare(queue="test_queue")
+        body = "0123456789" * 100000
+        channel.basic_publish(exchange="", routing_key="test_queue",
+                              body=body)
+        self.assertEquals([body], self.__consume(channel, "test_queue", 1))
+
+    def test_properties(self):
+        channel = self.__open_channel()
+        channel.queue_declare(queue="test_queue")
+        properties = pika.BasicProperties(content_type="application/json",
+                                          correlation_id="abc")
+        channel.basic_publish(exchange="", routing_key="test_queue",
+                              body="{}", properties=properties)
+        method, received, body = channel.basic_get("test_queue",
+                                                   no_ack=True)
+        self.assertEquals("application/json", received.content_type)
+        self.assertEquals("abc", received.correlation_id)
+
+    def test_unacked_messages_are_requeued(self):
+        channel = self.__open_channel()
+        channel.queue_declare(queue="test_queue")
+        channel.basic_publish(exchange="", routing_key="test_queue",
+                              body="FOO")
+        method, properties, body = channel.basic_get("test_queue")
+        channel.close()
+        self.assertEquals(1, self.__broker.get_num_messages("test_queue",
+                                                            "test"))
+        channel = self.__open_channel()
+        method, properties, body = channel.basic_get("test_queue")
+        self.assertTrue(method.redelivered)
+
+    def test_qos(self):
+        channel = self.__open_channel()
+        channel.queue_declare(queue="test_queue")
+        for i in range(3):
+            channel.basic_publish(exchange="", routing_key="test_queue",
+                                  body="msg%d" % i)
+        channel.basic_qos(prefetch_count=1)
+        received = []
+
+        def callback(ch, method, properties, body):
+            received.append(body)
+            ch.stop_consuming()
+
+        channel.basic_consume(callback, queue="test_queue")
+        channel.start_consuming()
+        self.assertEquals(["msg0"], received)
+        # No more messages are delivered until msg0 is acked.
+        result = channel.queue_declare(queue="test_queue", passive=True)
+        self.assertEquals(2, result.method.message_count)
+
+    def test_confirm_delivery(self):
+        channel = self.__open_channel()
+        channel.queue_declare(queue="test_queue")
+        channel.confirm_delivery()
+        self.assertTrue(channel.basic_publish(exchange="",
+                                              routing_key="test_queue",
+                                              body="FOO"))
+
+    def test_vhosts_are_separated(self):
+        channel = self.__open_channel()
+        channel.queue_declare(queue="test_queue")
+        channel.basic_publish(exchange="", routing_key="test_queue",
+                              body="FOO")
+        self.assertIsNone(self.__broker.get_num_messages("test_queue", "/"))
+
+    def test_consume_non_existing_queue(self):
+        channel = self.__open_channel()
+        self.assertRaises(pika.exceptions.ChannelClosed,
+                          channel.basic_consume, lambda *args: None,
+                          queue="no_queue")
+
+    def test_queue_delete(self):
+        channel = self.__open_channel()
+        channel.queue_declare(queue="test_queue")
+        channel.queue_delete(queue="test_queue")
+        self.assertIsNone(self.__broker.get_num_messages("test_queue",
+                                                         "test"))
+
+    def test_throughput(self):
+        num_messages = 2000
+        sender = self.__open_channel()
+        sender.queue_declare(queue="test_queue")
+        for i in range(num_messages):
+            sender.basic_publish(exchange="", routing_key="test_queue",
+                                 body="msg%d" % i)
+        receiver = self.__open_channel()
+        received = self.__consume(receiver, "test_queue", num_messages,
+                                  no_ack=True)
+        self.assertEquals(num_messages, len(received))
+
+
+class TestRabbitMQConnectorWithMiniBroker(unittest.TestCase):
+    def setUp(self):
+        self.__broker = MiniBroker()
+        self.__broker.start()
+
+    def tearDown(self):
+        self.__broker.shutdown()
+
+    def __get_transporter_args(self):
+        return {"amqp_broker": "127.0.0.1",
+                "amqp_port": self.__broker.get_port(),
+                "amqp_vhost": "test", "amqp_queue": "test_queue",
+                "amqp_user": "test_user", "amqp_password": "test_password"}
+
+    def test_call_and_receive(self):
+        class Receiver():
+            def __call__(self, channel, msg):
+                self.msg = msg
+                channel.stop_consuming()
+
+        sender = RabbitMQConnector()
+        sender.setup(self.__get_transporter_args())
+        sender.call("CALL TEST")
+
+        conn = RabbitMQConnector()
+        conn.setup(self.__get_transporter_args())
+        receiver = Receiver()
+        conn.set_receiver(receiver)
+        conn.run_receive_loop()
+        self.assertEquals("CALL TEST", receiver.msg)
+
+    def test_call_with_confirm_delivery(self):
+        transporter_args = self.__get_transporter_args()
+        transporter_args["amqp_confirm_delivery"] = True
+        sender = RabbitMQConnector()
+        sender.setup(transporter_args)
+        sender.call("CALL TEST")
+        result = sender._channel.queue_declare(queue="test_queue",
+                                               passive=True)
+        self.assertEquals(1, result.method.message_count)
+
+    def test_hapi_connector_queue_suffix(self):
+        transporter_args = self.__get_transporter_args()
+        transporter_args["direction"] = transporter.DIR_SEND
+        conn = haplib.RabbitMQHapiConnector()
+        conn.setup(transporter_args)
+        conn.reply("REPLY TEST")
+        # A synchronous request makes sure that the above is processed.
+        result = conn._channel.queue_declare(queue="test_queue-S",
+                                             passive=True)
+        self.assertEquals(1, result.method.message_count)
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+"""
+  Copyright (C) 2015 Project Hatohol
+
+  This file is part of Hatohol.
+
+  Hatohol is free software: you can redistribute it and/or modify
+  it under the terms of the GNU Lesser General Public License, version 3
+  as published by the Free Software Foundation.
+
+  Hatohol is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+  GNU Lesser General Public License for more details.
+
+  You should have received a copy of the GNU Lesser General Public
+  License along with Hatohol. If not, see
+  <http://www.gnu.org/licenses/>.
+"""
+import unittest
+import os
+import shutil
+import time
+import tempfile
+import transporter
+import spool
+from spool import Spool, SpoolingTransporter
+
+
+class Spool_(unittest.TestCase):
+    def setUp(self):
+        self.__dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.__dir)
+
+    def __list_segments(self):
+        return sorted([name for name in os.listdir(self.__dir)
+                       if name.endswith(".seg")])
+
+    def __drain(self, sp):
+        msgs = []
+        while True:
+            record = sp.peek()
+            if record is None:
+                return msgs
+            msgs.append(record)
+            sp.confirm()
+
+    def test_append_and_peek(self):
+        sp = Spool(self.__dir)
+        self.assertIsNone(sp.peek())
+        sp.append(spool.KIND_CALL, "FOO")
+        sp.append(spool.KIND_REPLY, u"BAR")
+        self.assertEquals(2, len(sp))
+        self.assertEquals((spool.KIND_CALL, "FOO"), sp.peek())
+        self.assertEquals((spool.KIND_CALL, "FOO"), sp.peek())
+        sp.confirm()
+        self.assertEquals([(spool.KIND_REPLY, "BAR")], self.__drain(sp))
+        self.assertEquals(0, len(sp))
+        sp.close()
+
+    def test_persistence(self):
+        sp = Spool(self.__dir)
+        for i in range(5):
+            sp.append(spool.KIND_CALL, "msg%d" % i)
+        sp.peek()
+        sp.confirm()
+        sp.peek()
+        sp.close()
+
+        # An unconfirmed message is delivered again.
+        sp = Spool(self.__dir)
+        self.assertEquals(4, len(sp))
+        self.assertEquals(["msg%d" % i for i in range(1, 5)],
+                          [msg for kind, msg in self.__drain(sp)])
+        sp.close()
+
+    def test_segments_are_reclaimed(self):
+        sp = Spool(self.__dir, segment_size=64)
+        for i in range(10):
+            sp.append(spool.KIND_CALL, "message%02d" % i)
+        self.assertTrue(len(self.__list_segments()) > 1)
+        self.assertEquals(["message%02d" % i for i in range(10)],
+                          [msg for kind, msg in self.__drain(sp)])
+        self.assertEquals(1, len(self.__list_segments()))
+        sp.close()
+
+        sp = Spool(self.__dir, segment_size=64)
+        self.assertEquals(0, len(sp))
+        sp.append(spool.KIND_CALL, "FOO")
+        self.assertEquals([(spool.KIND_CALL, "FOO")], self.__drain(sp))
+        sp.close()
+
+    def test_large_message(self):
+        sp = Spool(self.__dir, segment_size=64)
+        msg = "0123456789" * 100
+        sp.append(spool.KIND_CALL, "FOO")
+        sp.append(spool.KIND_CALL, msg)
+        self.assertEquals(["FOO", msg],
+                          [msg for kind, msg in self.__drain(sp)])
+        sp.close()
+
+    def test_torn_record(self):
+        sp = Spool(self.__dir)
+        sp.append(spool.KIND_CALL, "FOO")
+        sp.append(spool.KIND_CALL, "BAR")
+        sp.close()
+        path = os.path.join(self.__dir, self.__list_segments()[0])
+        with open(path, "r+b") as f:
+            f.seek(spool.RECORD_HEADER.size * 2 + 4)
+            f.write("X")
+
+        sp = Spool(self.__dir)
+        self.assertEquals(1, len(sp))
+        sp.append(spool.KIND_CALL, "BAZ")
+        self.assertEquals(["FOO", "BAZ"],
+                          [msg for kind, msg in self.__drain(sp)])
+        sp.close()
+
+
+class FlakyTransporter(transporter.Transporter):
+    available = True
+    sent = []
+    num_connects = 0
+    confirm_delivery = None
+
+    def setup(self, transporter_args):
+        FlakyTransporter.num_connects += 1
+        FlakyTransporter.confirm_delivery = \
+            transporter_args.get("amqp_confirm_delivery")
+        if not FlakyTransporter.available:
+            raise Exception("Connection refused")
+
+    def call(self, msg):
+        self.__send(("call", msg))
+
+    def reply(self, msg):
+        self.__send(("reply", msg))
+
+    def __send(self, record):
+        if not FlakyTransporter.available:
+            raise Exception("Connection closed")
+        FlakyTransporter.sent.append(record)
+
+
+class SpoolingTransporter_(unittest.TestCase):
+    def setUp(self):
+        self.__dir = tempfile.mkdtemp()
+        FlakyTransporter.available = True
+        FlakyTransporter.sent = []
+        FlakyTransporter.num_connects = 0
+        FlakyTransporter.confirm_delivery = None
+
+    def tearDown(self):
+        shutil.rmtree(self.__dir)
+
+    def __create(self, drain_thread=True, drain_rate=None,
+                 retry_interval=0.01):
+        return transporter.Factory.create({
+            "class": SpoolingTransporter, "spool_class": FlakyTransporter,
+            "spool_dir": self.__dir, "spool_drain_rate": drain_rate,
+            "spool_retry_interval": retry_interval,
+            "spool_drain_thread": drain_thread})
+
+    def __wait_drained(self, conn):
+        for i in range(500):
+            if conn.get_num_spooled() == 0:
+                return
+            time.sleep(0.01)
+        self.fail("The spool is not drained.")
+
+    def test_send_directly(self):
+        conn = self.__create()
+        conn.call("FOO")
+        conn.reply("BAR")
+        self.assertEquals([("call", "FOO"), ("reply", "BAR")],
+                          FlakyTransporter.sent)
+        self.assertEquals(0, conn.get_num_spooled())
+        self.assertTrue(FlakyTransporter.confirm_delivery)
+        conn.close()
+
+    def test_spool_during_outage(self):
+        conn = self.__create()
+        conn.call("msg0")
+        FlakyTransporter.available = False
+        conn.call("msg1")
+        conn.reply("msg2")
+        self.assertEquals(2, conn.get_num_spooled())
+        FlakyTransporter.available = True
+        conn.call("msg3")
+        self.__wait_drained(conn)
+        self.assertEquals([("call", "msg0"), ("call", "msg1"),
+                           ("reply", "msg2"), ("call", "msg3")],
+                          FlakyTransporter.sent)
+        conn.close()
+
+    def test_send_does_not_reconnect(self):
+        FlakyTransporter.available = False
+        conn = self.__create(drain_thread=False)
+        conn.call("msg0")
+        conn.call("msg1")
+        self.assertEquals(1, FlakyTransporter.num_connects)
+        self.assertEquals(2, conn.get_num_spooled())
+        conn.close()
+
+    def test_drain_after_restart(self):
+        FlakyTransporter.available = False
+        conn = self.__create(drain_thread=False)
+        conn.call("msg0")
+        conn.call("msg1")
+        conn.close()
+
+        FlakyTransporter.available = True
+        conn = self.__create(drain_thread=False)
+        self.assertEquals(2, conn.get_num_spooled())
+        self.assertEquals(1, conn.drain(1))
+        self.assertEquals(1, conn.drain())
+        self.assertEquals([("call", "msg0"), ("call", "msg1")],
+                          FlakyTransporter.sent)
+        conn.close()
+
+    def test_drain_in_background_after_restart(self):
+        FlakyTransporter.available = False
+        conn = self.__create(drain_thread=False)
+        conn.call("msg0")
+        conn.call("msg1")
+        conn.close()
+
+        FlakyTransporter.available = True
+        conn = self.__create()
+        self.__wait_drained(conn)
+        self.assertEquals([("call", "msg0"), ("call", "msg1")],
+                          FlakyTransporter.sent)
+        conn.close()
+
+    def test_drain_rate(self):
+        FlakyTransporter.available = False
+        conn = self.__create(drain_thread=False, drain_rate=100,
+                             retry_interval=0)
+        for i in range(3):
+            conn.call("msg%d" % i)
+        FlakyTransporter.available = True
+        start = time.time()
+        self.assertEquals(3, conn.drain())
+        self.assertTrue(time.time() - start >= 0.019)
+        conn.close()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+  Copyright (C) 2015 Project Hatohol
+
+  This file is part of Hatohol.
+
+  Hatohol is free software: you can redistribute it and/or modify
+  it under the terms of the GNU Lesser General Public License, version 3
+  as published by the Free Software Foundation.
+
+  Hatohol is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+  GNU Lesser General Public License for more details.
+
+  You should have received a copy of the GNU Lesser General Public
+  License along with Hatohol. If not, see
+  <http://www.gnu.org/licenses/>.
+"""
+import unittest
+import os
+import time
+import shutil
+import tempfile
+import trafficrecorder
+
+
+class MessageCollector:
+    def __init__(self):
+        self.msgs = []
+        self.times = []
+
+    def call(self, msg):
+        self.msgs.append(msg)
+        self.times.append(time.time())
+
+
+class TestTrafficRecorder(unittest.TestCase):
+    def setUp(self):
+        self.__dir = tempfile.mkdtemp()
+        self.__path = os.path.join(self.__dir, "traffic.rec")
+
+    def tearDown(self):
+        shutil.rmtree(self.__dir)
+
+    def __record(self, records):
+        recorder = trafficrecorder.Recorder(self.__path)
+        for timestamp, msg in records:
+            recorder.write(msg, timestamp)
+        recorder.close()
+
+    def test_record_and_read(self):
+        records = [(100.5, "foo"), (101.0, ""), (103.25, "bar" * 100)]
+        self.__record(records)
+        self.assertEquals(records,
+                          list(trafficrecorder.read_records(self.__path)))
+
+    def test_record_as_receiver(self):
+        recorder = trafficrecorder.Recorder(self.__path)
+        recorder(None, "foo")
+        recorder(None, u"bar")
+        self.assertEquals(2, recorder.get_num_records())
+        recorder.close()
+        msgs = [msg for timestamp, msg in
+                trafficrecorder.read_records(self.__path)]
+        self.assertEquals(["foo", "bar"], msgs)
+
+    def test_append(self):
+        self.__record([(1.0, "foo")])
+        self.__record([(2.0, "bar")])
+        self.assertEquals([(1.0, "foo"), (2.0, "bar")],
+                          list(trafficrecorder.read_records(self.__path)))
+
+    def test_truncated_record(self):
+        self.__record([(1.0, "foo"), (2.0, "bar")])
+        with open(self.__path, "r+b") as f:
+            f.truncate(os.path.getsize(self.__path) - 1)
+        self.assertEquals([(1.0, "foo")],
+                          list(trafficrecorder.read_records(self.__path)))
+
+    def test_append_after_truncated_record(self):
+        self.__record([(1.0, "foo"), (2.0, "bar")])
+        with open(self.__path, "r+b") as f:
+            f.truncate(os.path.getsize(self.__path) - 1)
+        self.__record([(3.0, "baz")])
+        self.assertEquals([(1.0, "foo"), (3.0, "baz")],
+                          list(trafficrecorder.read_records(self.__path)))
+
+    def test_not_record_file(self):
+        with open(self.__path, "wb") as f:
+            f.write("foo")
+        self.assertRaises(ValueError, trafficrecorder.Recorder, self.__path)
+        self.assertRaises(ValueError, list,
+                          trafficrecorder.read_records(self.__path))
+
+    def test_replay_max_speed(self):
+        self.__record([(1.0, "foo"), (1000.0, "bar")])
+        collector = MessageCollector()
+        replayer = trafficrecorder.Replayer(collector, speed=None)
+        self.assertEquals(2, replayer.replay(self.__path))
+        self.assertEquals(["foo", "bar"], collector.msgs)
+
+    def test_replay_with_speed(self):
+        self.__record([(1.0, "foo"), (1.4, "bar")])
+        collector = MessageCollector()
+        replayer = trafficrecorder.Replayer(collector, speed=2.0)
+        replayer.replay(self.__path)
+        self.assertEquals(["foo", "bar"], collector.msgs)
+        interval = collector.times[1] - collector.times[0]
+        self.assertTrue(0.19 <= interval < 0.4)
+
+    def test_parse_speed(self):
+        self.assertIsNone(trafficrecorder.parse_speed("max"))
+        self.assertEquals(20.0, trafficrecorder.parse_speed("20"))
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+"""
+  Copyright (C) 2015 Project Hatohol
+
+  This file is part of Hatohol.
+
+  Hatohol is free software: you can redistribute it and/or modify
+  it under the terms of the GNU Lesser General Public License, version 3
+  as published by the Free Software Foundation.
+
+  Hatohol is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+  GNU Lesser General Public License for more details.
+
+  You should have received a copy of the GNU Lesser General Public
+  License along with Hatohol. If not, see
+  <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import sys
+import time
+import struct
+import logging
+import argparse
+import transporter
+from rabbitmqconnector import RabbitMQConnector
+
+# A record file consists of MAGIC and records that follow it.
+# Each record is a header (a timestamp in seconds as a double and
+# the length of the message) and the message body.
+MAGIC = "HAPREC1\n"
+RECORD_HEADER = struct.Struct("!dI")
+
+
+class Recorder:
+    """
+    Append messages to a record file with timestamps. An instance can be
+    registered as a receiver of a transporter.
+    """
+    def __init__(self, path):
+        """
+        @param path
+        A path of the record file. If it exists, records are appended to
+        it. A truncated record at the end, which is made by an interrupted
+        recording, is removed first.
+        """
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            self.__file = open(path, "r+b")
+            try:
+                if self.__file.read(len(MAGIC)) != MAGIC:
+                    raise ValueError("Not a record file: %s" % path)
+                end = find_end_of_records(self.__file)
+                self.__file.seek(0, os.SEEK_END)
+                if self.__file.tell() > end:
+                    logging.warning("Remove a truncated record in %s" % path)
+                    self.__file.truncate(end)
+                self.__file.seek(end)
+            except:
+                self.__file.close()
+                raise
+        else:
+            self.__file = open(path, "wb")
+            self.__file.write(MAGIC)
+        self.__num_records = 0
+
+    def __call__(self, channel, msg):
+        self.write(msg)
+
+    def write(self, msg, timestamp=None):
+        """
+        @param msg A message to be recorded.
+        @param timestamp
+        A timestamp of the message. If None, the current time is used.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        if isinstance(msg, unicode):
+            msg = msg.encode("utf-8")
+        self.__file.write(RECORD_HEADER.pack(timestamp, len(msg)))
+        self.__file.write(msg)
+        self.__file.flush()
+        self.__num_records += 1
+
+    def get_num_records(self):
+        """
+        @return The number of records written by this object.
+        """
+        return self.__num_records
+
+    def close(self):
+        self.__file.close()
+
+
+def find_end_of_records(f):
+    """
+    @param f A record file object positioned just after MAGIC.
+    @return The offset next to the last complete record.
+    """
+    size = os.fstat(f.fileno()).st_size
+    offset = f.tell()
+    while True:
+        header = f.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return offset
+        timestamp, length = RECORD_HEADER.unpack(header)
+        end = offset + RECORD_HEADER.size + length
+        if end > size:
+            return offset
+        f.seek(end)
+        offset = end
+
+
+def read_records(path):
+    """
+    Read records one by one. The file is not loaded into memory at once.
+    A truncated record at the end, which is made by an interrupted
+    recording, is ignored.
+    @param path A path of the record file.
+    @return A generator of (timestamp, message).
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a record file: %s" % path)
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if not header:
+                return
+            if len(header) < RECORD_HEADER.size:
+                logging.warning("Truncated record header in %s" % path)
+                return
+            timestamp, length = RECORD_HEADER.unpack(header)
+            msg = f.read(length)
+            if len(msg) < length:
+                logging.warning("Truncated record in %s" % path)
+                return
+            yield timestamp, msg
+
+
+class Replayer:
+    """
+    Send recorded messages through a transporter keeping the intervals of
+    the recording scaled by 'speed'.
+    """
+    def __init__(self, connector, speed=1.0):
+        """
+        @param connector A transporter to send messages.
+        @param speed
+        A factor of the replay speed. 2.0 replays twice as fast as
+        the recording. None or 0 sends messages as fast as possible.
+        """
+        self.__connector = connector
+        self.__speed = speed
+
+    def replay(self, path):
+        """
+        @param path A path of the record file.
+        @return The number of sent messages.
+        """
+        num_sent = 0
+        base_timestamp = None
+        for timestamp, msg in read_records(path):
+            if self.__speed:
+                if base_timestamp is None:
+                    base_timestamp = timestamp
+                    base_time = time.time()
+                send_time = \
+                    base_time + (timestamp - base_timestamp) / self.__speed
+                sleep_time = send_time - time.time()
+                if sleep_time > 0:
+                    time.sleep(sleep_time)
+            self.__connector.call(msg)
+            num_sent += 1
+        return num_sent
+
+
+def parse_speed(arg):
+    if arg == "max":
+        return None
+    speed = float(arg)
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("speed must be positive: %s" % arg)
+    return speed
+
+
+def record(args, transporter_args):
+    """
+    Record messages on the queue until interrupted. Note that the
+    messages are consumed by this command. Record a queue that no one
+    else consumes, or messages are split between the consumers.
+    """
+    transporter_args["direction"] = transporter.DIR_RECV
+    connector = transporter.Factory.create(transporter_args)
+    recorder = Recorder(args.file)
+    connector.set_receiver(recorder)
+    try:
+        connector.run_receive_loop()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        recorder.close()
+    logging.info("Recorded %d messages." % recorder.get_num_records())
+
+
+def replay(args, transporter_args):
+    transporter_args["direction"] = transporter.DIR_SEND
+    connector = transporter.Factory.create(transporter_args)
+    num_sent = Replayer(connector, args.speed).replay(args.file)
+    logging.info("Replayed %d messages." % num_sent)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Record and replay HAPI messages on a queue.")
+    parser.add_argument("--log-level", type=str, default="INFO",
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    subparsers = parser.add_subparsers(dest="command")
+
+    record_parser = subparsers.add_parser("record")
+    record_parser.add_argument("file", type=str)
+    record_parser.set_defaults(func=record)
+
+    replay_parser = subparsers.add_parser("replay")
+    replay_parser.add_argument("file", type=str)
+    replay_parser.add_argument(
+        "--speed", type=parse_speed, default=1.0,
+        help="A replay speed factor or 'max' to send as fast as possible.")
+    replay_parser.set_defaults(func=replay)
+
+    RabbitMQConnector.define_arguments(parser)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=getattr(logging, args.log_level))
+
+    transporter_args = RabbitMQConnector.parse_arguments(args)
+    transporter_args["class"] = RabbitMQConnector
+    args.func(args, transporter_args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])